@@ -0,0 +1,3 @@
+from live.asgi import create_asgi_app
+
+app = create_asgi_app()
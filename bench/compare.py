@@ -0,0 +1,64 @@
+""" Compares two benchmark result files written by `bench.run`:
+
+    python -m bench.compare before.json after.json
+"""
+import json
+import sys
+
+
+def _change(before, after):
+    if not before:
+        return "      n/a"
+    return "%+8.1f%%" % ((after - before) / before * 100)
+
+
+def compare(before, after):
+    """ Prints p50/p90 latency and query count changes for every route and
+    dataset size present in both results.
+
+    Args:
+        before: parsed results of the baseline run
+        after: parsed results of the run to compare
+    """
+    header = "%-22s %9s %10s %10s %9s %10s %10s %9s" % (
+        "route", "concerts", "p50 before", "p50 after", "change",
+        "q before", "q after", "change")
+    for label, results in (("before", before), ("after", after)):
+        meta = results["meta"]
+        print("%s: %s (%s, concurrency %s)" % (
+            label, meta.get("revision"), meta.get("server", "wsgi"),
+            meta.get("concurrency", 1)))
+    print(header)
+    print("-" * len(header))
+    for size in sorted(before["sizes"], key=int):
+        if size not in after["sizes"]:
+            continue
+        before_routes = before["sizes"][size]["routes"]
+        after_routes = after["sizes"][size]["routes"]
+        for route, b in before_routes.items():
+            a = after_routes.get(route)
+            if a is None:
+                continue
+            print("%-22s %9s %10.2f %10.2f %9s %10.1f %10.1f %9s" % (
+                route, size,
+                b["latency_ms"]["p50"], a["latency_ms"]["p50"],
+                _change(b["latency_ms"]["p50"], a["latency_ms"]["p50"]),
+                b["queries_per_request"], a["queries_per_request"],
+                _change(b["queries_per_request"], a["queries_per_request"])))
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 2:
+        print(__doc__, file=sys.stderr)
+        return 1
+    with open(argv[0]) as f:
+        before = json.load(f)
+    with open(argv[1]) as f:
+        after = json.load(f)
+    compare(before, after)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,296 @@
+""" Deterministic synthetic dataset for benchmarking.
+
+The same seed and size always produce the same rows, so two benchmark runs
+against different revisions of the code see identical data.
+"""
+import datetime
+import glob
+import os
+import random
+
+import psycopg2
+import psycopg2.extras
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SQL_DIR = os.path.join(os.path.dirname(BENCH_DIR), "sql")
+
+ARTIST_SHORT_NAME = "rage"
+FIRST_SHOW = datetime.date(1991, 10, 23)
+
+SOURCE_TYPES = ["Audience", "Soundboard", "FM", "Pro-Shot", "Unknown"]
+RECORDING_TYPES = ["FLAC", "MP3", "DVD", "VHS", "Cassette"]
+MEDIA_TYPES = ["setlist", "ticket", "poster_flyer", "live_shot", "tour_itinerary"]
+WORDS = ["bulls", "parade", "killing", "name", "guerrilla", "radio", "sleep",
+         "now", "fire", "testify", "bombtrack", "freedom", "calm", "like",
+         "bomb", "people", "wake", "up", "know", "enemy", "vietnow", "tire",
+         "born", "broken", "man", "ashes", "fall", "down", "rode", "hide"]
+
+
+def _phrase(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def generate(num_concerts, seed=0):
+    """ Generates the rows of a dataset.
+
+    Args:
+        num_concerts: number of concerts to generate. Everything else
+                      (venues, songs, recordings, ...) scales with this.
+        seed: random seed
+
+    Returns:
+        dictionary of table name to (columns, list of rows)
+    """
+    rng = random.Random(seed)
+    data = {}
+
+    data["artists"] = (
+        ["artist_id", "artist_name", "short_name"],
+        [(1, "Rage Against the Machine", ARTIST_SHORT_NAME),
+         (2, "Bruce Springsteen", "bruce")])
+
+    num_countries = 20
+    num_states = 50
+    num_cities = max(10, num_concerts // 4)
+    num_locations = max(10, num_concerts // 3)
+    num_venues = max(10, num_concerts // 2)
+    data["countries"] = (["id", "name"], [
+        (i, "Country %s" % i) for i in range(1, num_countries + 1)])
+    data["states"] = (["id", "name"], [
+        (i, "State %s" % i) for i in range(1, num_states + 1)])
+    data["cities"] = (["id", "name"], [
+        (i, "City %s" % i) for i in range(1, num_cities + 1)])
+    data["locations"] = (
+        ["id", "fk_country_id", "fk_state_id", "fk_cities_id"],
+        [(i,
+          rng.randint(1, num_countries),
+          rng.randint(1, num_states) if rng.random() < 0.5 else None,
+          rng.randint(1, num_cities))
+         for i in range(1, num_locations + 1)])
+    data["venues"] = (["venue_id", "venue_name"], [
+        (i, "The %s %s" % (_phrase(rng, 1).title(), rng.choice(
+            ["Arena", "Theatre", "Club", "Stadium", "Hall"])))
+        for i in range(1, num_venues + 1)])
+
+    num_eras = max(1, num_concerts // 100)
+    data["eras"] = (
+        ["era_id", "artist_id", "era_identifier", "era_tile"],
+        [(i, 1, "era-%s" % i, "tiles/era-%s.png" % i)
+         for i in range(1, num_eras + 1)])
+    num_tours = max(1, num_concerts // 40)
+    data["concert_tours"] = (["id", "name"], [
+        (i, "Tour %s" % i) for i in range(1, num_tours + 1)])
+
+    num_songs = min(400, max(20, num_concerts // 10))
+    songs = []
+    for i in range(1, num_songs + 1):
+        original = None
+        if i > 1 and rng.random() < 0.1:
+            original = num_songs + 1
+        songs.append((
+            i, 1, "Song %s %s" % (i, _phrase(rng, 2).title()),
+            "song-%s" % i, "\n" + _phrase(rng, 200), _phrase(rng, 20), original))
+    # An original by another artist that some songs are covers of
+    songs.append((num_songs + 1, 2, "Ghost of Tom Joad", "ghost-of-tom-joad",
+                  None, None, None))
+    data["songs"] = (
+        ["song_id", "artist_id", "title", "song_url", "lyrics", "notes",
+         "original_song_id"],
+        songs)
+    # Popular songs get played far more often than rare ones
+    song_weights = [1.0 / (rank ** 0.8) for rank in range(1, num_songs + 1)]
+
+    concerts = []
+    concert_setlist = []
+    setlist_ordering = []
+    date = FIRST_SHOW
+    for concert_id in range(1, num_concerts + 1):
+        date += datetime.timedelta(days=rng.choice([1, 1, 2, 3, 7, 30]))
+        era_id = 1 + (concert_id - 1) * num_eras // num_concerts
+        tour_id = 1 + (concert_id - 1) * num_tours // num_concerts
+        concerts.append((
+            concert_id, 1, date,
+            _phrase(rng, 10) if rng.random() < 0.3 else None,
+            "%s-%s" % (date.isoformat(), concert_id),
+            rng.randint(1, num_venues),
+            rng.randint(1, num_locations),
+            tour_id if rng.random() < 0.8 else None,
+            era_id))
+        if rng.random() < 0.85:
+            versions = rng.choice([1, 1, 1, 2, 3])
+            concert_setlist.append((concert_id, versions, rng.random() < 0.7))
+            setlist = []
+            for version in range(1, versions + 1):
+                if not setlist:
+                    length = rng.randint(8, 20)
+                    setlist = rng.choices(
+                        range(1, num_songs + 1), weights=song_weights, k=length)
+                else:
+                    # Later versions are edits of the previous one
+                    setlist = list(setlist)
+                    setlist[rng.randrange(len(setlist))] = rng.randint(1, num_songs)
+                    if rng.random() < 0.5:
+                        setlist.append(rng.randint(1, num_songs))
+                for song_order, song_id in enumerate(setlist, start=1):
+                    setlist_ordering.append((
+                        concert_id, version, song_id, song_order,
+                        _phrase(rng, 3) if rng.random() < 0.05 else None))
+    data["concerts"] = (
+        ["concert_id", "artist_id", "date", "notes", "concert_friendly_url",
+         "venue_id", "location_id", "tour_id", "era_id"],
+        concerts)
+    data["concert_setlist"] = (
+        ["concert_id", "latest_version", "complete"], concert_setlist)
+    data["concert_setlist_ordering"] = (
+        ["concert_id", "version", "song_id", "song_order", "notes"],
+        setlist_ordering)
+
+    data["source_types"] = (["source_type_id", "source_name"], [
+        (i, name) for i, name in enumerate(SOURCE_TYPES, start=1)])
+    data["recording_types"] = (["recording_type_id", "recording_name"], [
+        (i, name) for i, name in enumerate(RECORDING_TYPES, start=1)])
+    recordings = []
+    recording_mapping = []
+    recording_files = []
+    preview_urls = []
+    for concert_id in range(1, num_concerts + 1):
+        for _ in range(rng.choice([0, 0, 1, 1, 2, 3])):
+            recording_id = len(recordings) + 1
+            recordings.append((
+                recording_id,
+                rng.randint(1, len(SOURCE_TYPES)),
+                rng.randint(1, len(RECORDING_TYPES)),
+                "Taper %s" % rng.randint(1, 50),
+                rng.randint(1800, 7200),
+                _phrase(rng, 8),
+                _phrase(rng, 5) if rng.random() < 0.3 else None,
+                rng.random() < 0.6))
+            recording_mapping.append((concert_id, recording_id))
+            for f in range(rng.randint(0, 3)):
+                recording_files.append((
+                    recording_id, "recordings/%s/%s.flac" % (recording_id, f),
+                    rng.random() < 0.8))
+            if rng.random() < 0.3:
+                preview_urls.append((
+                    recording_id, "https://youtu.be/%08d" % recording_id))
+    data["recording"] = (
+        ["recording_id", "source_type", "recording_type", "taper", "length",
+         "lineage", "notes", "complete"],
+        recordings)
+    data["concert_recording_mapping"] = (
+        ["concert_id", "recording_id"], recording_mapping)
+    data["recording_file"] = (
+        ["recording_id", "file_url", "is_public"], recording_files)
+    data["recording_preview_urls"] = (
+        ["recording_id", "preview_url"], preview_urls)
+
+    data["media_types"] = (["media_type_id", "media_type"], [
+        (i, name) for i, name in enumerate(MEDIA_TYPES, start=1)])
+    media = []
+    media_concert = []
+    for concert_id in range(1, num_concerts + 1):
+        for _ in range(rng.choice([0, 0, 0, 1, 2, 5])):
+            media_id = len(media) + 1
+            media.append((media_id, "media/%s.jpg" % media_id))
+            media_concert.append((
+                media_id, concert_id, rng.randint(1, len(MEDIA_TYPES))))
+    data["media"] = (["media_id", "media_url"], media)
+    data["media_concert"] = (
+        ["media_id", "concert_id", "media_type_id"], media_concert)
+
+    updates = []
+    for concert in concerts:
+        if rng.random() < 0.1:
+            updates.append((
+                concert[2] + datetime.timedelta(days=rng.randint(1, 9000)),
+                concert[0],
+                _phrase(rng, 12)))
+    data["updates"] = (["update_date", "concert_id", "blurb"], updates)
+    return data
+
+
+# Tables in the order they need to be loaded in
+LOAD_ORDER = [
+    "artists", "countries", "states", "cities", "locations", "venues",
+    "eras", "concert_tours", "songs", "concerts", "concert_setlist",
+    "concert_setlist_ordering", "source_types", "recording_types",
+    "recording", "concert_recording_mapping", "recording_file",
+    "recording_preview_urls", "media_types", "media", "media_concert",
+    "updates",
+]
+
+# Serial columns whose sequences need to be moved past the loaded ids
+SEQUENCES = {
+    "artists": "artist_id", "countries": "id", "states": "id",
+    "cities": "id", "locations": "id", "venues": "venue_id",
+    "eras": "era_id", "concert_tours": "id", "songs": "song_id",
+    "concerts": "concert_id", "source_types": "source_type_id",
+    "recording_types": "recording_type_id", "recording": "recording_id",
+    "media_types": "media_type_id", "media": "media_id",
+}
+
+
+def load(conn, num_concerts, seed=0):
+    """ Recreates the schema and loads a synthetic dataset. This drops
+    everything in the database!
+
+    Args:
+        conn: psycopg2 connection with rights to create tables
+        num_concerts: number of concerts to generate
+        seed: random seed
+
+    Returns:
+        dictionary of table name to number of rows loaded
+    """
+    data = generate(num_concerts, seed=seed)
+    counts = {}
+    with conn.cursor() as cur:
+        with open(os.path.join(BENCH_DIR, "schema.sql")) as f:
+            cur.execute(f.read())
+        for table in LOAD_ORDER:
+            columns, rows = data[table]
+            counts[table] = len(rows)
+            if not rows:
+                continue
+            psycopg2.extras.execute_values(
+                cur,
+                "insert into %s (%s) values %%s" % (table, ", ".join(columns)),
+                rows,
+                page_size=1000)
+        for table, column in SEQUENCES.items():
+            cur.execute(
+                "select setval(pg_get_serial_sequence(%s, %s), "
+                "(select coalesce(max({0}), 0) + 1 from {1}), false)".format(
+                    column, table),
+                (table, column))
+        # Apply the site's own schema changes on top of the base tables
+        for path in sorted(glob.glob(os.path.join(SQL_DIR, "*.sql"))):
+            with open(path) as f:
+                cur.execute(f.read())
+    conn.commit()
+    refresh(conn)
+    with conn.cursor() as cur:
+        cur.execute("analyze")
+    conn.commit()
+    return counts
+
+
+def refresh(conn):
+    """ Populates all precomputed data, the same way the maintenance
+    commands would.
+
+    Args:
+        conn: psycopg2 connection with write access
+    """
+    from live.models import (
+        concert,
+        search,
+        setlist,
+        similarity)
+    with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+        concert.refresh_song_performance_counts(cur)
+        concert.refresh_concert_rarity(cur)
+        search.refresh_search_documents(cur)
+        similarity.build_signatures(cur)
+        setlist.build_setlist_history(cur)
+    conn.commit()
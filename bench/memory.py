@@ -0,0 +1,101 @@
+""" Memory benchmark for the model objects behind listing pages.
+
+Builds the full-history concert listing (every concert of the artist, as
+an unpaginated listing would) along with the song list, and reports how
+much memory the resulting objects hold on to and the peak while building
+them, as measured by tracemalloc. Usage:
+
+    python -m bench.run --dbname rage_bench --sizes 10000 --iterations 1
+    python -m bench.memory --dbname rage_bench
+
+It reads whatever is in the database, so load a dataset with `bench.run`
+(or `bench.dataset`) first. Run it against two revisions to compare.
+"""
+import argparse
+import gc
+import json
+import os
+import tracemalloc
+
+
+def measure(build):
+    """ Measures the memory used by the result of `build()`.
+
+    Returns:
+        tuple of (result, retained bytes, peak bytes)
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        result = build()
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, current - start, peak - start
+
+
+def run(args):
+    os.environ["PGDBNAME"] = args.dbname
+    from live.app import create_app
+    from live.database import get_dict_cursor
+    from live.models import (
+        artist,
+        concert,
+        song)
+    from bench import dataset
+
+    app = create_app()
+    results = {}
+    with app.app_context():
+        cur = get_dict_cursor()
+        artist_inst = artist.get_artist_from_short_name(
+            cur, dataset.ARTIST_SHORT_NAME)
+        # Build once first, so one off allocations (caches, flyweights
+        # for locations and venues, ...) don't count towards the listing
+        concert.get_listing(cur, artist_inst)
+
+        for name, build in (
+                ("concert_listing",
+                 lambda: concert.get_listing(cur, artist_inst)),
+                ("song_list",
+                 lambda: song.get_all_for_artist(cur, artist_inst))):
+            objects, retained, peak = measure(build)
+            results[name] = {
+                "objects": len(objects),
+                "retained_bytes": retained,
+                "peak_bytes": peak,
+                "bytes_per_object": retained / len(objects) if objects else 0,
+            }
+            del objects
+    return results
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--dbname", required=True,
+                        help="database to read the listing from")
+    parser.add_argument("--output", help="file to write JSON results to")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    print("%-18s %9s %14s %14s %10s" % (
+        "listing", "objects", "retained KiB", "peak KiB", "B/object"))
+    for name, stats in results.items():
+        print("%-18s %9d %14.1f %14.1f %10.1f" % (
+            name, stats["objects"],
+            stats["retained_bytes"] / 1024.0,
+            stats["peak_bytes"] / 1024.0,
+            stats["bytes_per_object"]))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,398 @@
+""" Route level benchmarks.
+
+Loads synthetic datasets of increasing size into a scratch database and
+drives every route through the Flask test client, recording latency
+percentiles, query counts and rows fetched per route. Usage:
+
+    python -m bench.run --dbname rage_bench --sizes 10,100,1000,10000 \\
+        --output results.json
+    python -m bench.compare before.json after.json
+
+Pass `--server asgi` to serve requests through the ASGI app instead of the
+WSGI one, and `--concurrency` to keep several requests in flight. With more
+than one request in flight there's also a "mixed" route, requesting the
+urls of every route in a random order.
+
+The database is dropped and recreated for every size, so never point this
+at a database you care about. Connection settings other than the database
+name come from the usual PG* environment variables, and the role needs
+to be able to create tables.
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+import psycopg2
+import psycopg2.extras
+
+from bench import dataset
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+
+def percentile(values, pct):
+    """ Nearest rank percentile.
+    """
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def sample(rng, values, count):
+    values = list(values)
+    if len(values) <= count:
+        return values
+    return rng.sample(values, count)
+
+
+def route_urls(cur, rng, samples):
+    """ Builds the list of (route name, urls) to benchmark, sampling
+    detail pages deterministically.
+
+    Args:
+        cur: dictionary cursor into the benchmark database
+        rng: random.Random instance
+        samples: how many urls to sample for parameterized routes
+    """
+    artist = dataset.ARTIST_SHORT_NAME
+    cur.execute("select concert_friendly_url from concerts order by concert_id")
+    concert_urls = [r["concert_friendly_url"] for r in cur.fetchall()]
+    cur.execute("select song_url from songs where artist_id = 1 order by song_id")
+    song_urls = [r["song_url"] for r in cur.fetchall()]
+    cur.execute("select era_identifier from eras order by era_id")
+    eras = [r["era_identifier"] for r in cur.fetchall()]
+    cur.execute("""
+        select distinct date_part('year', date)::int as year
+        from concerts order by year""")
+    years = [r["year"] for r in cur.fetchall()]
+    # Runs of three songs that opened a show, so searches find something
+    cur.execute("""
+        select array_agg(s.song_url order by lss.song_order) as song_urls
+        from latest_setlist_songs as lss
+          join songs as s on lss.song_id = s.song_id
+          join concerts as c on lss.concert_id = c.concert_id
+        where c.artist_id = 1 and lss.song_order <= 3
+        group by lss.concert_id
+        having count(*) = 3
+        order by lss.concert_id""")
+    openers = [r["song_urls"] for r in cur.fetchall()]
+    # Concerts whose setlist has been revised, so they have a history
+    cur.execute("""
+        select c.concert_friendly_url
+        from concerts as c
+          join concert_setlist as cs on c.concert_id = cs.concert_id
+        where cs.latest_version > 1
+        order by c.concert_id""")
+    revised_urls = [r["concert_friendly_url"] for r in cur.fetchall()]
+
+    return [
+        ("home", ["/"]),
+        ("update_archive", ["/update-archive"]),
+        ("concert_listing", ["/artists/%s/concerts" % artist]),
+        ("concert_listing_year", [
+            "/artists/%s/concerts?year=%s" % (artist, year)
+            for year in sample(rng, years, samples)]),
+        ("concert_listing_rarity", [
+            "/artists/%s/concerts?sort=rarity" % artist]),
+        ("concert", [
+            "/artists/%s/concerts/%s" % (artist, url)
+            for url in sample(rng, concert_urls, samples)]),
+        ("setlist_history", [
+            "/artists/%s/concerts/%s/history?version=1" % (artist, url)
+            for url in sample(rng, revised_urls, samples)]),
+        ("song_list", ["/artists/%s/songs" % artist]),
+        ("song", [
+            "/artists/%s/songs/%s" % (artist, url)
+            for url in sample(rng, song_urls, samples)]),
+        ("era", [
+            "/eras/%s/eras/%s" % (artist, era)
+            for era in sample(rng, eras, samples)]),
+        ("search", [
+            "/search?q=%s" % query
+            for query in sample(rng, dataset.WORDS, samples)]),
+        ("search_phrase", [
+            "/search?q=%%22%s+%s%%22&page=2" % (first, second)
+            for first, second in sample(
+                rng, list(zip(dataset.WORDS, dataset.WORDS[1:])), samples)]),
+        ("sequence", [
+            "/artists/%s/sequences?song=%s&song=%s" % (artist, first, second)
+            for first, second, _ in sample(rng, openers, samples)]),
+        ("sequence_opening", [
+            "/artists/%s/sequences?%s&opening=1" % (
+                artist, "&".join("song=%s" % url for url in urls))
+            for urls in sample(rng, openers, samples)]),
+        ("artist_not_found", ["/artists/not-an-artist/concerts"]),
+    ]
+
+
+class WsgiDriver:
+    """ Requests urls through the Flask test client, from a pool of
+    threads when running concurrently.
+    """
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def _get(self, url):
+        start = time.perf_counter()
+        response = self.client.get(url)
+        response.get_data()
+        # As a WSGI server would; streamed pages give their connection back
+        # when they're closed
+        response.close()
+        return response.status_code, (time.perf_counter() - start) * 1000
+
+    def run(self, urls, concurrency):
+        """ Requests every url.
+
+        Returns:
+            list of (status code, latency in ms)
+        """
+        if concurrency <= 1:
+            return [self._get(url) for url in urls]
+        with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+            return list(executor.map(self._get, urls))
+
+
+class AsgiDriver:
+    """ Requests urls from the ASGI app (see live/asgi.py) on an event
+    loop, calling the application directly.
+    """
+
+    def __init__(self, app):
+        from live.asgi import create_asgi_app
+        self.app = create_asgi_app(app)
+
+    async def _get(self, url, semaphore):
+        path, _, query_string = url.partition("?")
+        scope = {
+            "type": "http", "method": "GET", "path": path,
+            "query_string": query_string.encode(), "headers": [],
+            "root_path": "",
+        }
+        status = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                status.append(message["status"])
+
+        async with semaphore:
+            start = time.perf_counter()
+            await self.app(scope, receive, send)
+            return status[0], (time.perf_counter() - start) * 1000
+
+    async def _run(self, urls, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*[self._get(url, semaphore) for url in urls])
+
+    def run(self, urls, concurrency):
+        return asyncio.run(self._run(urls, concurrency))
+
+
+def bench_routes(driver, routes, iterations, concurrency=1):
+    """ Requests every url of every route `iterations` times, keeping up
+    to `concurrency` requests in flight.
+
+    Returns:
+        dictionary of route name to stats
+    """
+    from live import instrumentation
+    query_logs = []
+    instrumentation.add_listener(query_logs.append)
+    try:
+        return _bench_routes(driver, routes, iterations, concurrency, query_logs)
+    finally:
+        instrumentation.remove_listener(query_logs.append)
+
+
+def _bench_routes(driver, routes, iterations, concurrency, query_logs):
+    results = {}
+    for name, urls in routes:
+        if not urls:
+            continue
+        del query_logs[:]
+        start = time.perf_counter()
+        responses = driver.run(urls * iterations, concurrency)
+        elapsed = time.perf_counter() - start
+        latencies = [latency for _, latency in responses]
+        results[name] = {
+            "requests": len(latencies),
+            "statuses": sorted(set(status for status, _ in responses)),
+            "latency_ms": {
+                "mean": statistics.mean(latencies),
+                "p50": percentile(latencies, 50),
+                "p90": percentile(latencies, 90),
+                "p99": percentile(latencies, 99),
+                "max": max(latencies),
+            },
+            "requests_per_second": len(latencies) / elapsed,
+            "queries_per_request": (
+                sum(log.count for log in query_logs) / len(latencies)),
+            "rows_per_request": (
+                sum(log.rows for log in query_logs) / len(latencies)),
+        }
+    return results
+
+
+DRIVERS = {"wsgi": WsgiDriver, "asgi": AsgiDriver}
+
+
+def bench_size(args, num_concerts):
+    """ Loads a dataset of the given size and benchmarks every route.
+    """
+    conn = psycopg2.connect(
+            dbname=args.dbname,
+            host="localhost",
+            user=os.environ.get("PGUSER"),
+            password=os.environ.get("PGPASSWORD"),
+            port=os.environ.get("PGPORT"))
+    try:
+        start = time.perf_counter()
+        row_counts = dataset.load(conn, num_concerts, seed=args.seed)
+        load_seconds = time.perf_counter() - start
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            routes = route_urls(cur, random.Random(args.seed), args.samples)
+    finally:
+        conn.close()
+    if args.concurrency > 1:
+        # Every route at once, so routes that have async handlers and the
+        # ones the ASGI app hands to Flask compete for connections
+        mixed = [url for _, urls in routes for url in urls]
+        random.Random(args.seed).shuffle(mixed)
+        routes.append(("mixed", mixed))
+
+    from live import cache
+    from live.app import create_app
+    from live.models import (
+        analytics,
+        artist,
+        concert,
+        dimension,
+        setlist,
+        similarity)
+    # Process level caches would otherwise carry over from the last size
+    analytics.setlist_analytics.clear()
+    artist.registry.clear()
+    concert.year_facets.clear()
+    dimension.dimensions.clear()
+    setlist.setlist_cache.clear()
+    similarity.similar_shows.clear()
+    cache.data_version.clear()
+    app = create_app()
+    # Concert ids are reused by every size, so setlists mustn't be shared
+    # with other runs
+    setlist.setlist_cache.directory = None
+    app.config["SQL_INSTRUMENTATION"] = True
+    # Slow statements are reported in the results, not logged
+    app.config["SLOW_QUERY_MS"] = float("inf")
+    app.config["PAGE_CACHE_ENABLED"] = args.page_cache
+    driver = DRIVERS[args.server](app)
+
+    # Warm up, so one off costs (template compilation, etc) aren't counted
+    bench_routes(driver, routes, 1)
+    return {
+        "rows": row_counts,
+        "load_seconds": load_seconds,
+        "routes": bench_routes(
+            driver, routes, args.iterations, args.concurrency),
+    }
+
+
+def print_report(results):
+    """ Prints a table per route showing how it scales with dataset size.
+    """
+    sizes = sorted(results["sizes"], key=int)
+    routes = []
+    for size in sizes:
+        for route in results["sizes"][size]["routes"]:
+            if route not in routes:
+                routes.append(route)
+    header = "%-22s %10s %10s %10s %10s %10s %10s" % (
+        "route", "concerts", "p50 ms", "p90 ms", "req/s", "queries", "rows")
+    print(header)
+    print("-" * len(header))
+    for route in routes:
+        for size in sizes:
+            stats = results["sizes"][size]["routes"].get(route)
+            if not stats:
+                continue
+            print("%-22s %10s %10.2f %10.2f %10.1f %10.1f %10.1f" % (
+                route, size,
+                stats["latency_ms"]["p50"],
+                stats["latency_ms"]["p90"],
+                stats.get("requests_per_second", 0),
+                stats["queries_per_request"],
+                stats["rows_per_request"]))
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--dbname", required=True,
+                        help="scratch database to load datasets into")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="comma separated list of concert counts")
+    parser.add_argument("--iterations", type=int, default=20,
+                        help="how many times to request each url")
+    parser.add_argument("--samples", type=int, default=10,
+                        help="how many urls to sample for detail routes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--page-cache", action="store_true",
+                        help="leave the page cache enabled")
+    parser.add_argument("--server", choices=sorted(DRIVERS), default="wsgi",
+                        help="serve requests through the WSGI or ASGI app")
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="how many requests to keep in flight")
+    parser.add_argument("--output", help="file to write JSON results to")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # The app reads its connection settings from the environment
+    os.environ["PGDBNAME"] = args.dbname
+    results = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "seed": args.seed,
+            "iterations": args.iterations,
+            "samples": args.samples,
+            "page_cache": args.page_cache,
+            "server": args.server,
+            "concurrency": args.concurrency,
+            "timestamp": time.time(),
+        },
+        "sizes": {},
+    }
+    for size in [int(s) for s in args.sizes.split(",") if s]:
+        print("Benchmarking %s concerts..." % size, file=sys.stderr)
+        results["sizes"][str(size)] = bench_size(args, size)
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+-- Base schema used by the benchmark suite. This mirrors the tables the
+-- site reads from; the production schema comes from the database dump.
+-- Everything here is dropped and recreated, so only point the benchmark
+-- at a scratch database!
+drop schema if exists public cascade;
+create schema public;
+
+do $$
+begin
+    if not exists (select from pg_roles where rolname = 'rage_read_only_rl') then
+        create role rage_read_only_rl;
+    end if;
+end
+$$;
+
+create table artists (
+    artist_id serial primary key,
+    artist_name text not null,
+    short_name text not null unique
+);
+
+create table countries (
+    id serial primary key,
+    name text not null
+);
+
+create table states (
+    id serial primary key,
+    name text not null
+);
+
+create table cities (
+    id serial primary key,
+    name text not null
+);
+
+create table locations (
+    id serial primary key,
+    fk_country_id integer references countries (id),
+    fk_state_id integer references states (id),
+    fk_cities_id integer references cities (id)
+);
+
+create table venues (
+    venue_id serial primary key,
+    venue_name text
+);
+
+create table eras (
+    era_id serial primary key,
+    artist_id integer not null references artists (artist_id),
+    era_identifier text not null,
+    era_tile text
+);
+
+create table concert_tours (
+    id serial primary key,
+    name text not null
+);
+
+create table concerts (
+    concert_id serial primary key,
+    artist_id integer not null references artists (artist_id),
+    date date not null,
+    notes text,
+    concert_friendly_url text not null,
+    venue_id integer references venues (venue_id),
+    location_id integer references locations (id),
+    tour_id integer references concert_tours (id),
+    era_id integer references eras (era_id),
+    unique (artist_id, concert_friendly_url)
+);
+
+create table songs (
+    song_id serial primary key,
+    artist_id integer not null references artists (artist_id),
+    title text not null,
+    song_url text not null,
+    lyrics text,
+    notes text,
+    original_song_id integer references songs (song_id),
+    unique (artist_id, song_url)
+);
+
+create table concert_setlist (
+    concert_id integer not null references concerts (concert_id),
+    latest_version integer not null,
+    complete boolean
+);
+
+create table concert_setlist_ordering (
+    concert_id integer not null references concerts (concert_id),
+    version integer not null,
+    song_id integer not null references songs (song_id),
+    song_order integer not null,
+    notes text
+);
+
+create table source_types (
+    source_type_id serial primary key,
+    source_name text not null
+);
+
+create table recording_types (
+    recording_type_id serial primary key,
+    recording_name text not null
+);
+
+create table recording (
+    recording_id serial primary key,
+    source_type integer not null references source_types (source_type_id),
+    recording_type integer not null references recording_types (recording_type_id),
+    taper text,
+    length integer,
+    lineage text,
+    notes text,
+    complete boolean
+);
+
+create table concert_recording_mapping (
+    concert_id integer not null references concerts (concert_id),
+    recording_id integer not null references recording (recording_id)
+);
+
+create table recording_file (
+    recording_id integer not null references recording (recording_id),
+    file_url text not null,
+    is_public boolean not null default true
+);
+
+create table recording_preview_urls (
+    recording_id integer not null references recording (recording_id),
+    preview_url text not null
+);
+
+create table media_types (
+    media_type_id serial primary key,
+    media_type text not null
+);
+
+create table media (
+    media_id serial primary key,
+    media_url text not null
+);
+
+create table media_concert (
+    media_id integer not null references media (media_id),
+    concert_id integer not null references concerts (concert_id),
+    media_type_id integer references media_types (media_type_id)
+);
+
+create table updates (
+    update_date date not null,
+    concert_id integer not null references concerts (concert_id),
+    blurb text
+);
@@ -0,0 +1,126 @@
+""" Benchmark for the "similar shows" index: recall against exact Jaccard
+similarity, and query latency.
+
+For every concert with a signature it compares the index's top k against
+the true top k, found by computing the exact Jaccard similarity of the
+concert's setlist with every other setlist of the artist. A result counts
+as found if its exact similarity is at least that of the true k-th most
+similar concert, so ties don't count against the index. Usage:
+
+    python -m bench.run --dbname rage_bench --sizes 10000 --iterations 1
+    python -m bench.similarity --dbname rage_bench
+
+It reads whatever is in the database, so load a dataset with `bench.run`
+(or `bench.dataset`) first; loading builds the signatures.
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy
+
+
+def percentile(values, pct):
+    return float(numpy.percentile(values, pct)) if len(values) else 0.0
+
+
+def exact_top(incidence, sizes, row, limit):
+    """ Gets the exact Jaccard similarity of one setlist with every other.
+
+    Returns:
+        tuple of (similarities, similarity of the `limit`-th most similar
+        concert)
+    """
+    intersections = incidence @ incidence[row]
+    similarities = intersections / (sizes + sizes[row] - intersections)
+    similarities[row] = -1
+    top = numpy.sort(similarities)[::-1][:limit]
+    return similarities, (top[-1] if len(top) else 0.0)
+
+
+def run(args):
+    os.environ["PGDBNAME"] = args.dbname
+    from live.app import create_app
+    from live.database import get_dict_cursor
+    from live.models import (
+        artist,
+        concert,
+        similarity)
+    from bench import dataset
+
+    app = create_app()
+    with app.app_context():
+        cur = get_dict_cursor()
+        artist_inst = artist.get_artist_from_short_name(
+            cur, dataset.ARTIST_SHORT_NAME)
+        start = time.perf_counter()
+        index = similarity.load_index(cur, artist_inst.artist_id)
+        load_ms = (time.perf_counter() - start) * 1000
+        concert_ids = index.concert_ids.tolist()
+        song_sets = similarity.get_setlist_song_sets(cur, concert_ids)
+
+    # Setlists as rows of a concert by song matrix, so the exact
+    # similarities of one concert to all others are one product
+    song_ids = sorted(set().union(*song_sets.values())) if song_sets else []
+    columns = {song_id: i for i, song_id in enumerate(song_ids)}
+    incidence = numpy.zeros((len(concert_ids), len(song_ids)), dtype=numpy.float32)
+    for row, concert_id in enumerate(concert_ids):
+        for song_id in song_sets.get(concert_id, ()):
+            incidence[row, columns[song_id]] = 1
+    sizes = incidence.sum(axis=1)
+    rows = {concert_id: row for row, concert_id in enumerate(concert_ids)}
+
+    query_us = []
+    candidates = []
+    recalls = []
+    for concert_id in concert_ids:
+        start = time.perf_counter()
+        similar = index.similar(concert_id, args.k)
+        query_us.append((time.perf_counter() - start) * 1e6)
+        candidates.append(len(index.candidates(concert_id)))
+
+        similarities, kth = exact_top(
+            incidence, sizes, rows[concert_id], args.k)
+        found = sum(
+            1 for similar_id, _ in similar
+            if similarities[rows[similar_id]] >= kth)
+        recalls.append(found / min(args.k, len(concert_ids) - 1 or 1))
+
+    return {
+        "concerts": len(concert_ids),
+        "k": args.k,
+        "bands": similarity.NUM_BANDS,
+        "rows_per_band": similarity.ROWS_PER_BAND,
+        "index_load_ms": load_ms,
+        "recall_at_k": float(numpy.mean(recalls)) if recalls else 0.0,
+        "mean_candidates": float(numpy.mean(candidates)) if candidates else 0.0,
+        "query_us_p50": percentile(query_us, 50),
+        "query_us_p99": percentile(query_us, 99),
+    }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--dbname", required=True,
+                        help="database to read the signatures from")
+    parser.add_argument("--k", type=int, default=5,
+                        help="number of similar shows to compare")
+    parser.add_argument("--output", help="file to write JSON results to")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    for name, value in results.items():
+        print("%-20s %s" % (name, round(value, 4)
+                              if isinstance(value, float) else value))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,37 @@
 """ App module that contains the app factory function.
 This is where the application actually gets created.
 """
+import logging
 import os
+
+import psycopg2
 from flask import (
         Flask,
         render_template)
 
+from live import (
+        cache,
+        fanout,
+        instrumentation)
+from live.commands import register_commands
 from live.database import (
+    get_dict_cursor,
     init_app
 )
+from live.models import (
+        artist,
+        dimension,
+        setlist,
+        similarity)
 from live.views import (
         about,
         artists,
         concerts,
         contact,
         home,
+        search,
         song,
+        status,
         tours_and_eras)
 
 STATIC_URI = "https://ratmlive.sfo2.digitaloceanspaces.com"
@@ -24,10 +40,14 @@ STATIC_URI = "https://ratmlive.sfo2.digitaloceanspaces.com"
 def create_app():
     app = Flask(__name__)
     init_app(app)
+    instrumentation.init_app(app)
+    fanout.init_app(app)
     register_blueprints(app)
     register_error_handlers(app)
     register_config(app)
     register_static(app)
+    register_caches(app)
+    register_commands(app)
     return app
 
 
@@ -39,13 +59,15 @@ def register_blueprints(app):
     app.register_blueprint(concerts.blueprint)
     app.register_blueprint(contact.blueprint)
     app.register_blueprint(home.blueprint)
+    app.register_blueprint(search.blueprint)
     app.register_blueprint(song.blueprint)
+    app.register_blueprint(status.blueprint)
     app.register_blueprint(tours_and_eras.blueprint)
 
 
 def page_not_found(e):
     """ Function to handle 404s."""
-    return render_template("404.html")
+    return render_template("404.html"), 404
 
 
 def register_error_handlers(app):
@@ -59,9 +81,52 @@ def register_config(app):
     """ Registers any configuration key/value pairs.
     """
     app.config["PRIMARY_ARTIST_SHORT_NAME"] = "rage"
+    app.config["CONCERT_LISTING_PAGE_SIZE"] = 250
+    app.config["SEARCH_PAGE_SIZE"] = 20
+    app.config["SIMILAR_SHOWS_LIMIT"] = (
+        similarity.DEFAULT_SIMILAR_SHOWS_LIMIT)
+    app.config["SIMILAR_SHOWS_VERSION_TTL"] = (
+        similarity.DEFAULT_INDEX_VERSION_TTL_SECONDS)
+    app.config["ARTIST_REGISTRY_TTL"] = artist.DEFAULT_REGISTRY_TTL_SECONDS
+    app.config["PAGE_CACHE_ENABLED"] = True
+    app.config["PAGE_CACHE_MAX_ENTRIES"] = cache.DEFAULT_MAX_ENTRIES
+    app.config["PAGE_CACHE_MAX_STREAMED_BYTES"] = (
+        cache.DEFAULT_MAX_STREAMED_BYTES)
+    app.config["DATA_VERSION_TTL"] = cache.DEFAULT_DATA_VERSION_TTL_SECONDS
+    app.config["DIMENSION_VERSION_TTL"] = (
+        dimension.DEFAULT_DIMENSION_VERSION_TTL_SECONDS)
+    app.config["SETLIST_CACHE_MAX_ENTRIES"] = (
+        setlist.DEFAULT_SETLIST_CACHE_MAX_ENTRIES)
+    # Directory shared by every worker on the host, None for memory only
+    app.config["SETLIST_CACHE_DIR"] = (
+        os.environ.get("SETLIST_CACHE_DIR") or None)
+    app.config["SQL_INSTRUMENTATION"] = (
+        os.environ.get("SQL_INSTRUMENTATION", "") == "1")
 
 
 def register_static(app):
     """ Registers any static endpoints.
     """
     app.config["STATIC_URI"] = STATIC_URI
+
+
+def register_caches(app):
+    """ Configures and warms process level caches so the first requests
+    don't pay for loading them.
+    """
+    artist.registry.ttl = app.config["ARTIST_REGISTRY_TTL"]
+    cache.page_cache.max_entries = app.config["PAGE_CACHE_MAX_ENTRIES"]
+    cache.page_cache.max_streamed_bytes = (
+        app.config["PAGE_CACHE_MAX_STREAMED_BYTES"])
+    cache.data_version.ttl = app.config["DATA_VERSION_TTL"]
+    dimension.dimensions.ttl = app.config["DIMENSION_VERSION_TTL"]
+    setlist.setlist_cache.max_entries = app.config["SETLIST_CACHE_MAX_ENTRIES"]
+    similarity.similar_shows.ttl = app.config["SIMILAR_SHOWS_VERSION_TTL"]
+    setlist.setlist_cache.directory = app.config["SETLIST_CACHE_DIR"]
+    with app.app_context():
+        try:
+            artist.registry.refresh(get_dict_cursor())
+            dimension.dimensions.refresh(get_dict_cursor())
+        except psycopg2.Error as e:
+            logging.getLogger(__name__).warning(
+                "Unable to warm caches: %s", e)
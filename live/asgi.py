@@ -0,0 +1,286 @@
+""" ASGI serving mode, as an alternative to the WSGI app.
+
+Requests are handled on an asyncio event loop. The database heavy routes
+are listed in #HANDLERS: their data is fetched by the same functions the
+WSGI views call (ie #concerts.concert_page, which fans out independent
+queries, see `live.fanout`), run in a bounded executor within a request
+context for the page, so they go through the same page cache, loaders and
+instrumentation as the WSGI app. Pages are then rendered from the same
+templates. Every other route (static pages, static files, /status, ...) is
+handed to the Flask app as is.
+
+psycopg2 calls block, so the database side still runs in threads, each of
+which holds a connection from the usual pool while it fetches a page. The
+event loop itself never waits on the database, which is what lets one
+process keep many requests in flight. Pages that are streamed under WSGI
+are streamed here too: they're rendered on the thread that holds the
+connection their rows are read from, and sent a chunk at a time. Routes
+handed to the Flask app each hold a connection too, so they run in an
+executor with only as many threads as `ASGI_DB_CONCURRENCY` leaves
+connections in the pool.
+
+Serve it with any ASGI server, ie `uvicorn asgi:app`.
+"""
+import asyncio
+import collections
+import concurrent.futures
+import time
+
+from flask import render_template
+from werkzeug.exceptions import (
+        HTTPException,
+        NotFound)
+from werkzeug.test import (
+        EnvironBuilder,
+        run_wsgi_app)
+
+from live import instrumentation
+from live.cache import (
+        cache_chunks,
+        cache_key,
+        page_cache)
+from live.templating import template_stream
+from live.views import (
+        concerts,
+        home,
+        song,
+        tours_and_eras)
+
+DEFAULT_ASGI_DB_CONCURRENCY = 8
+
+Handler = collections.namedtuple('Handler', ['page', 'streamed'])
+
+# Endpoints served from the event loop, with the function that gets the
+# template and context of the page (shared with the WSGI view) and whether
+# the page is streamed. Everything else goes to the Flask app.
+HANDLERS = {
+    'home.home': Handler(home.home_page, False),
+    'home.update_achive': Handler(home.update_archive_page, True),
+    'concerts.concerts_get_by_artist':
+        Handler(concerts.concerts_get_by_artist_page, True),
+    'concerts.concerts_get_by_artist_and_concert_friendly_url':
+        Handler(concerts.concert_page, False),
+    'song.song_get_by_artist_name': Handler(song.song_page, True),
+    'song.song_get_all_by_artist_name': Handler(song.songs_page, False),
+    'tours_and_eras.eras': Handler(tours_and_eras.era_page, False),
+}
+
+# A page that's been fetched but not sent yet. Either `body` is set (the
+# page came from the cache), or `template` and `context` are to be
+# rendered; the result is cached under `cache_key` if there is one.
+FetchedPage = collections.namedtuple('FetchedPage', [
+    'status', 'headers', 'body', 'template', 'context', 'cache_key',
+    'query_log'])
+
+
+def _with_content_length(headers, body):
+    return [(k, v) for k, v in headers if k.lower() != 'content-length'] + [
+        ('Content-Length', str(len(body)))]
+
+
+def _encode_headers(headers):
+    return [(k.lower().encode('latin-1'), v.encode('latin-1'))
+            for k, v in headers]
+
+
+class AsgiApp:
+    """ ASGI application serving the site.
+    """
+
+    def __init__(self, app):
+        """
+        Args:
+            app: the Flask app, which provides configuration, templates
+                 and the routes without an async handler
+        """
+        self.app = app
+        db_concurrency = app.config["ASGI_DB_CONCURRENCY"]
+        spare_connections = app.config["DB_POOL_MAX_CONN"] - db_concurrency
+        if spare_connections < 1:
+            raise ValueError(
+                "ASGI_DB_CONCURRENCY (%s) must be below DB_POOL_MAX_CONN (%s)"
+                % (db_concurrency, app.config["DB_POOL_MAX_CONN"]))
+        # Fetching a page holds a connection for as long as it runs (and
+        # for streamed pages, while they're sent)
+        self._db_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=db_concurrency,
+                thread_name_prefix="asgi-db")
+        # Rendering is CPU bound, so it gets its own threads. It only
+        # formats what the handlers fetched, so never needs a connection.
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+                thread_name_prefix="asgi-render")
+        # Requests served by the Flask app each hold a connection from the
+        # same pool, so they get one thread per connection left over
+        self._wsgi_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=spare_connections,
+                thread_name_prefix="asgi-wsgi")
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+        # The site only serves GETs, so there's no body to read
+        await self._handle(scope, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _send(self, send, status, headers, body):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': _encode_headers(_with_content_length(headers, body)),
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def _handle(self, scope, send):
+        path = scope['path']
+        query_string = scope.get('query_string', b'').decode('latin-1')
+        adapter = self.app.url_map.bind('localhost')
+        try:
+            endpoint, view_args = adapter.match(path, method=scope['method'])
+        except HTTPException:
+            endpoint, view_args = None, {}
+        handler = HANDLERS.get(endpoint)
+        loop = asyncio.get_running_loop()
+        if handler is None:
+            await self._send(send, *await loop.run_in_executor(
+                    self._wsgi_executor, self._call_wsgi, scope,
+                    query_string))
+            return
+
+        def send_from_thread(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        started = time.perf_counter()
+        cache_args = getattr(
+                self.app.view_functions[endpoint], 'cache_args', None)
+        page = await loop.run_in_executor(
+                self._db_executor, self._fetch, handler, cache_args, path,
+                query_string, view_args, send_from_thread)
+        if page is None:
+            # Streamed, and so already sent
+            return
+        body = page.body
+        if body is None:
+            body = await loop.run_in_executor(
+                    self._executor, self._render, path, query_string,
+                    page.template, page.context)
+            if page.cache_key is not None and page.status == 200:
+                page_cache.set(
+                        page.cache_key, (page.status, page.headers, body))
+        headers = page.headers
+        if page.query_log is not None:
+            headers = headers + instrumentation.timing_headers(
+                page.query_log, (time.perf_counter() - started) * 1000)
+        await self._send(send, page.status, headers, body)
+
+    def _fetch(self, handler, cache_args, path, query_string, view_args,
+               send):
+        """ Gets a page the same way the Flask view does, within a request
+        context for it. Streamed pages are rendered and sent from here,
+        since they read from the request's connection while rendering;
+        anything else is returned as a #FetchedPage for the event loop to
+        render and send.
+
+        Args:
+            handler: the endpoint's #Handler
+            cache_args: the query arguments the endpoint's pages are
+                        cached by (see #cached_page), None if they aren't
+                        cached
+            send: sends an ASGI message, blocking until it's been sent
+        """
+        started = time.perf_counter()
+        with self.app.test_request_context(path, query_string=query_string):
+            instrumentation.start_request()
+            query_log = instrumentation.get_query_log()
+            key = None
+            if (cache_args is not None
+                    and self.app.config.get("PAGE_CACHE_ENABLED", True)):
+                key = cache_key(cache_args)
+                entry = page_cache.get(key)
+                if entry is not None:
+                    return FetchedPage(*entry, None, None, None, query_log)
+            try:
+                template, context = handler.page(**view_args)
+            except NotFound:
+                return FetchedPage(
+                        404, [], None, "404.html", {}, None, query_log)
+            headers = [('Content-Type', 'text/html; charset=utf-8')]
+            if not handler.streamed:
+                return FetchedPage(
+                        200, headers, None, template, context, key, query_log)
+
+            chunks = template_stream(template, context)
+            if key is not None:
+                chunks = cache_chunks(key, 200, headers, chunks)
+            if query_log is not None:
+                # Like the WSGI app's, these only cover the statements
+                # executed before streaming started
+                headers = headers + instrumentation.timing_headers(
+                    query_log, (time.perf_counter() - started) * 1000)
+            send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': _encode_headers(headers),
+            })
+            for chunk in chunks:
+                if not isinstance(chunk, bytes):
+                    chunk = chunk.encode('utf-8')
+                send({
+                    'type': 'http.response.body',
+                    'body': chunk,
+                    'more_body': True,
+                })
+            send({'type': 'http.response.body', 'body': b''})
+        return None
+
+    def _render(self, path, query_string, template, context):
+        """ Renders a template the same way the Flask views do, with a
+        request context so url_for and friends work.
+        """
+        with self.app.test_request_context(path, query_string=query_string):
+            return render_template(template, **context).encode('utf-8')
+
+    def _call_wsgi(self, scope, query_string):
+        """ Serves a request through the Flask app.
+        """
+        headers = [(k.decode('latin-1'), v.decode('latin-1'))
+                   for k, v in scope.get('headers', [])]
+        environ = EnvironBuilder(
+                path=scope.get('root_path', '') + scope['path'],
+                method=scope['method'],
+                query_string=query_string,
+                headers=headers).get_environ()
+        app_iter, status, response_headers = run_wsgi_app(self.app, environ)
+        try:
+            body = b''.join(app_iter)
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+        return int(status.split(' ', 1)[0]), list(response_headers), body
+
+
+def create_asgi_app(app=None):
+    """ Creates the ASGI application.
+
+    Args:
+        app: optional Flask app to serve, a new one is created by default
+
+    Returns:
+        an #AsgiApp
+    """
+    if app is None:
+        from live.app import create_app
+        app = create_app()
+    app.config.setdefault("ASGI_DB_CONCURRENCY", min(
+        DEFAULT_ASGI_DB_CONCURRENCY, app.config["DB_POOL_MAX_CONN"] - 1))
+    return AsgiApp(app)
@@ -0,0 +1,215 @@
+""" Full page response caching for read only routes.
+
+The site only changes when an update is made, and every update is recorded
+in the updates table. Rendered pages are cached keyed by the route, the
+query arguments and the current data version, so a new update implicitly
+invalidates everything without having to track what changed.
+"""
+import collections
+import datetime
+import functools
+import threading
+import time
+
+from flask import (
+        current_app,
+        request)
+from werkzeug.wsgi import ClosingIterator
+
+from live.database import get_dict_cursor
+from live.models import update
+
+DEFAULT_MAX_ENTRIES = 1024
+# Streamed pages bigger than this aren't cached, so a cache miss doesn't
+# hold the whole page in memory
+DEFAULT_MAX_STREAMED_BYTES = 1024 * 1024
+DEFAULT_DATA_VERSION_TTL_SECONDS = 30
+
+
+class PageCache:
+    """ A size bounded LRU cache of rendered responses.
+    """
+
+    def __init__(
+            self,
+            max_entries=DEFAULT_MAX_ENTRIES,
+            max_streamed_bytes=DEFAULT_MAX_STREAMED_BYTES):
+        """
+        Args:
+            max_entries: how many responses to keep before evicting the least
+                         recently used one.
+            max_streamed_bytes: size above which streamed responses aren't
+                                cached
+        """
+        self.max_entries = max_entries
+        self.max_streamed_bytes = max_streamed_bytes
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class DataVersion:
+    """ Holds on to the current data version for a short while so cache hits
+    don't have to go to the database.
+    """
+
+    def __init__(self, ttl=DEFAULT_DATA_VERSION_TTL_SECONDS):
+        self.ttl = ttl
+        self._version = None
+        self._checked_at = 0
+
+    def get(self, cur=None):
+        """
+        Args:
+            cur: optional cursor to use if the version has to be
+                 fetched, defaults to the request's
+        """
+        if (self._version is None
+                or time.monotonic() - self._checked_at > self.ttl):
+            self._version = update.get_data_version(cur or get_dict_cursor())
+            self._checked_at = time.monotonic()
+        return self._version
+
+    def clear(self):
+        self._version = None
+
+
+page_cache = PageCache()
+data_version = DataVersion()
+
+
+def cache_key(args=()):
+    """ Builds the cache key for the current request. Only the query
+    arguments the view reads are part of the key, so junk arguments can't
+    create entries; they're sorted and empty values dropped so equivalent
+    URLs share an entry. The date is part of the key since some pages (ie
+    upcoming shows) depend on it.
+
+    Args:
+        args: names of the query arguments the view reads
+    """
+    args = tuple(sorted(
+        (k, v) for k, v in request.args.items(multi=True)
+        if v and k in args))
+    view_args = tuple(sorted((request.view_args or {}).items()))
+    return (request.endpoint,
+            view_args,
+            args,
+            data_version.get(),
+            datetime.date.today())
+
+
+def cache_chunks(key, status, headers, chunks):
+    """ Passes the chunks of a streamed body through as bytes, caching the
+    body once every chunk has been consumed. Bodies are only kept up to
+    the cache's `max_streamed_bytes`; once a body grows past that it's
+    dropped and the rest of the stream is passed through as is.
+    """
+    body = []
+    size = 0
+    for chunk in chunks:
+        if not isinstance(chunk, bytes):
+            chunk = chunk.encode('utf-8')
+        if body is not None:
+            size += len(chunk)
+            if size > page_cache.max_streamed_bytes:
+                body = None
+            else:
+                body.append(chunk)
+        yield chunk
+    if body is not None:
+        page_cache.set(key, (status, headers, b''.join(body)))
+
+
+def _cache_stream(key, response):
+    """ Wraps a streamed response so its body is cached once the stream
+    has been sent in its entirety.
+    """
+    chunks = response.response
+    # Closing a generator that never started (ie for HEAD requests) doesn't
+    # run any of it, so the stream it wraps is closed explicitly. This
+    # happens before the response's own close hooks run.
+    response.response = ClosingIterator(
+            cache_chunks(
+                key, response.status_code, list(response.headers), chunks),
+            getattr(chunks, 'close', None))
+    return response
+
+
+def cached_page(view=None, args=()):
+    """ Decorator for read only views that caches the rendered response.
+    Only successful responses are cached. Streamed responses are cached
+    after they have been sent, unless they're too big (see
+    #cache_chunks). Views that read query arguments must list
+    them, ie:
+
+        @cached_page(args=('year', 'sort'))
+        def listing():
+            ...
+
+    Args:
+        view: the view function
+        args: names of the query arguments the view reads, any others are
+              ignored
+    """
+    if view is None:
+        return functools.partial(cached_page, args=tuple(args))
+
+    @functools.wraps(view)
+    def wrapper(*view_args, **kwargs):
+        if not current_app.config.get("PAGE_CACHE_ENABLED", True):
+            return view(*view_args, **kwargs)
+        key = cache_key(args)
+        entry = page_cache.get(key)
+        if entry is not None:
+            status, headers, body = entry
+            return current_app.response_class(
+                    body, status=status, headers=headers)
+        response = current_app.make_response(view(*view_args, **kwargs))
+        if response.status_code != 200:
+            return response
+        if response.is_streamed:
+            return _cache_stream(key, response)
+        page_cache.set(
+            key,
+            (response.status_code,
+             list(response.headers),
+             response.get_data()))
+        return response
+    # The ASGI app looks this up to cache the same pages
+    wrapper.cache_args = tuple(args)
+    return wrapper
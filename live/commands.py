@@ -0,0 +1,134 @@
+""" Maintenance commands, run via `flask <command>`.
+
+Most of these write to the database, so they need to be run as a role
+with write access rather than the read only role the site uses, ie:
+
+    PGUSER=rage flask refresh-song-counts
+"""
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from live import freeze
+from live.database import (
+    get_db,
+    get_dict_cursor
+)
+from live.models import (
+    concert,
+    search,
+    setlist,
+    similarity
+)
+
+
+@click.command('refresh-song-counts')
+@click.option('--artist-id', type=int, default=None,
+              help='Only refresh songs for this artist.')
+@click.option('--concert-id', type=int, default=None,
+              help='Only refresh songs affected by this concert\'s setlist.')
+@with_appcontext
+def refresh_song_counts(artist_id, concert_id):
+    """ Recomputes precomputed song performance counts.
+    """
+    cur = get_dict_cursor()
+    refreshed = concert.refresh_song_performance_counts(
+            cur, artist_id=artist_id, concert_id=concert_id)
+    get_db().commit()
+    click.echo('Refreshed performance counts for %s songs' % (refreshed,))
+
+
+@click.command('refresh-rarity')
+@click.option('--artist-id', type=int, default=None,
+              help='Only refresh concerts for this artist.')
+@click.option('--concert-id', type=int, default=None,
+              help='Only refresh concerts affected by this concert\'s setlist.')
+@click.option('--song-id', 'song_ids', type=int, multiple=True,
+              help='Only refresh concerts that played this song. Can be '
+                   'given more than once.')
+@with_appcontext
+def refresh_rarity(artist_id, concert_id, song_ids):
+    """ Recomputes concert rarity scores. Run after refresh-song-counts.
+    """
+    cur = get_dict_cursor()
+    changed = concert.refresh_concert_rarity(
+            cur,
+            artist_id=artist_id,
+            concert_id=concert_id,
+            song_ids=list(song_ids) or None)
+    get_db().commit()
+    click.echo('Updated rarity scores of %s concerts' % (changed,))
+
+
+@click.command('build-similar-shows')
+@click.option('--artist-id', type=int, default=None,
+              help='Only build signatures for this artist\'s concerts.')
+@click.option('--concert-id', type=int, default=None,
+              help='Only rebuild the signature of this concert.')
+@with_appcontext
+def build_similar_shows(artist_id, concert_id):
+    """ Builds the setlist signatures behind "similar shows".
+    """
+    cur = get_dict_cursor()
+    built = similarity.build_signatures(
+            cur, artist_id=artist_id, concert_id=concert_id)
+    get_db().commit()
+    click.echo('Built signatures for %s concerts' % (built,))
+
+
+@click.command('build-setlist-history')
+@click.option('--artist-id', type=int, default=None,
+              help='Only build history for this artist\'s concerts.')
+@click.option('--concert-id', type=int, default=None,
+              help='Only rebuild the history of this concert.')
+@with_appcontext
+def build_setlist_history(artist_id, concert_id):
+    """ Stores older setlist versions as deltas against the latest one.
+    """
+    cur = get_dict_cursor()
+    built = setlist.build_setlist_history(
+            cur, artist_id=artist_id, concert_id=concert_id)
+    get_db().commit()
+    click.echo('Built setlist history for %s concerts' % (built,))
+
+
+@click.command('refresh-search')
+@click.option('--concert-id', type=int, default=None,
+              help='Only refresh the documents of this concert.')
+@with_appcontext
+def refresh_search(concert_id):
+    """ Rebuilds the full text search documents.
+    """
+    cur = get_dict_cursor()
+    written = search.refresh_search_documents(cur, concert_id=concert_id)
+    get_db().commit()
+    click.echo('Wrote %s search documents' % (written,))
+
+
+@click.command('freeze')
+@click.argument('output_dir', type=click.Path(file_okay=False))
+@click.option('--full', is_flag=True,
+              help='Render every page, even if a previous build exists.')
+@click.option('--workers', type=int, default=None,
+              help='Number of rendering processes, defaults to the cpu count.')
+@with_appcontext
+def freeze_site(output_dir, full, workers):
+    """ Renders the site to static HTML in OUTPUT_DIR. Only needs read
+    access.
+    """
+    with current_app.test_request_context():
+        rendered, failed = freeze.freeze(output_dir, full=full, workers=workers)
+    click.echo('Rendered %s pages, %s failed' % (rendered, len(failed)))
+    for url in failed:
+        click.echo('  %s' % (url,))
+
+
+def register_commands(app):
+    """ Registers all commands with the app's command line interface.
+    """
+    app.cli.add_command(build_setlist_history)
+    app.cli.add_command(build_similar_shows)
+    app.cli.add_command(freeze_site)
+    app.cli.add_command(refresh_rarity)
+    app.cli.add_command(refresh_search)
+    app.cli.add_command(refresh_song_counts)
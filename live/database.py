@@ -1,14 +1,270 @@
 """
 Class intended to create a database connection and add it to
 the request context.
+
+Connections come from a process-wide pool rather than being opened per
+request. The pool is created (and warmed) when the app is initialized and
+re-created lazily if the process forks (ie, gunicorn workers), since
+connections can't be shared across processes. When every connection is
+in use, requests wait for one to be returned rather than failing.
 """
+import collections
+import logging
 import os
+import threading
+import time
 
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras
+import psycopg2.pool
 
 from flask import current_app, g
 
+from live import instrumentation
+
+logger = logging.getLogger(__name__)
+
+# Enough idle connections for a request fanning out (see live.fanout), since
+# the pool closes connections returned while it holds this many idle ones
+DEFAULT_POOL_MIN_CONN = 4
+DEFAULT_POOL_MAX_CONN = 10
+DEFAULT_POOL_TIMEOUT = 10
+DEFAULT_POOL_PING_AFTER = 30
+DEFAULT_STREAM_FETCH_SIZE = 200
+
+
+class ConnectionPool:
+    """ Thread-safe pool of psycopg2 connections that takes care of
+    detecting broken connections and keeps track of some stats so we can
+    size the pool.
+
+    Checking out a connection while `max_conn` of them are in use waits
+    (up to `timeout` seconds) for one to be returned, so short bursts of
+    concurrent requests queue up rather than fail.
+    """
+
+    def __init__(self, min_conn, max_conn, timeout=DEFAULT_POOL_TIMEOUT,
+                 ping_after=DEFAULT_POOL_PING_AFTER, **connect_kwargs):
+        """
+        Args:
+            min_conn: number of connections opened up front and kept around
+            max_conn: maximum number of connections this pool will hand out
+            timeout: default number of seconds #getconn waits for a
+                     connection to be returned when all are in use
+            ping_after: connections that have been idle for longer than
+                        this many seconds are checked with a trivial query
+                        before being handed out
+            connect_kwargs: passed directly to `psycopg2.connect`
+        """
+        self.min_conn = min_conn
+        self.max_conn = max_conn
+        self.timeout = timeout
+        self.ping_after = ping_after
+        self.pid = os.getpid()
+        self._connect_kwargs = connect_kwargs
+        self._cond = threading.Condition()
+        # Idle connections along with when they were returned, most
+        # recently returned last
+        self._idle = collections.deque()
+        self._open = 0
+        self._closed = False
+        self._checkouts = 0
+        self._in_use = 0
+        self._peak_in_use = 0
+        self._waits = 0
+        self._discarded = 0
+        self._exhausted = 0
+        for _ in range(min_conn):
+            self._idle.append((self._connect(), time.monotonic()))
+            self._open += 1
+
+    def _connect(self):
+        return psycopg2.connect(**self._connect_kwargs)
+
+    def _reserve(self, timeout):
+        """ Waits for an idle connection or room to open a new one. Returns
+        the idle connection and when it was returned, or (None, None) if a
+        new connection should be opened.
+        """
+        with self._cond:
+            if self._closed:
+                raise psycopg2.pool.PoolError("connection pool is closed")
+            if not self._idle and self._open >= self.max_conn:
+                if timeout:
+                    self._waits += 1
+                available = self._cond.wait_for(
+                        lambda: self._idle or self._open < self.max_conn,
+                        timeout)
+                if not available:
+                    self._exhausted += 1
+                    raise psycopg2.pool.PoolError(
+                            "connection pool exhausted")
+            if self._idle:
+                return self._idle.pop()
+            self._open += 1
+            return None, None
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._open -= 1
+            self._discarded += 1
+            self._cond.notify()
+
+    def _is_alive(self, conn, idle_since):
+        """ Checks that an idle connection is still usable. Connections the
+        server dropped only show up as closed once they're used, so the
+        ones that have been idle for a while are sent a trivial query.
+        """
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.ping_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("select 1")
+            conn.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def getconn(self, timeout=None):
+        """ Checks out a connection, replacing any that have been closed
+        underneath us (ie, the server restarted or the socket timed out).
+
+        Args:
+            timeout: number of seconds to wait for a connection when all of
+                     them are in use, defaults to the pool's timeout. Pass
+                     0 to fail straight away.
+
+        Raises:
+            psycopg2.pool.PoolError: if no connection became available in
+                                     time
+        """
+        if timeout is None:
+            timeout = self.timeout
+        while True:
+            conn, idle_since = self._reserve(timeout)
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._open -= 1
+                        self._cond.notify()
+                    raise
+                break
+            if self._is_alive(conn, idle_since):
+                break
+            self._discard(conn)
+        with self._cond:
+            self._checkouts += 1
+            self._in_use += 1
+            self._peak_in_use = max(self._peak_in_use, self._in_use)
+        return conn
+
+    def putconn(self, conn):
+        """ Returns a connection to the pool. Any open transaction is rolled
+        back first so the next request starts from a clean slate; if that
+        fails the connection is considered broken and gets thrown away.
+        Connections beyond `min_conn` idle ones are closed.
+        """
+        broken = bool(conn.closed)
+        if not broken:
+            try:
+                status = conn.info.transaction_status
+                if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                    broken = True
+                elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                broken = True
+        with self._cond:
+            self._in_use -= 1
+            keep = (not broken and not self._closed
+                    and len(self._idle) < self.min_conn)
+            if keep:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+                return
+        if broken:
+            self._discard(conn)
+            return
+        conn.close()
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    def closeall(self):
+        """ Closes the idle connections and refuses any further checkouts.
+        Connections in use are closed when they're returned.
+        """
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._open -= len(idle)
+            self._cond.notify_all()
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        """ Returns a dictionary of pool statistics.
+        """
+        with self._cond:
+            return {
+                "pid": self.pid,
+                "min_conn": self.min_conn,
+                "max_conn": self.max_conn,
+                "open": self._open,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "peak_in_use": self._peak_in_use,
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "discarded": self._discarded,
+                "exhausted": self._exhausted,
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """ Gets the process-wide connection pool, creating it if it doesn't
+    exist yet or if it was inherited from a parent process.
+    """
+    global _pool
+    if _pool is not None and _pool.pid == os.getpid():
+        return _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = ConnectionPool(
+                    current_app.config["DB_POOL_MIN_CONN"],
+                    current_app.config["DB_POOL_MAX_CONN"],
+                    timeout=current_app.config["DB_POOL_TIMEOUT"],
+                    ping_after=current_app.config["DB_POOL_PING_AFTER"],
+                    user=os.environ.get("PGUSER"),
+                    password=os.environ.get("PGPASSWORD"),
+                    host="localhost",
+                    dbname=os.environ.get("PGDBNAME"),
+                    port=os.environ.get("PGPORT"))
+    return _pool
+
+
+def get_pool_stats():
+    """ Returns statistics for the current process' pool, or None if the
+    pool hasn't been created yet.
+    """
+    if _pool is None or _pool.pid != os.getpid():
+        return None
+    return _pool.stats()
+
 
 def get_db():
     """ Gets the database connection. Note that this uses environment
@@ -16,35 +272,127 @@ def get_db():
     before launching the app.
     """
     if 'conn' not in g:
-        conn = psycopg2.connect(
-                user=os.environ.get("PGUSER"),
-                password=os.environ.get("PGPASSWORD"),
-                host="localhost",
-                dbname=os.environ.get("PGDBNAME"),
-                port=os.environ.get("PGPORT"))
-        g.conn = conn
+        g.conn = get_pool().getconn()
     return g.conn
 
 def get_dict_cursor():
-    """ Gets a dictionary cursor.
+    """ Gets a dictionary cursor. The cursor class can be swapped out with
+    the `DB_CURSOR_FACTORY` config value, but it must return rows that
+    behave like dictionaries. If SQL instrumentation is enabled, the cursor
+    records its statements into the request's query log.
     """
-    cur = get_db().cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    query_log = instrumentation.get_query_log()
+    if query_log is not None:
+        cur = get_db().cursor(
+                cursor_factory=instrumentation.InstrumentedCursor)
+        cur.query_log = query_log
+        return cur
+    cursor_factory = current_app.config.get(
+        "DB_CURSOR_FACTORY", psycopg2.extras.RealDictCursor)
+    cur = get_db().cursor(cursor_factory=cursor_factory)
     return cur
 
 
+def cursor_for(conn, query_log=None):
+    """ Gets a dictionary cursor on a connection that isn't tied to the
+    request, ie one borrowed from the pool by another thread. The query
+    log is passed in explicitly since such threads have no request
+    context.
+
+    Args:
+        conn: a connection from the pool
+        query_log: optional #QueryLog to record statements into
+    """
+    if query_log is not None:
+        cur = conn.cursor(cursor_factory=instrumentation.InstrumentedCursor)
+        cur.query_log = query_log
+        return cur
+    return conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+
+
+def get_named_dict_cursor(name):
+    """ Gets a server side (named) dictionary cursor. Rows are fetched from
+    the server `STREAM_FETCH_SIZE` at a time while iterating over the
+    cursor, rather than all at once, so memory use stays flat no matter
+    how many rows a query returns. Iterate over the cursor rather than
+    calling `fetchall`.
+
+    Args:
+        name: name of the cursor, must be unique within the request
+    """
+    cursor_factory = psycopg2.extras.RealDictCursor
+    query_log = instrumentation.get_query_log()
+    if query_log is not None:
+        cursor_factory = instrumentation.InstrumentedCursor
+    cur = get_db().cursor(name=name, cursor_factory=cursor_factory)
+    cur.itersize = current_app.config.get(
+        "STREAM_FETCH_SIZE", DEFAULT_STREAM_FETCH_SIZE)
+    if query_log is not None:
+        cur.query_log = query_log
+    return cur
+
+
+def detach_db():
+    """ Detaches the request's connection (if any) from the app context, so
+    that it isn't returned to the pool when the request is torn down. This
+    is used by streamed responses, which outlive the request; the caller
+    must pass the connection to #release_db once it's done with it.
+    """
+    return g.pop('conn', None)
+
+
+def release_db(conn):
+    """ Returns a connection obtained from #detach_db to the pool.
+    """
+    get_pool().putconn(conn)
+
+
 def close_db(e=None):
-    """ Closes a database connection, if present.
+    """ Returns the database connection to the pool, if present.
     """
     conn = g.pop('conn', None)
     if conn is not None:
-        conn.close()
+        get_pool().putconn(conn)
 
 
 def init_app(app):
     """ Initializes the current app with respect to the database.
-    Namely, this registers the `get_db` and `close_db` methods.
+    Namely, this registers the `get_db` and `close_db` methods and warms
+    the connection pool.
+
+    Pool sizes can be configured with the `PGPOOLMIN` and `PGPOOLMAX`
+    environment variables, and how many seconds a request waits for a
+    connection when they're all in use with `PGPOOLTIMEOUT`.
 
     Args:
         app: the instance of the application
     """
+    app.config.setdefault(
+        "DB_POOL_MIN_CONN",
+        int(os.environ.get("PGPOOLMIN", DEFAULT_POOL_MIN_CONN)))
+    app.config.setdefault(
+        "DB_POOL_MAX_CONN",
+        int(os.environ.get("PGPOOLMAX", DEFAULT_POOL_MAX_CONN)))
+    app.config.setdefault(
+        "DB_POOL_TIMEOUT",
+        float(os.environ.get("PGPOOLTIMEOUT", DEFAULT_POOL_TIMEOUT)))
+    app.config.setdefault("DB_POOL_PING_AFTER", DEFAULT_POOL_PING_AFTER)
     app.teardown_appcontext(close_db)
+    warm_pool(app)
+
+
+def warm_pool(app):
+    """ Creates the pool for the current process, which opens the minimum
+    number of connections up front. This is called when the app gets
+    created; if workers are forked afterwards (ie, gunicorn with
+    `preload_app`) call this again from the `post_fork` hook.
+
+    Args:
+        app: the instance of the application
+    """
+    with app.app_context():
+        try:
+            get_pool()
+        except psycopg2.OperationalError as e:
+            # Don't refuse to start, we'll try again on the first request
+            logger.warning("Unable to warm connection pool: %s", e)
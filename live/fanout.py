@@ -0,0 +1,137 @@
+""" Runs independent model calls concurrently, each on its own pooled
+connection.
+
+Model functions all take a cursor as their first argument, so a page that
+needs several unrelated pieces of data can hand them to #fan_out instead
+of running them one after another:
+
+    results = fan_out({
+        'media': (media.get_all_media_for_concert, concert_id),
+        'recordings': (recording.get_all_recordings_for_concert, concert_id),
+    })
+
+The calling thread works through the calls on the request's own
+connection, while up to `FANOUT_CONCURRENCY - 1` threads from a process
+wide executor do the same on connections borrowed from the pool. The
+page then takes roughly as long as its slowest query rather than the sum
+of them. If the pool has no connections to spare, whatever is left is run
+on the request's connection, so this never fails for lack of connections.
+
+Note that each connection has its own snapshot, so calls should not rely
+on seeing exactly the same data as each other (fine for read only pages).
+"""
+import collections
+import concurrent.futures
+import os
+import threading
+
+import psycopg2.pool
+from flask import current_app
+
+from live import instrumentation
+from live.database import (
+        cursor_for,
+        get_dict_cursor,
+        get_pool)
+
+DEFAULT_FANOUT_CONCURRENCY = 3
+DEFAULT_FANOUT_MAX_WORKERS = 8
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """ Gets the process-wide executor, creating it if needed. Like the
+    connection pool, it is re-created after a fork.
+    """
+    global _executor, _executor_pid
+    if _executor is not None and _executor_pid == os.getpid():
+        return _executor
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=current_app.config["FANOUT_MAX_WORKERS"],
+                    thread_name_prefix="fanout")
+            _executor_pid = os.getpid()
+    return _executor
+
+
+def fan_out(calls, concurrency=None):
+    """ Runs independent model calls concurrently and waits for all of
+    them to finish.
+
+    Args:
+        calls: dictionary of name to a tuple of (function, *args). Each
+               function is called as `function(cursor, *args)`.
+        concurrency: maximum number of connections to use at once,
+                     including the request's own. Defaults to the
+                     `FANOUT_CONCURRENCY` config value.
+
+    Returns:
+        dictionary of name to the value returned by the function. If any
+        call raises, the first exception is re-raised once every call
+        has finished.
+    """
+    if concurrency is None:
+        concurrency = current_app.config["FANOUT_CONCURRENCY"]
+    pending = collections.deque(calls.items())
+    results = {}
+    errors = []
+
+    def drain(cur):
+        while True:
+            try:
+                name, (function, *args) = pending.popleft()
+            except IndexError:
+                return
+            try:
+                results[name] = function(cur, *args)
+            except Exception as e:
+                errors.append(e)
+
+    pool = get_pool()
+    query_log = instrumentation.get_query_log()
+
+    def work():
+        if not pending:
+            return
+        try:
+            conn = pool.getconn(timeout=0)
+        except psycopg2.pool.PoolError:
+            # Leave the remaining calls to the request's connection
+            return
+        try:
+            drain(cursor_for(conn, query_log))
+        finally:
+            pool.putconn(conn)
+
+    futures = []
+    extra_workers = min(concurrency, len(pending)) - 1
+    if extra_workers > 0:
+        executor = get_executor()
+        futures = [executor.submit(work) for _ in range(extra_workers)]
+    cur = get_dict_cursor()
+    drain(cur)
+    # Every call has been started by now. Workers still queued behind other
+    # requests' would find nothing left to do, so only wait on the ones
+    # that are running calls.
+    running = [future for future in futures if not future.cancel()]
+    concurrent.futures.wait(running)
+    for future in running:
+        # Only raises if something went wrong outside of the calls
+        future.result()
+    if errors:
+        raise errors[0]
+    return results
+
+
+def init_app(app):
+    """ Sets default configuration.
+
+    Args:
+        app: the instance of the application
+    """
+    app.config.setdefault("FANOUT_CONCURRENCY", DEFAULT_FANOUT_CONCURRENCY)
+    app.config.setdefault("FANOUT_MAX_WORKERS", DEFAULT_FANOUT_MAX_WORKERS)
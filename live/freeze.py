@@ -0,0 +1,355 @@
+""" Renders the site to static HTML files so it can be served without Python
+or Postgres on the request path.
+
+Pages are rendered through the app itself (via the test client), so the
+output is exactly what the live site would serve. Each URL is written to
+`<output>/<path>/index.html`; query arguments (see FROZEN_QUERY_ARGS) are
+added to the file name in a fixed order, so the rarity sort of a year of the
+concert listing is written to
+`<output>/<path>/index-year-<year>-sort-rarity.html` and an older setlist
+version to `<output>/<path>/index-version-<version>.html`. An nginx config
+along the lines of the following serves the result:
+
+    set $page index;
+    if ($arg_year) { set $page $page-year-$arg_year; }
+    if ($arg_sort) { set $page $page-sort-$arg_sort; }
+    if ($arg_version) { set $page $page-version-$arg_version; }
+    location /static/ { alias /path/to/live/static/; }
+    location / {
+        try_files $uri/$page.html =404;
+    }
+
+Builds are incremental: the date of the latest update that was rendered is
+stored in the output directory, and subsequent builds only re-render pages
+that reference concerts with newer updates, along with the listings and
+song pages of their artists, and the concert pages of artists whose
+similar shows were rebuilt since.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import urllib.parse
+
+from flask import url_for
+
+from live.database import get_dict_cursor
+from live.models import (
+        artist,
+        concert,
+        era,
+        similarity,
+        song,
+        update)
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE_NAME = ".freeze-state.json"
+
+# Pages that don't depend on any data
+STATIC_ENDPOINTS = [
+    'about.about',
+    'contact.contact',
+    'home.links',
+    'home.most_wanted',
+]
+
+# Query arguments frozen pages vary by, in the order they're added to file
+# names. Anything else in a url is ignored.
+FROZEN_QUERY_ARGS = ('year', 'sort', 'version')
+
+
+def output_path_for(output_dir, url):
+    """ Gets the file a URL should be written to.
+
+    Args:
+        output_dir: the root directory of the build
+        url: a url path, optionally with a query string
+
+    Returns:
+        path of the file to write
+    """
+    path, _, query = url.partition('?')
+    directory = os.path.join(output_dir, path.strip('/'))
+    args = dict(urllib.parse.parse_qsl(query))
+    file_name = 'index'
+    for key in FROZEN_QUERY_ARGS:
+        if args.get(key):
+            file_name += '-%s-%s' % (key, args[key])
+    return os.path.join(directory, file_name + '.html')
+
+
+def listing_urls(cur, artist_inst):
+    """ Gets the urls of every concert listing of an artist (all of its
+    concerts, each year and each era) in every sort. Listings show each
+    concert's rarity, which changes with any other concert's setlist, so
+    they're rendered together.
+
+    Args:
+        cur: database cursor
+        artist_inst: an instance of an Artist object
+    """
+    short_name = artist_inst.artist_short_name
+    listings = [('concerts.concerts_get_by_artist', {})]
+    for year in sorted(concert.get_years_of_concerts_for_artist(cur, artist_inst)):
+        listings.append(('concerts.concerts_get_by_artist', {'year': year}))
+    for era_inst in era.get_all_for_artist(cur, artist_inst):
+        listings.append((
+            'tours_and_eras.eras',
+            {'era_identifier': era_inst.era_identifier}))
+    urls = []
+    for endpoint, args in listings:
+        for sort in concert.LISTING_SORTS:
+            urls.append(url_for(
+                endpoint,
+                artist_name=short_name,
+                sort=None if sort == concert.LISTING_SORT_DATE else sort,
+                **args))
+    return urls
+
+
+def concert_urls(cur, artist_inst):
+    """ Gets the urls of every concert page of an artist.
+
+    Args:
+        cur: database cursor
+        artist_inst: an instance of an Artist object
+    """
+    return [
+        url_for(
+            'concerts.concerts_get_by_artist_and_concert_friendly_url',
+            artist_name=artist_inst.artist_short_name,
+            concert_friendly_url=concert_friendly_url)
+        for concert_friendly_url in concert.get_all_urls_for_artist(
+            cur, artist_inst)]
+
+
+def song_urls(cur, artist_inst):
+    """ Gets the urls of every song page of an artist. Song pages show how
+    many shows it's been since the song was last played, which changes
+    with every new show, so they're rendered together.
+
+    Args:
+        cur: database cursor
+        artist_inst: an instance of an Artist object
+    """
+    return [
+        url_for(
+            'song.song_get_by_artist_name',
+            artist_name=artist_inst.artist_short_name,
+            song_url=song_inst.song_url)
+        for song_inst in song.get_all_for_artist(cur, artist_inst)]
+
+
+def setlist_history_urls(short_name, page):
+    """ Gets the urls of the setlist history pages of a concert: one for
+    each of its versions, if it has more than one.
+
+    Args:
+        short_name: short name of the concert's artist
+        page: dictionary with the concert's `concert_friendly_url`, latest
+              `setlist_version` and all of its `setlist_versions`
+    """
+    latest_version = page.get('setlist_version')
+    if latest_version is None or latest_version <= 1:
+        return []
+    versions = {latest_version}
+    versions.update(
+        version for version in page.get('setlist_versions') or []
+        if version <= latest_version)
+    return [
+        url_for(
+            'concerts.concert_setlist_history',
+            artist_name=short_name,
+            concert_friendly_url=page.get('concert_friendly_url'),
+            version=None if version == latest_version else version)
+        for version in sorted(versions)]
+
+
+def artist_urls(cur, artist_inst):
+    """ Gets every url for an artist.
+
+    Args:
+        cur: database cursor
+        artist_inst: an instance of an Artist object
+    """
+    short_name = artist_inst.artist_short_name
+    urls = [url_for('song.song_get_all_by_artist_name', artist_name=short_name)]
+    urls.extend(listing_urls(cur, artist_inst))
+    urls.extend(concert_urls(cur, artist_inst))
+    for page in concert.get_setlist_versions_for_artist(cur, artist_inst):
+        urls.extend(setlist_history_urls(short_name, page))
+    urls.extend(song_urls(cur, artist_inst))
+    return urls
+
+
+def all_urls(cur):
+    """ Gets every url the site exposes.
+
+    Args:
+        cur: database cursor
+    """
+    urls = [url_for('home.home'), url_for('home.update_achive')]
+    urls.extend(url_for(endpoint) for endpoint in STATIC_ENDPOINTS)
+    for artist_inst in artist.registry.all(cur):
+        urls.extend(artist_urls(cur, artist_inst))
+    return urls
+
+
+def urls_referencing_concerts(cur, concert_ids):
+    """ Gets the urls of every page that shows information about the given
+    concerts, including every listing and song page of their artists (see
+    #listing_urls and #song_urls).
+
+    Args:
+        cur: database cursor
+        concert_ids: iterable of concert ids
+    """
+    urls = {url_for('home.home'), url_for('home.update_achive')}
+    short_names = set()
+    for page in concert.get_pages_referencing_concerts(cur, concert_ids):
+        short_name = page.get('short_name')
+        short_names.add(short_name)
+        urls.add(url_for(
+            'song.song_get_all_by_artist_name', artist_name=short_name))
+        urls.update(setlist_history_urls(short_name, page))
+        for key in ('concert_friendly_url',
+                    'prev_concert_friendly_url',
+                    'next_concert_friendly_url'):
+            if page.get(key):
+                urls.add(url_for(
+                    'concerts.concerts_get_by_artist_and_concert_friendly_url',
+                    artist_name=short_name,
+                    concert_friendly_url=page.get(key)))
+    for short_name in short_names:
+        artist_inst = artist.registry.get(cur, short_name)
+        if artist_inst is not None:
+            urls.update(listing_urls(cur, artist_inst))
+            urls.update(song_urls(cur, artist_inst))
+    return sorted(urls)
+
+
+# Each worker process renders with its own app instance
+_worker_app = None
+_worker_output_dir = None
+
+
+def _init_worker(output_dir):
+    global _worker_app, _worker_output_dir
+    from live.app import create_app
+    _worker_app = create_app()
+    _worker_app.config["PAGE_CACHE_ENABLED"] = False
+    # Static pages are cheap to serve, so listings aren't paginated
+    _worker_app.config["CONCERT_LISTING_PAGE_SIZE"] = None
+    _worker_output_dir = output_dir
+
+
+def _render(url):
+    """ Renders a single url and writes it to disk.
+
+    Returns:
+        tuple of (url, status code)
+    """
+    response = _worker_app.test_client().get(url)
+    try:
+        if response.status_code == 200:
+            path = output_path_for(_worker_output_dir, url)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(response.get_data())
+    finally:
+        # Streamed pages give their connection back when they're closed
+        response.close()
+    return url, response.status_code
+
+
+def render_urls(output_dir, urls, workers=None):
+    """ Renders urls in a pool of worker processes.
+
+    Args:
+        output_dir: the root directory of the build
+        urls: list of urls to render
+        workers: number of processes to use, defaults to the cpu count
+
+    Returns:
+        list of urls that could not be rendered
+    """
+    failed = []
+    with multiprocessing.Pool(
+            processes=workers,
+            initializer=_init_worker,
+            initargs=(output_dir,)) as pool:
+        for url, status in pool.imap_unordered(_render, urls, chunksize=16):
+            if status != 200:
+                logger.warning("Unable to render %s: %s", url, status)
+                failed.append(url)
+    return failed
+
+
+def _read_state(output_dir):
+    try:
+        with open(os.path.join(output_dir, STATE_FILE_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_state(output_dir, latest_update, similar_shows_versions):
+    state = {
+        "latest_update": latest_update,
+        # JSON only has string keys
+        "similar_shows_versions": {
+            str(artist_id): version
+            for artist_id, version in similar_shows_versions.items()},
+    }
+    with open(os.path.join(output_dir, STATE_FILE_NAME), 'w') as f:
+        json.dump(state, f)
+
+
+def freeze(output_dir, full=False, workers=None):
+    """ Builds the static site. Must be called within an app context.
+
+    Args:
+        output_dir: the root directory of the build
+        full: if true, renders everything even if a previous build exists
+        workers: number of processes to render with
+
+    Returns:
+        tuple of (number of urls rendered, list of urls that failed)
+    """
+    cur = get_dict_cursor()
+    os.makedirs(output_dir, exist_ok=True)
+    state = None if full else _read_state(output_dir)
+    similar_shows_versions = similarity.get_index_versions(cur)
+
+    if state is None:
+        since = None
+        _, latest_update = update.get_concerts_updated_since(cur)
+        urls = all_urls(cur)
+    else:
+        # Updates on the same date as the last build are rendered again,
+        # since we can't tell which of them were already included.
+        since = state.get("latest_update")
+        concert_ids, latest_update = update.get_concerts_updated_since(
+                cur, since)
+        urls = urls_referencing_concerts(cur, concert_ids) if concert_ids else []
+        # Any concert page of an artist whose signatures were rebuilt may
+        # show different similar shows
+        frozen_versions = state.get("similar_shows_versions") or {}
+        rebuilt = {
+            artist_id for artist_id, version in similar_shows_versions.items()
+            if frozen_versions.get(str(artist_id)) != version}
+        if rebuilt:
+            urls = set(urls)
+            for artist_inst in artist.registry.all(cur):
+                if artist_inst.artist_id in rebuilt:
+                    urls.update(concert_urls(cur, artist_inst))
+            urls = sorted(urls)
+
+    failed = []
+    if urls:
+        failed = render_urls(output_dir, urls, workers=workers)
+    if latest_update is not None:
+        since = latest_update.isoformat()
+    _write_state(output_dir, since, similar_shows_versions)
+    return len(urls), failed
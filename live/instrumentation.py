@@ -0,0 +1,243 @@
+""" Per request SQL instrumentation.
+
+When `SQL_INSTRUMENTATION` is enabled, cursors handed out by
+`get_dict_cursor` record every statement they execute into a per request
+#QueryLog. Each response then gets a `Server-Timing` header with the time
+spent in the database, along with `X-Query-Count` and `X-Query-Rows`
+headers. Statements slower than `SLOW_QUERY_MS` are logged to the
+`live.sql.slow` logger, and statements that get repeated more than
+`REPEATED_QUERY_THRESHOLD` times in a request (usually an N+1 pattern) are
+logged to `live.sql.repeated`. Other code (ie, the benchmarks) can get at
+complete query logs with #add_listener.
+"""
+import collections
+import logging
+import re
+import sys
+import threading
+import time
+
+import psycopg2.extras
+from flask import (
+        current_app,
+        g,
+        request)
+
+slow_logger = logging.getLogger('live.sql.slow')
+repeated_logger = logging.getLogger('live.sql.repeated')
+
+DEFAULT_SLOW_QUERY_MS = 100
+DEFAULT_REPEATED_QUERY_THRESHOLD = 5
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_LIST_RE = re.compile(r"\((?:\s*(?:\?|%s)\s*,)+\s*(?:\?|%s)\s*\)")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def fingerprint(query):
+    """ Normalizes a statement so that executions that only differ in their
+    parameters or formatting look the same.
+
+    Args:
+        query: the statement, as passed to execute
+
+    Returns:
+        normalized statement
+    """
+    if isinstance(query, bytes):
+        query = query.decode('utf-8', 'replace')
+    query = _STRING_RE.sub('?', query)
+    query = _NUMBER_RE.sub('?', query)
+    query = _LIST_RE.sub('(...)', query)
+    return _WHITESPACE_RE.sub(' ', query).strip()
+
+
+def _calling_function():
+    """ Finds the model function that issued a statement by walking up the
+    stack. Falls back to the first frame outside of the database layer.
+    """
+    frame = sys._getframe(2)
+    fallback = None
+    while frame is not None:
+        module = frame.f_globals.get('__name__', '')
+        if module.startswith('live.models'):
+            return '%s.%s' % (module, frame.f_code.co_name)
+        if fallback is None and not module.startswith(
+                ('live.instrumentation', 'live.database', 'psycopg2')):
+            fallback = '%s.%s' % (module, frame.f_code.co_name)
+        frame = frame.f_back
+    return fallback
+
+
+QueryRecord = collections.namedtuple(
+    'QueryRecord', ['fingerprint', 'caller', 'duration_ms', 'rows'])
+
+
+class QueryLog:
+    """ Collects the statements executed during a single request. This may
+    be shared by cursors in different threads.
+    """
+
+    def __init__(self, path=None, slow_query_ms=DEFAULT_SLOW_QUERY_MS):
+        self.path = path
+        self.slow_query_ms = slow_query_ms
+        self.records = []
+        self._lock = threading.Lock()
+
+    def record(self, query, duration_ms, rows):
+        record = QueryRecord(
+                fingerprint(query), _calling_function(), duration_ms, rows)
+        with self._lock:
+            self.records.append(record)
+        if duration_ms >= self.slow_query_ms:
+            slow_logger.warning(
+                "%.1fms %s rows=%s %s",
+                duration_ms, record.caller, rows, record.fingerprint)
+
+    @property
+    def count(self):
+        return len(self.records)
+
+    @property
+    def rows(self):
+        return sum(r.rows for r in self.records if r.rows > 0)
+
+    @property
+    def duration_ms(self):
+        return sum(r.duration_ms for r in self.records)
+
+    def repeated(self, threshold):
+        """ Returns (fingerprint, caller, count) for statements executed more
+        than `threshold` times.
+        """
+        counts = collections.Counter(
+            (r.fingerprint, r.caller) for r in self.records)
+        return [(f, c, n) for (f, c), n in counts.items() if n > threshold]
+
+
+class InstrumentedCursor(psycopg2.extras.RealDictCursor):
+    """ RealDictCursor that records each statement into a #QueryLog. The log
+    is assigned after the cursor is created.
+    """
+
+    query_log = None
+
+    def execute(self, query, vars=None):
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            if self.query_log is not None:
+                self.query_log.record(
+                    query,
+                    (time.perf_counter() - start) * 1000,
+                    self.rowcount)
+
+
+def get_query_log():
+    """ Gets the query log for the current request, or None if
+    instrumentation is disabled.
+    """
+    return g.get('query_log')
+
+
+def start_request():
+    if current_app.config.get("SQL_INSTRUMENTATION"):
+        g.query_log = QueryLog(
+            path=request.full_path,
+            slow_query_ms=current_app.config.get(
+                "SLOW_QUERY_MS", DEFAULT_SLOW_QUERY_MS))
+        g.request_started = time.perf_counter()
+
+
+_listeners = []
+
+
+def add_listener(listener):
+    """ Registers a function that gets called with the #QueryLog of every
+    request once it's complete, including any statements executed while
+    streaming the response.
+    """
+    _listeners.append(listener)
+
+
+def remove_listener(listener):
+    _listeners.remove(listener)
+
+
+def report(query_log):
+    """ Reports repeated statements and notifies listeners. Called once a
+    request, and its response, have completed.
+    """
+    threshold = current_app.config.get(
+        "REPEATED_QUERY_THRESHOLD", DEFAULT_REPEATED_QUERY_THRESHOLD)
+    for statement, caller, count in query_log.repeated(threshold):
+        repeated_logger.warning(
+            "%s: executed %s times by %s: %s",
+            query_log.path, count, caller, statement)
+    for listener in _listeners:
+        listener(query_log)
+
+
+def detach_query_log():
+    """ Takes over reporting of the current request's query log, for
+    responses that are streamed after the request is torn down. The caller
+    must pass the log to #report once the response is done.
+    """
+    query_log = get_query_log()
+    g.query_log_detached = True
+    return query_log
+
+
+def timing_headers(query_log, total_ms):
+    """ Builds the timing headers for a response.
+
+    Args:
+        query_log: the request's #QueryLog
+        total_ms: how long the request took overall
+
+    Returns:
+        list of (header name, value) tuples
+    """
+    return [
+        ('Server-Timing', 'db;dur=%.2f;desc="%s queries", total;dur=%.2f' % (
+            query_log.duration_ms, query_log.count, total_ms)),
+        ('X-Query-Count', str(query_log.count)),
+        ('X-Query-Rows', str(query_log.rows)),
+    ]
+
+
+def finish_request(response):
+    """ Adds timing headers to the response. Note that for streamed
+    responses these only include statements executed before streaming
+    started.
+    """
+    query_log = get_query_log()
+    if query_log is None:
+        return response
+    total_ms = (time.perf_counter() - g.request_started) * 1000
+    for name, value in timing_headers(query_log, total_ms):
+        response.headers[name] = value
+    return response
+
+
+def teardown_request(e=None):
+    query_log = get_query_log()
+    if query_log is not None and not g.get('query_log_detached'):
+        report(query_log)
+
+
+def init_app(app):
+    """ Registers the request hooks used for instrumentation.
+
+    Args:
+        app: the instance of the application
+    """
+    app.config.setdefault("SQL_INSTRUMENTATION", False)
+    app.config.setdefault("SLOW_QUERY_MS", DEFAULT_SLOW_QUERY_MS)
+    app.config.setdefault(
+        "REPEATED_QUERY_THRESHOLD", DEFAULT_REPEATED_QUERY_THRESHOLD)
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.teardown_request(teardown_request)
@@ -0,0 +1,131 @@
+""" Request scoped batching and caching of entity lookups, along the lines
+of DataLoader.
+
+Views (and anything they call) ask a #Loader for entities by key instead
+of querying for them one at a time. Keys can be queued up front with
+`queue`; the next `load` fetches every queued key that isn't cached yet
+with a single set based query, and results are kept for the rest of the
+request. For example, the concert page queues its neighbouring concerts
+before looking up similar ones, so both come from a single query:
+
+    concerts = get_loaders().concerts
+    concerts.queue([previous_id, next_id])
+    similar = concerts.load_many(similar_ids)  # one query in total
+
+Model functions that look concerts up take an optional `loaders` argument
+and go through it when given, e.g. #similarity.get_similar_concerts.
+
+Loaders are created on first use in a request and live on `flask.g`, so
+nothing is shared between requests.
+"""
+import threading
+
+from flask import g
+
+from live.database import get_dict_cursor
+from live.models import concert
+
+
+class Loader:
+    """ Batches and caches lookups of a single kind of entity.
+    """
+
+    def __init__(self, cur, batch_fn):
+        """
+        Args:
+            cur: database cursor to query with
+            batch_fn: function taking (cur, list of keys) that returns a
+                      dictionary of key to entity. Keys it leaves out are
+                      None.
+        """
+        self.cur = cur
+        self.batch_fn = batch_fn
+        self._lock = threading.Lock()
+        self._cache = {}
+        self._queued = {}
+        self.batches = 0
+        self.hits = 0
+
+    def queue(self, keys):
+        """ Queues keys to be fetched in the next batch.
+
+        Args:
+            keys: iterable of keys
+        """
+        with self._lock:
+            for key in keys:
+                if key not in self._cache:
+                    self._queued[key] = None
+
+    def prime(self, key, value):
+        """ Adds an entity that was loaded some other way.
+        """
+        with self._lock:
+            self._cache[key] = value
+            self._queued.pop(key, None)
+
+    def load(self, key):
+        """ Gets a single entity, fetching it along with any queued keys if
+        it isn't cached.
+        """
+        return self.load_many([key])[0]
+
+    def load_many(self, keys):
+        """ Gets entities for a list of keys, fetching every uncached (and
+        queued) key in one batch.
+
+        Returns:
+            list of entities, in the same order as keys
+        """
+        keys = list(keys)
+        with self._lock:
+            for key in keys:
+                if key not in self._cache:
+                    self._queued[key] = None
+                else:
+                    self.hits += 1
+            missing = list(self._queued)
+            self._queued = {}
+            if missing:
+                found = self.batch_fn(self.cur, missing)
+                self.batches += 1
+                for key in missing:
+                    self._cache[key] = found.get(key)
+            return [self._cache[key] for key in keys]
+
+    def load_dict(self, keys):
+        """ Like #load_many, but returns a dictionary of key to entity (the
+        shape batch functions return) that leaves out keys with no entity.
+        """
+        keys = list(keys)
+        return {
+            key: value for key, value in zip(keys, self.load_many(keys))
+            if value is not None}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "cached": len(self._cache),
+                "batches": self.batches,
+                "hits": self.hits,
+            }
+
+
+class Loaders:
+    """ The loaders for a single request.
+    """
+
+    def __init__(self, cur):
+        self.concerts = Loader(cur, concert.get_concerts_by_ids)
+
+    def stats(self):
+        return {'concerts': self.concerts.stats()}
+
+
+def get_loaders():
+    """ Gets the loaders for the current request, creating them on first
+    use.
+    """
+    if 'loaders' not in g:
+        g.loaders = Loaders(get_dict_cursor())
+    return g.loaders
@@ -0,0 +1,275 @@
+""" Setlist statistics for every song of an artist, computed with NumPy.
+
+The latest setlist of each of an artist's concerts is loaded into a dense
+concert by song `incidence` matrix, with concerts in date order, that is
+True where the song was played at the concert. Everything is derived from
+it (and from where each song falls in its setlist) with array operations
+rather than by walking concerts: play counts, first and last performances,
+how many shows it has been since a song was last played, how often it
+opened or closed a show, and play counts per year and per era. Only concerts with a
+setlist count as shows. The setlists don't mark encores, so there are no
+encore statistics.
+
+Statistics are computed per artist the first time they're needed and kept
+until the data version changes, see #SetlistAnalytics.
+"""
+import itertools
+import threading
+
+import numpy
+
+
+class SongStats:
+    """ Precomputed performance statistics of a single song.
+    """
+
+    __slots__ = (
+        'song_id',
+        'concert_count',
+        'opener_count',
+        'closer_count',
+        'first_concert_id',
+        'last_concert_id',
+        'shows_since_last_played',
+        'years',
+        'eras')
+
+    def __init__(
+            self,
+            song_id,
+            concert_count=0,
+            opener_count=0,
+            closer_count=0,
+            first_concert_id=None,
+            last_concert_id=None,
+            shows_since_last_played=None,
+            years=(),
+            eras=()):
+        """
+        Args:
+            song_id: the id of the song
+            concert_count: number of concerts the song was played at
+            opener_count: number of concerts it opened
+            closer_count: number of concerts it closed
+            first_concert_id: id of the first concert it was played at, None
+                              if it was never played
+            last_concert_id: id of the latest concert it was played at
+            shows_since_last_played: number of shows since the latest one it
+                                     was played at (0 if it was played at the
+                                     latest show), None if never played
+            years: list of (year, play count) tuples, sorted by year. Years
+                   it wasn't played are left out.
+            eras: list of (era identifier, play count) tuples, sorted by era.
+                  Eras it wasn't played in are left out.
+        """
+        self.song_id = song_id
+        self.concert_count = concert_count
+        self.opener_count = opener_count
+        self.closer_count = closer_count
+        self.first_concert_id = first_concert_id
+        self.last_concert_id = last_concert_id
+        self.shows_since_last_played = shows_since_last_played
+        self.years = years
+        self.eras = eras
+
+
+class ArtistAnalytics:
+    """ The setlist matrix of an artist, along with the statistics of each
+    of their songs.
+    """
+
+    def __init__(self, concerts, song_ids, eras):
+        """
+        Args:
+            concerts: concert rows with concert_id, year, era_id and
+                      song_ids (the setlist, in order) keys, sorted by date
+            song_ids: ids of the artist's songs, so songs that were never
+                      played get (empty) statistics too
+            eras: list of (era id, era identifier) tuples, in era order
+        """
+        num_concerts = len(concerts)
+        self.concert_ids = numpy.array(
+                [row.get('concert_id') for row in concerts],
+                dtype=numpy.int64)
+        setlist_lengths = numpy.array(
+                [len(row.get('song_ids')) for row in concerts],
+                dtype=numpy.int64)
+        num_rows = int(setlist_lengths.sum())
+        # One entry per song played, concert by concert
+        song_col = numpy.fromiter(
+                itertools.chain.from_iterable(
+                    row.get('song_ids') for row in concerts),
+                dtype=numpy.int64,
+                count=num_rows)
+        concert_idx = numpy.repeat(numpy.arange(num_concerts), setlist_lengths)
+        starts = numpy.cumsum(setlist_lengths) - setlist_lengths
+        position_col = numpy.arange(num_rows) - starts[concert_idx] + 1
+
+        self.song_ids = numpy.union1d(
+                song_col, numpy.array(list(song_ids), dtype=numpy.int64))
+        song_idx = numpy.searchsorted(self.song_ids, song_col)
+        num_songs = len(self.song_ids)
+
+        self.incidence = numpy.zeros((num_concerts, num_songs), dtype=bool)
+        self.incidence[concert_idx, song_idx] = True
+
+        concert_counts = self.incidence.sum(axis=0)
+        opener_counts = numpy.bincount(
+                song_idx[position_col == 1], minlength=num_songs)
+        closer_counts = numpy.bincount(
+                song_idx[position_col == setlist_lengths[concert_idx]],
+                minlength=num_songs)
+        played = concert_counts > 0
+        first_idx = last_idx = numpy.zeros(num_songs, dtype=numpy.int64)
+        if num_concerts:
+            first_idx = self.incidence.argmax(axis=0)
+            last_idx = num_concerts - 1 - self.incidence[::-1].argmax(axis=0)
+
+        # Concerts are in date order, so each year is a contiguous block
+        concert_years = numpy.array(
+                [row.get('year') for row in concerts], dtype=numpy.int64)
+        year_starts = numpy.flatnonzero(
+                numpy.diff(concert_years, prepend=-1))
+        self.years = concert_years[year_starts]
+        self.year_counts = numpy.add.reduceat(
+                self.incidence, year_starts, axis=0, dtype=numpy.int32)
+
+        # Eras needn't be contiguous, and some concerts have none
+        era_positions = {era_id: i for i, (era_id, _) in enumerate(eras)}
+        self.era_identifiers = [identifier for _, identifier in eras]
+        concert_eras = numpy.array(
+                [era_positions.get(row.get('era_id'), -1)
+                 for row in concerts],
+                dtype=numpy.int64)
+        has_era = concert_eras >= 0
+        self.era_counts = numpy.zeros(
+                (len(eras), num_songs), dtype=numpy.int32)
+        numpy.add.at(
+                self.era_counts,
+                concert_eras[has_era],
+                self.incidence[has_era].astype(numpy.int32))
+
+        self._song_stats = {}
+        for i, song_id in enumerate(self.song_ids.tolist()):
+            stats = SongStats(song_id)
+            if played[i]:
+                stats.concert_count = int(concert_counts[i])
+                stats.opener_count = int(opener_counts[i])
+                stats.closer_count = int(closer_counts[i])
+                stats.first_concert_id = int(self.concert_ids[first_idx[i]])
+                stats.last_concert_id = int(self.concert_ids[last_idx[i]])
+                stats.shows_since_last_played = int(
+                        num_concerts - 1 - last_idx[i])
+                stats.years = [
+                    (int(self.years[y]), int(self.year_counts[y, i]))
+                    for y in numpy.flatnonzero(self.year_counts[:, i])]
+                stats.eras = [
+                    (self.era_identifiers[e], int(self.era_counts[e, i]))
+                    for e in numpy.flatnonzero(self.era_counts[:, i])]
+            self._song_stats[song_id] = stats
+
+    def song_stats(self, song_id):
+        """ Gets the statistics of a song.
+
+        Returns:
+            SongStats. Songs that aren't the artist's and were never played
+            by them get empty statistics.
+        """
+        stats = self._song_stats.get(song_id)
+        if stats is None:
+            return SongStats(song_id)
+        return stats
+
+    def all_song_stats(self):
+        """ Returns:
+            dictionary of song id to SongStats
+        """
+        return dict(self._song_stats)
+
+
+def load(cur, artist_id):
+    """ Loads an artist's latest setlists and computes their statistics.
+
+    Args:
+        cur: database cursor
+        artist_id: id of the artist
+
+    Returns:
+        ArtistAnalytics
+    """
+    # One row per concert keeps the number of rows (and so the time spent
+    # turning them into Python objects) down
+    cur.execute("""
+        select c.concert_id,
+               date_part('year', c.date)::int as year,
+               c.era_id,
+               array_agg(lss.song_id order by lss.song_order) as song_ids
+        from latest_setlist_songs as lss
+          join concerts as c on lss.concert_id = c.concert_id
+        where c.artist_id = %s
+        group by c.concert_id
+        order by c.date, c.concert_id""", (artist_id,))
+    concerts = cur.fetchall()
+    cur.execute(
+        "select song_id from songs where artist_id = %s", (artist_id,))
+    song_ids = [row.get('song_id') for row in cur.fetchall()]
+    cur.execute("""
+        select era_id, era_identifier
+        from eras
+        where artist_id = %s
+        order by era_id""", (artist_id,))
+    eras = [(row.get('era_id'), row.get('era_identifier'))
+            for row in cur.fetchall()]
+    return ArtistAnalytics(concerts, song_ids, eras)
+
+
+class SetlistAnalytics:
+    """ Process-wide ArtistAnalytics of each artist, computed on first use
+    and kept until the data version changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._analytics = {}
+        self.hits = 0
+        self.loads = 0
+
+    def get(self, cur, artist_inst, version):
+        """ Returns the analytics of an artist, recomputing them first if
+        the data version changed.
+
+        Args:
+            cur: database cursor
+            artist_inst: an instance of an Artist object
+            version: the current data version
+
+        Returns:
+            ArtistAnalytics
+        """
+        with self._lock:
+            entry = self._analytics.get(artist_inst.artist_id)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return entry[1]
+        analytics = load(cur, artist_inst.artist_id)
+        with self._lock:
+            self._analytics[artist_inst.artist_id] = (version, analytics)
+            self.loads += 1
+        return analytics
+
+    def clear(self):
+        with self._lock:
+            self._analytics = {}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "artists": len(self._analytics),
+                "matrix_bytes": sum(
+                    a.incidence.nbytes for _, a in self._analytics.values()),
+                "hits": self.hits,
+                "loads": self.loads,
+            }
+
+
+setlist_analytics = SetlistAnalytics()
@@ -1,5 +1,9 @@
 """ All artist related modeling functions.
 """
+import threading
+import time
+
+DEFAULT_REGISTRY_TTL_SECONDS = 300
 
 class Artist:
     """Class to encapsulate artist information.
@@ -21,9 +25,98 @@ class Artist:
             self.artist_short_name = artist_short_name
 
 
+class ArtistRegistry:
+    """ Process-wide, in memory copy of the artists table. The table is tiny
+    and almost never changes, so we load it in its entirety and answer
+    lookups from memory. Since we hold every artist, unknown short names are
+    answered without going to the database until the next reload.
+    """
+
+    def __init__(self, ttl=DEFAULT_REGISTRY_TTL_SECONDS):
+        """
+        Args:
+            ttl: how many seconds a loaded copy is valid for. After that
+                 the next lookup reloads the table.
+        """
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._artists = None
+        self._loaded_at = 0
+        self.hits = 0
+        self.negative_hits = 0
+        self.loads = 0
+
+    def is_stale(self):
+        return (self._artists is None
+                or time.monotonic() - self._loaded_at > self.ttl)
+
+    def refresh(self, cur):
+        """ (Re)loads every artist from the database.
+
+        Args:
+            cur: database cursor
+        """
+        cur.execute("""
+            SELECT artist_id, artist_name, short_name
+            FROM artists""")
+        artists = {}
+        for row in cur.fetchall():
+            artists[row.get('short_name')] = Artist(row=row)
+        with self._lock:
+            self._artists = artists
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+
+    def get(self, cur, artist_short_name):
+        """ Returns the Artist for a short name, or None if there is no
+        such artist. Reloads the registry first if it is stale.
+
+        Args:
+            cur: database cursor
+            artist_short_name: the "short name" of an artist.
+        """
+        if self.is_stale():
+            self.refresh(cur)
+        artist = (self._artists or {}).get(artist_short_name)
+        with self._lock:
+            if artist is None:
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+        return artist
+
+    def all(self, cur):
+        """ Returns every artist, sorted by short name.
+
+        Args:
+            cur: database cursor
+        """
+        if self.is_stale():
+            self.refresh(cur)
+        artists = self._artists or {}
+        return [artists[k] for k in sorted(artists)]
+
+    def clear(self):
+        with self._lock:
+            self._artists = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "artists": len(self._artists) if self._artists else 0,
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "loads": self.loads,
+            }
+
+
+registry = ArtistRegistry()
+
+
 def get_artist_from_short_name(cur, artist_short_name):
     """ Returns an Artist object if the artist_short_name is present
-    in the database.
+    in the database. This is answered from the process-wide registry, so
+    it only touches the database when the registry needs (re)loading.
 
     Args:
         cur: database cursor
@@ -32,12 +125,4 @@ def get_artist_from_short_name(cur, artist_short_name):
     Returns:
         Artist object
     """
-    cur.execute("""
-        SELECT artist_id, artist_name, short_name 
-        FROM artists
-        WHERE short_name = %s""", (artist_short_name,))
-    res = cur.fetchone()
-    if not res:
-        return None
-    artist = Artist(row=res)
-    return artist
+    return registry.get(cur, artist_short_name)
@@ -1,13 +1,36 @@
-from live.models.location import Location 
+import datetime
+import math
+import threading
+
+from live.models.artist import Artist
+from live.models.dimension import dimensions
 from live.models.setlist import get_latest_setlist_for_concert
 from live.models.song import Song
-from live.models.venue import Venue
 
 
 class Concert:
     """ Class that encapsulates information about a concert.
     """
 
+    __slots__ = (
+        'artist_id',
+        'concert_id',
+        'date',
+        'notes',
+        'concert_friendly_url',
+        'has_setlist',
+        'has_recordings',
+        'has_media',
+        'tour',
+        'venue',
+        'location',
+        'setlist',
+        'concerts_before_after',
+        'rarity',
+        'setlist_version',
+        'setlist_complete',
+        'neighbour_ids')
+
     def __init__(
             self,
             artist_id=None,
@@ -23,7 +46,11 @@ class Concert:
             has_media=False,
             row=None,
             concerts_before_after=None,
-            tour=None):
+            tour=None,
+            rarity=None,
+            setlist_version=None,
+            setlist_complete=None,
+            neighbour_ids=None):
         """ Initializes a concert object. Either uses a database
         object (row) directly, or uses passed in values.
 
@@ -43,6 +70,14 @@ class Concert:
             concerts_before_after: list of concerts that came immediately before/after
                                    the current one.
             tour: a tour reference if part of a tour
+            rarity: the concert's rarity score, see #refresh_concert_rarity
+            setlist_version: the latest version of the concert's setlist, if
+                             known. None if it has no setlist or it's unknown.
+            setlist_complete: whether the latest version of the setlist is
+                              complete, if known
+            neighbour_ids: (previous concert id, next concert id) if known,
+                           see #load_concerts_before_after. Either may be
+                           None if there is no such concert.
         
         """
         self.artist_id = artist_id
@@ -56,10 +91,17 @@ class Concert:
             self.has_recordings = row.get('has_recordings', False)
             self.has_media = row.get('has_media', False)
             self.tour = row.get('tour_name', None)
+            self.rarity = row.get('rarity_score')
+            self.setlist_version = row.get('setlist_version')
+            self.setlist_complete = row.get('setlist_complete')
+            self.neighbour_ids = None
+            if 'prev_concert_id' in row:
+                self.neighbour_ids = (
+                        row.get('prev_concert_id'),
+                        row.get('next_concert_id'))
 
         else:
             self.concert_id = concert_id
-            self.setlist = setlist
             self.date = date
             self.notes = notes
             self.concert_friendly_url = concert_friendly_url
@@ -67,6 +109,10 @@ class Concert:
             self.has_recordings = has_recordings
             self.has_media = has_media
             self.tour = tour
+            self.rarity = rarity
+            self.setlist_version = setlist_version
+            self.setlist_complete = setlist_complete
+            self.neighbour_ids = neighbour_ids
 
         # Information tied to concerts that is usually derived from
         # the same query (ie, fetching location information)
@@ -85,7 +131,8 @@ def initialize_from_result(
         artist_inst,
         concert_row,
         fetch_setlist=False,
-        fetch_before_prev_concert=False):
+        fetch_before_prev_concert=False,
+        loaders=None):
     """ Given a db result, initializes a fully populated concert,
     including venue and location information.
 
@@ -95,15 +142,14 @@ def initialize_from_result(
         concert_row: a row from the database representing concert info
         fetch_setlist: if true, resolves the setlist for this concert.
         fetch_before_prev_concert: if true, gets the concert info before/after the given one
+        loaders: optional #Loaders of the current request. If given, the
+                 neighbours are loaded through them, batched with anything
+                 else that's queued.
     """
-    location = Location(
-        concert_row["country_name"],
-        concert_row["state_name"],
-        concert_row["city_name"])
-
-    venue = None
-    if concert_row.get("venue_name") is not None:
-        venue = Venue(concert_row["venue_name"], location)
+    venue, location = dimensions.resolve(
+        cur,
+        concert_row.get("venue_id"),
+        concert_row.get("location_id"))
 
     setlist = None
     if fetch_setlist:
@@ -112,175 +158,297 @@ def initialize_from_result(
                 artist_inst.artist_id,
                 concert_row["concert_id"])
 
-    concerts_before_after = []
-    if fetch_before_prev_concert:
-        # This is actually kind of gnarly. We have to do a rank
-        # and then select the dates prior/before if present
-        cur.execute("""
-            with near_final as (
-                with before_after as (
-                    with concert_artist_dates as (
-                        select cc.artist_id,
-                               cc.date,
-                               cc.concert_friendly_url,
-                               row_number() over (ORDER BY cc.date asc) as rn
-                        from concerts as cc 
-                        where cc.artist_id=%s
-                    )
-                    select 
-                        prev.date as prev_date,
-                        prev.concert_friendly_url as prev_concert_friendly_url,
-                        next.date as next_date,
-                        next.concert_friendly_url as next_concert_friendly_url
-                    from concert_artist_dates curr
-                    left outer join concert_artist_dates next ON curr.rn+1=next.rn
-                    right outer join concert_artist_dates prev ON curr.rn-1=prev.rn
-                    where curr.artist_id=%s and curr.concert_friendly_url=%s 
-                )
-                select prev_concert_friendly_url as concert_friendly_url from before_after
-                union all
-                select next_concert_friendly_url as concert_friendly_url from before_after
-            )
-            select * from near_final""",
-            (artist_inst.artist_id,
-              artist_inst.artist_id,
-              concert_row.get('concert_friendly_url')))
-        concert_rows = cur.fetchall()
-        if not concert_rows:
-            concert_rows = []
-        for cr in concert_rows:
-            concerts_before_after.append(
-                get_for_artist_and_url(
-                  cur,
-                  artist_inst,
-                  cr.get('concert_friendly_url'),
-                  fetch_setlist=False,
-                  fetch_before_prev_concert=False))
-
     concert = Concert(
         artist_inst.artist_id,
         row=concert_row,
         setlist=setlist,
         venue=venue,
         location=location,
-        concerts_before_after=concerts_before_after)
+        concerts_before_after=[])
+
+    if fetch_before_prev_concert:
+        concert.concerts_before_after = load_concerts_before_after(
+                cur, concert, loaders=loaders)
     return concert
 
 
-def get_all_for_era(cur, artist_inst, era_inst):
+def load_concerts_before_after(cur, concert, loaders=None):
+    """ Gets the concerts immediately before and after a given one, from
+    the ids #get_for_artist_and_url selects along with it.
+
+    Args:
+        cur: database cursor
+        concert: a Concert with `neighbour_ids`
+        loaders: optional #Loaders of the current request, so the
+                 neighbours are fetched in the same batch as any other
+                 queued concerts
+
+    Returns:
+        list of [previous concert, next concert]. Either may be None if
+        there is no such concert.
+    """
+    neighbour_ids = concert.neighbour_ids or (None, None)
+    known_ids = [i for i in neighbour_ids if i is not None]
+    if loaders is not None:
+        neighbours = loaders.concerts.load_dict(known_ids)
+    else:
+        neighbours = get_concerts_by_ids(cur, known_ids)
+    return [neighbours.get(i) for i in neighbour_ids]
+
+
+LISTING_SORT_DATE = 'date'
+LISTING_SORT_RARITY = 'rarity'
+LISTING_SORTS = (LISTING_SORT_DATE, LISTING_SORT_RARITY)
+
+# Keyset comparison and order of each listing sort
+_LISTING_ORDERS = {
+    LISTING_SORT_DATE: (
+        "(c.date, c.concert_id) > (%s, %s)",
+        "c.date asc, c.concert_id asc"),
+    LISTING_SORT_RARITY: (
+        "(c.rarity_score, c.concert_id) < (%s, %s)",
+        "c.rarity_score desc, c.concert_id desc"),
+}
+
+
+def parse_listing_sort(sort):
+    """ Gets the listing sort asked for in a url.
+
+    Returns:
+        one of LISTING_SORTS, the date if `sort` isn't one of them
+    """
+    return sort if sort in LISTING_SORTS else LISTING_SORT_DATE
+
+
+def build_listing_query(
+        artist_id,
+        era_id=None,
+        year=None,
+        tour_id=None,
+        upcoming=False,
+        sort=LISTING_SORT_DATE,
+        after=None,
+        limit=None):
+    """ Builds the query used for every concert listing. Filters are
+    composed into the where clause, and results are ordered by
+    (date, concert_id), or by (rarity_score, concert_id) descending when
+    sorting by rarity, so they can be paginated with a keyset: pass the
+    keyset of the last concert on the previous page as `after`.
+
+    Args:
+        artist_id: id of the artist to list concerts for
+        era_id: optional era id to filter by
+        year: optional year (int or string) to filter by
+        tour_id: optional tour id to filter by
+        upcoming: if true, only concerts after today are included
+        sort: one of LISTING_SORTS
+        after: optional (date, concert_id) tuple, or (rarity_score,
+               concert_id) when sorting by rarity; only concerts after it
+               are returned
+        limit: optional maximum number of concerts to return
+
+    Returns:
+        tuple of (sql, params)
+    """
+    keyset, order = _LISTING_ORDERS[sort]
+    where = ["c.artist_id = %s"]
+    params = [artist_id]
+    if era_id is not None:
+        where.append("c.era_id = %s")
+        params.append(era_id)
+    if year is not None:
+        # A range (rather than date_part) lets this use the
+        # (artist_id, date) index.
+        where.append("c.date >= %s and c.date < %s")
+        params.extend(year_date_range(year))
+    if tour_id is not None:
+        where.append("c.tour_id = %s")
+        params.append(tour_id)
+    if upcoming:
+        where.append("c.date > CURRENT_DATE")
+    if after is not None:
+        where.append(keyset)
+        params.extend(after)
+    sql = """
+        select c.concert_id,
+               c.date,
+               c.concert_friendly_url,
+               c.venue_id,
+               c.location_id,
+               c.rarity_score,
+               exists (
+                   select 1 from concert_setlist as cs
+                   where cs.concert_id = c.concert_id
+                     and cs.complete is not null) as has_setlist,
+               exists (
+                   select 1 from concert_recording_mapping as crm
+                   where crm.concert_id = c.concert_id) as has_recordings,
+               exists (
+                   select 1 from media_concert as mc
+                   where mc.concert_id = c.concert_id) as has_media,
+               ct.name as tour_name
+        from concerts as c
+          left join concert_tours as ct on c.tour_id = ct.id
+        where %s
+        order by %s""" % (" and ".join(where), order)
+    if limit is not None:
+        sql += "\n        limit %s"
+        params.append(limit)
+    return sql, params
+
+
+def get_listing(cur, artist_inst, **filters):
+    """ Gets concerts for an artist using #build_listing_query.
+
+    Args:
+        cur: a cursor to the database
+        artist_inst: an instance of Artist
+        filters: keyword arguments passed to #build_listing_query
+
+    Returns:
+        list of concerts sorted by date, or by rarity if asked to
+    """
+    if not artist_inst:
+        return None
+    return list(iter_listing(cur, artist_inst, **filters))
+
+
+def iter_listing(cur, artist_inst, **filters):
+    """ Lazily yields concerts for an artist using #build_listing_query.
+    Nothing is executed until the first concert is requested.
+
+    Args:
+        cur: a cursor to the database, ideally a server side one
+        artist_inst: an instance of Artist
+        filters: keyword arguments passed to #build_listing_query
+    """
+    sql, params = build_listing_query(artist_inst.artist_id, **filters)
+    cur.execute(sql, params)
+    for concert_row in cur:
+        yield initialize_from_result(cur, artist_inst, concert_row)
+
+
+class ListingPage:
+    """ A single page of a concert listing. Iterating over it yields the
+    concerts on the page; once iteration is done `next_cursor` holds the
+    cursor of the next page, or None if this is the last page. This lets a
+    streamed template render concerts as they're read and the link to the
+    next page afterwards.
+    """
+
+    def __init__(self, concerts, page_size, sort=LISTING_SORT_DATE):
+        """
+        Args:
+            concerts: iterable of concerts, with up to page_size + 1 entries
+            page_size: maximum number of concerts on this page, None if
+                       there is no maximum
+            sort: the sort the concerts are in, one of LISTING_SORTS
+        """
+        self._concerts = concerts
+        self.page_size = page_size
+        self.sort = sort
+        self.next_cursor = None
+
+    def __iter__(self):
+        last = None
+        for count, concert in enumerate(self._concerts):
+            if self.page_size is not None and count == self.page_size:
+                self.next_cursor = format_listing_cursor(last, self.sort)
+                break
+            last = concert
+            yield concert
+
+
+def get_listing_page(
+        cur,
+        artist_inst,
+        page_size,
+        after=None,
+        sort=LISTING_SORT_DATE,
+        **filters):
+    """ Gets a single page of a concert listing.
+
+    Args:
+        cur: a cursor to the database
+        artist_inst: an instance of Artist
+        page_size: maximum number of concerts per page. If None everything
+                   is returned in one page.
+        after: keyset of the last concert on the previous page, see
+               #parse_listing_cursor
+        sort: one of LISTING_SORTS
+        filters: keyword arguments passed to #build_listing_query
+
+    Returns:
+        a #ListingPage. Concerts are read lazily as it is iterated over.
+    """
+    limit = None if page_size is None else page_size + 1
+    concerts = iter_listing(
+            cur, artist_inst, sort=sort, after=after, limit=limit, **filters)
+    return ListingPage(concerts, page_size, sort)
+
+
+def format_listing_cursor(concert, sort=LISTING_SORT_DATE):
+    """ Encodes the keyset of a concert for use in a url.
+    """
+    if sort == LISTING_SORT_RARITY:
+        # repr round trips the score exactly
+        return "%r.%s" % (concert.rarity, concert.concert_id)
+    return "%s.%s" % (concert.date.isoformat(), concert.concert_id)
+
+
+def parse_listing_cursor(cursor, sort=LISTING_SORT_DATE):
+    """ Decodes a cursor created by #format_listing_cursor.
+
+    Returns:
+        (date, concert_id) tuple, or (rarity_score, concert_id) when
+        sorting by rarity. None if the cursor is malformed.
+    """
+    if not cursor:
+        return None
+    key_str, _, concert_id = cursor.rpartition(".")
+    try:
+        if sort == LISTING_SORT_RARITY:
+            key = float(key_str)
+            if not math.isfinite(key):
+                return None
+        else:
+            key = datetime.date.fromisoformat(key_str)
+        return (key, int(concert_id))
+    except ValueError:
+        return None
+
+
+def get_all_for_era(cur, artist_inst, era_inst, sort=LISTING_SORT_DATE):
     """ Gets all concerts for an artist and a particular era.
 
     Args:
         artist_inst: Artist instance
         era_inst: Era instance
+        sort: one of LISTING_SORTS
     """
     if not artist_inst or not era_inst:
         return None
-    cur.execute("""
-        select c.date,
-               c.concert_friendly_url,
-               v.venue_name,
-               countries.name as country_name,
-               cities.name as city_name,
-               states.name as state_name,
-               cs.complete is not null as has_setlist,
-               cr.concert_id is not null as has_recordings,
-               cm.concert_id is not null as has_media,
-               ct.name as tour_name
-        from concerts as c 
-          full join venues as v on c.venue_id = v.venue_id
-          full join locations as l on c.location_id = l.id 
-          full join countries on l.fk_country_id = countries.id
-          full join cities on l.fk_cities_id = cities.id 
-          full join states on l.fk_state_id = states.id
-          full join concert_setlist as cs on c.concert_id = cs.concert_id
-          full join (select distinct concert_id from concert_recording_mapping) as cr on c.concert_id = cr.concert_id
-          full join (select distinct concert_id from media_concert) as cm on c.concert_id = cm.concert_id
-          full join concert_tours as ct on c.tour_id = ct.id
-        where c.artist_id = %s and c.era_id = %s
-        order by date ASC;""", (artist_inst.artist_id, era_inst.era_id))
-    res = []
-    concerts = cur.fetchall()
-    for concert_row in concerts:
-        concert = initialize_from_result(cur, artist_inst, concert_row)
-        res.append(concert)
-    return res
+    return get_listing(cur, artist_inst, era_id=era_inst.era_id, sort=sort)
 
 
-def get_all_for_artist_listing_only(cur, artist_inst, year=None):
+def get_all_for_artist_listing_only(
+        cur,
+        artist_inst,
+        year=None,
+        sort=LISTING_SORT_DATE):
     """ Gets all concerts for an artist. This returns a subset of concert
     information, it's namely intended to be used when listing concert info,
     ex date, venue, location, etc. Note that it returns the listing in
-    sorted order by date.
-
-    There's probably a better way of consolidating the two below queries,
-    but there is guaranteed to be safe with respect to year injection
-    (assuming that year has been validated at this point already).
+    sorted order by date, unless sorted by rarity.
 
     Args:
         cur: a cursor to the database
         artist_inst: an instance of Artist
         year: optional string representing a year. If specified we filter
               results such that only concerts of that year are returned.
+        sort: one of LISTING_SORTS
     """
-    if not artist_inst:
-        return None
-    if not year:
-        cur.execute("""
-            select c.date,
-                   c.concert_friendly_url,
-                   v.venue_name,
-                   countries.name as country_name,
-                   cities.name as city_name,
-                   states.name as state_name,
-                   cs.complete is not null as has_setlist,
-                   cr.concert_id is not null as has_recordings,
-                   cm.concert_id is not null as has_media,
-                   ct.name as tour_name
-            from concerts as c 
-              full join venues as v on c.venue_id = v.venue_id
-              full join locations as l on c.location_id = l.id 
-              full join countries on l.fk_country_id = countries.id
-              full join cities on l.fk_cities_id = cities.id 
-              full join states on l.fk_state_id = states.id
-              full join concert_setlist as cs on c.concert_id = cs.concert_id
-              full join (select distinct concert_id from concert_recording_mapping) as cr on c.concert_id = cr.concert_id
-              full join (select distinct concert_id from media_concert) as cm on c.concert_id = cm.concert_id
-              full join concert_tours as ct on c.tour_id = ct.id
-            where c.artist_id = %s
-            order by date ASC;""", (artist_inst.artist_id,))
-    else:
-        cur.execute("""
-            select c.date,
-                   c.concert_friendly_url,
-                   v.venue_name,
-                   countries.name as country_name,
-                   cities.name as city_name,
-                   states.name as state_name,
-                   cs.complete is not null as has_setlist,
-                   cr.concert_id is not null as has_recordings,
-                   cm.concert_id is not null as has_media,
-                   ct.name as tour_name
-            from concerts as c 
-              full join venues as v on c.venue_id = v.venue_id
-              full join locations as l on c.location_id = l.id 
-              full join countries on l.fk_country_id = countries.id
-              full join cities on l.fk_cities_id = cities.id 
-              full join states on l.fk_state_id = states.id
-              full join concert_setlist as cs on c.concert_id = cs.concert_id
-              full join (select distinct concert_id from concert_recording_mapping) as cr on c.concert_id = cr.concert_id
-              full join (select distinct concert_id from media_concert) as cm on c.concert_id = cm.concert_id
-              full join concert_tours as ct on c.tour_id = ct.id
-            where c.artist_id = %s
-                  and date_part('year', c.date) = %s
-            order by date ASC;""", (artist_inst.artist_id, year))
-
-    res = []
-    concerts = cur.fetchall()
-    for concert_row in concerts:
-        concert = initialize_from_result(cur, artist_inst, concert_row)
-        res.append(concert)
-    return res
+    return get_listing(cur, artist_inst, year=year or None, sort=sort)
 
 
 def get_upcoming_concerts(cur, artist_inst, limit=None):
@@ -291,33 +459,9 @@ def get_upcoming_concerts(cur, artist_inst, limit=None):
         limit: how many shows to fetch. None means fetch next 200 shows
                (seriously who has more than 200 upcoming shows at a time)..
     """
-    if not artist_inst:
-        return None
     if not limit:
         limit = 200
-    cur.execute("""
-        select c.date,
-               c.concert_friendly_url,
-               v.venue_name,
-               countries.name as country_name,
-               cities.name as city_name,
-               states.name as state_name
-        from concerts as c 
-          full join venues as v on c.venue_id = v.venue_id
-          full join locations as l on c.location_id = l.id 
-          full join countries on l.fk_country_id = countries.id
-          full join cities on l.fk_cities_id = cities.id 
-          full join states on l.fk_state_id = states.id
-        where c.artist_id = %s
-              and date > CURRENT_DATE
-        order by date ASC
-        limit %s""", (artist_inst.artist_id,limit,))
-    res = []
-    concerts = cur.fetchall()
-    for concert_row in concerts:
-        concert = initialize_from_result(cur, artist_inst, concert_row)
-        res.append(concert)
-    return res
+    return get_listing(cur, artist_inst, upcoming=True, limit=limit)
 
 
 def get_for_artist_and_url(
@@ -325,13 +469,18 @@ def get_for_artist_and_url(
         artist_inst,
         url,
         fetch_setlist=True,
-        fetch_before_prev_concert=True):
-    """ Returns a concert given an artist and a url.
+        fetch_before_prev_concert=True,
+        loaders=None):
+    """ Returns a concert given an artist and a url, along with the
+    latest version of its setlist and whether it's complete (see
+    #setlist.get_setlist_version), and the ids of the concerts before and
+    after it (`neighbour_ids`).
 
     Args:
         cur: database cursor
         artist_inst: an instance of an Artist object
         url: the url of the concert.
+        loaders: optional #Loaders, see #initialize_from_result
     """
     if not artist_inst:
         return None
@@ -340,18 +489,31 @@ def get_for_artist_and_url(
                c.concert_friendly_url,
                c.notes,
                c.concert_id,
-               v.venue_name,
-               countries.name as country_name,
-               cities.name as city_name,
-               states.name as state_name,
-               ct.name as tour_name
+               c.venue_id,
+               c.location_id,
+               ct.name as tour_name,
+               cs.latest_version as setlist_version,
+               cs.complete as setlist_complete,
+               (select p.concert_id
+                from concerts as p
+                where p.artist_id = c.artist_id
+                  and (p.date, p.concert_id) < (c.date, c.concert_id)
+                order by p.date desc, p.concert_id desc
+                limit 1) as prev_concert_id,
+               (select n.concert_id
+                from concerts as n
+                where n.artist_id = c.artist_id
+                  and (n.date, n.concert_id) > (c.date, c.concert_id)
+                order by n.date asc, n.concert_id asc
+                limit 1) as next_concert_id
         from concerts as c 
-          full join venues as v on c.venue_id = v.venue_id
-          full join locations as l on c.location_id = l.id 
-          full join countries on l.fk_country_id = countries.id
-          full join cities on l.fk_cities_id = cities.id 
-          full join states on l.fk_state_id = states.id
           full join concert_tours as ct on c.tour_id = ct.id
+          left join lateral (
+              select latest_version, complete
+              from concert_setlist
+              where concert_id = c.concert_id
+              order by latest_version desc
+              limit 1) as cs on true
         where c.artist_id=%s
               and c.concert_friendly_url=%s""",
         (artist_inst.artist_id, url))
@@ -363,17 +525,159 @@ def get_for_artist_and_url(
             artist_inst,
             concert_row,
             fetch_setlist=fetch_setlist,
-            fetch_before_prev_concert=fetch_before_prev_concert)
+            fetch_before_prev_concert=fetch_before_prev_concert,
+            loaders=loaders)
     return concert
 
 
+def get_concerts_by_ids(cur, concert_ids):
+    """ Gets concerts (without their setlists) by id, in a single query.
+
+    Args:
+        cur: database cursor
+        concert_ids: iterable of concert ids
+
+    Returns:
+        dictionary of concert id to Concert. Unknown ids are left out.
+    """
+    concert_ids = list(set(concert_ids))
+    if not concert_ids:
+        return {}
+    cur.execute("""
+        select c.artist_id,
+               c.date,
+               c.concert_friendly_url,
+               c.notes,
+               c.concert_id,
+               c.venue_id,
+               c.location_id,
+               ct.name as tour_name
+        from concerts as c
+          left join concert_tours as ct on c.tour_id = ct.id
+        where c.concert_id = any(%s)""", (concert_ids,))
+    concerts = {}
+    for concert_row in cur.fetchall():
+        artist_inst = Artist(artist_id=concert_row.get('artist_id'))
+        concerts[concert_row.get('concert_id')] = initialize_from_result(
+                cur, artist_inst, concert_row)
+    return concerts
+
+
+def get_all_urls_for_artist(cur, artist_inst):
+    """ Gets the friendly urls of every concert for an artist.
+
+    Args:
+        cur: database cursor
+        artist_inst: an instance of an Artist object
+
+    Returns:
+        list of concert friendly urls, sorted by date
+    """
+    cur.execute("""
+        select c.concert_friendly_url
+        from concerts as c
+        where c.artist_id = %s
+        order by c.date asc, c.concert_id asc""", (artist_inst.artist_id,))
+    return [row.get('concert_friendly_url') for row in cur.fetchall()]
+
+
+def get_setlist_versions_for_artist(cur, artist_inst):
+    """ Gets the setlist versions of every concert of an artist that has
+    more than one, ie the ones with setlist history pages.
+
+    Args:
+        cur: database cursor
+        artist_inst: an instance of an Artist object
+
+    Returns:
+        list of dictionaries with the concert's `concert_friendly_url`, its
+        latest `setlist_version` and every version in `setlist_versions`,
+        sorted by date
+    """
+    cur.execute("""
+        select c.concert_friendly_url,
+               cs.setlist_version,
+               array(
+                   select distinct cso.version
+                   from concert_setlist_ordering as cso
+                   where cso.concert_id = c.concert_id
+                   order by cso.version) as setlist_versions
+        from concerts as c
+          join lateral (
+              select max(latest_version) as setlist_version
+              from concert_setlist
+              where concert_id = c.concert_id) as cs on true
+        where c.artist_id = %s
+          and cs.setlist_version > 1
+        order by c.date asc, c.concert_id asc""", (artist_inst.artist_id,))
+    return cur.fetchall()
+
+
+def get_pages_referencing_concerts(cur, concert_ids):
+    """ Gets identifiers of pages that display information about any of the
+    given concerts: the concert itself and its setlist versions, its
+    neighbours (which link to it), its era and its year.
+
+    Args:
+        cur: database cursor
+        concert_ids: iterable of concert ids
+
+    Returns:
+        list of dictionaries, one per concert
+    """
+    concert_ids = list(set(concert_ids))
+    if not concert_ids:
+        return []
+    cur.execute("""
+        with ordered as (
+            select cc.concert_id,
+                   lag(cc.concert_friendly_url) over w as prev_concert_friendly_url,
+                   lead(cc.concert_friendly_url) over w as next_concert_friendly_url
+            from concerts as cc
+            where cc.artist_id in (
+                select artist_id from concerts where concert_id = any(%s))
+            window w as (partition by cc.artist_id
+                         order by cc.date asc, cc.concert_id asc)
+        )
+        select a.short_name,
+               c.concert_friendly_url,
+               date_part('year', c.date)::int as year,
+               e.era_identifier,
+               o.prev_concert_friendly_url,
+               o.next_concert_friendly_url,
+               (select max(cs.latest_version)
+                from concert_setlist as cs
+                where cs.concert_id = c.concert_id) as setlist_version,
+               array(
+                   select distinct cso.version
+                   from concert_setlist_ordering as cso
+                   where cso.concert_id = c.concert_id
+                   order by cso.version) as setlist_versions
+        from concerts as c
+          join ordered as o on c.concert_id = o.concert_id
+          join artists as a on c.artist_id = a.artist_id
+          left join eras as e on c.era_id = e.era_id
+        where c.concert_id = any(%s)""", (concert_ids, concert_ids))
+    return cur.fetchall()
+
+
 def get_concerts_with_song(cur, artist_inst, song_id):
     """ Gets the concerts at which song was played.
 
-    The inner join accounts for versions - we dont
-    use latest version from the concert_setlist table here. We might
-    need to change that in the future - if we enforce that we go
-    one to one with version / latest_version, then we're fine.
+    Args:
+        cur: database cursor
+        artist_inst: an instance of an Artist object
+        song_id: the id of the song we're searching for
+
+    Returns:
+        list of concerts sorted by date
+    """
+    return list(iter_concerts_with_song(cur, artist_inst, song_id))
+
+
+def iter_concerts_with_song(cur, artist_inst, song_id):
+    """ Lazily yields the concerts at which song was played, going by the
+    latest version of each concert's setlist (see `latest_setlist_songs`).
 
     Args:
         cur: database cursor
@@ -385,35 +689,18 @@ def get_concerts_with_song(cur, artist_inst, song_id):
                c.concert_friendly_url,
                c.notes,
                c.concert_id,
-               v.venue_name,
-               countries.name as country_name,
-               cities.name as city_name,
-               states.name as state_name
-        from concerts as c 
-          full join venues as v on c.venue_id = v.venue_id
-          full join locations as l on c.location_id = l.id 
-          full join countries on l.fk_country_id = countries.id
-          full join cities on l.fk_cities_id = cities.id 
-          full join states on l.fk_state_id = states.id
-        where c.artist_id=%s
+               c.venue_id,
+               c.location_id
+        from concerts as c
+        where c.artist_id = %s
               and c.concert_id in (
-                select cso.concert_id
-                from concert_setlist_ordering as cso
-                inner join (
-                    select concert_id, max(version) as latest_version
-                    from concert_setlist_ordering
-                    group by concert_id) grouped_versions
-                on cso.concert_id = grouped_versions.concert_id
-                and cso.version = grouped_versions.latest_version
-                where cso.song_id = %s
+                select lss.concert_id
+                from latest_setlist_songs as lss
+                where lss.song_id = %s
               )
-        order by c.date asc; """ % (artist_inst.artist_id, song_id,))
-    res = []
-    concerts = cur.fetchall()
-    for concert_row in concerts:
-        concert = initialize_from_result(cur, artist_inst, concert_row)
-        res.append(concert)
-    return res
+        order by c.date asc""", (artist_inst.artist_id, song_id))
+    for concert_row in cur:
+        yield initialize_from_result(cur, artist_inst, concert_row)
 
 
 def get_count_of_concerts_for_all_songs(cur, artist_inst):
@@ -421,6 +708,9 @@ def get_count_of_concerts_for_all_songs(cur, artist_inst):
     artist. This might need to get moved to song... not sure if this
     belongs here.
 
+    Counts come from the `song_performance_counts` table, see
+    #refresh_song_performance_counts.
+
     Args:
         cur: database cursor
         artist_inst: an instance of an Artist object
@@ -429,36 +719,20 @@ def get_count_of_concerts_for_all_songs(cur, artist_inst):
         list of songs sorted by performance count in descending order
     """
     cur.execute("""
-        select s.title,
+        select s.song_id,
+               s.title,
                s.song_url,
-               case
-                when song_count_info.concert_count is not null 
-                    then song_count_info.concert_count
-                else 0
-               end as concert_count
+               coalesce(spc.concert_count, 0) as concert_count
         from songs as s
-        full join  (
-          select cso.song_id,
-                 count(cso.concert_id) as concert_count
-          from concert_setlist_ordering as cso
-          left join songs as s on s.song_id = cso.song_id
-          full join (
-            select concert_id, max(version) as latest_version
-            from concert_setlist_ordering
-            group by concert_id) grouped_versions
-            on cso.concert_id = grouped_versions.concert_id
-               and cso.version = grouped_versions.latest_version
-            where s.artist_id = %s
-            group by cso.song_id
-          )  song_count_info
-          on s.song_id = song_count_info.song_id
+          left join song_performance_counts as spc on s.song_id = spc.song_id
         where s.artist_id = %s
-        order by song_count_info.concert_count desc nulls last
-    """, (artist_inst.artist_id, artist_inst.artist_id))
+        order by concert_count desc, s.title
+    """, (artist_inst.artist_id,))
     res = []
     songs = cur.fetchall()
     for row in songs:
         song_inst = Song(
+                song_id=row.get("song_id"),
                 title=row.get("title"),
                 song_url=row.get("song_url"),
                 concert_count=row.get("concert_count"))
@@ -466,6 +740,243 @@ def get_count_of_concerts_for_all_songs(cur, artist_inst):
     return res
 
 
+def refresh_song_performance_counts(cur, artist_id=None, concert_id=None):
+    """ Recomputes rows in `song_performance_counts`. A song's count is the
+    number of concerts whose latest setlist version contains it, as read
+    from `latest_setlist_songs`.
+
+    If a concert id is given only the songs that appear in any version of
+    that concert's setlist are recomputed, which is all that can change
+    when the concert gets a new setlist version. Otherwise every song
+    for the artist (or every song, if no artist is given) is recomputed.
+
+    Note: the caller is responsible for committing.
+
+    Args:
+        cur: database cursor with write access
+        artist_id: optional id of the artist to refresh counts for
+        concert_id: optional id of the concert whose setlist changed
+
+    Returns:
+        the number of songs that were refreshed
+    """
+    if concert_id is not None:
+        affected = """
+            select distinct song_id
+            from concert_setlist_ordering
+            where concert_id = %s"""
+        params = (concert_id,)
+    elif artist_id is not None:
+        affected = "select song_id from songs where artist_id = %s"
+        params = (artist_id,)
+    else:
+        affected = "select song_id from songs"
+        params = ()
+    cur.execute("""
+        with affected as (%s),
+        counts as (
+            select lss.song_id,
+                   count(distinct lss.concert_id) as concert_count
+            from latest_setlist_songs as lss
+            where lss.song_id in (select song_id from affected)
+            group by lss.song_id
+        )
+        insert into song_performance_counts (song_id, artist_id, concert_count)
+        select s.song_id,
+               s.artist_id,
+               coalesce(counts.concert_count, 0)
+        from songs as s
+          left join counts on s.song_id = counts.song_id
+        where s.song_id in (select song_id from affected)
+        on conflict (song_id) do update
+            set artist_id = excluded.artist_id,
+                concert_count = excluded.concert_count""" % (affected,),
+        params)
+    return cur.rowcount
+
+
+def refresh_concert_rarity(cur, artist_id=None, concert_id=None, song_ids=None):
+    """ Recomputes `concerts.rarity_score`. A concert's rarity is the sum,
+    over the distinct songs of its latest setlist, of one over the song's
+    count in `song_performance_counts`, so those should be refreshed
+    first. Concerts without a setlist have a rarity of 0.
+
+    A score only depends on the concert's own setlist and the counts of its
+    songs. If a concert id is given, that concert is recomputed along with
+    every concert that played a song from any version of its setlist, since
+    those songs' counts are all that can change. If song ids are given
+    (ie their counts changed) only the concerts that played them are
+    recomputed. Otherwise every concert for the artist (or every concert,
+    if no artist is given) is. Scores that come out the same aren't
+    written.
+
+    Note: the caller is responsible for committing.
+
+    Args:
+        cur: database cursor with write access
+        artist_id: optional id of the artist to refresh scores for
+        concert_id: optional id of the concert whose setlist changed
+        song_ids: optional list of ids of songs whose counts changed
+
+    Returns:
+        the number of scores that changed
+    """
+    if concert_id is not None:
+        affected = """
+            select %s::integer as concert_id
+            union
+            select lss.concert_id
+            from latest_setlist_songs as lss
+            where lss.song_id in (
+                select song_id
+                from concert_setlist_ordering
+                where concert_id = %s)"""
+        params = (concert_id, concert_id)
+    elif song_ids is not None:
+        affected = """
+            select distinct concert_id
+            from latest_setlist_songs
+            where song_id = any(%s)"""
+        params = (list(song_ids),)
+    elif artist_id is not None:
+        affected = "select concert_id from concerts where artist_id = %s"
+        params = (artist_id,)
+    else:
+        affected = "select concert_id from concerts"
+        params = ()
+    # Summing numerics gives the same score whatever order the songs are
+    # added in, so unchanged scores compare equal and are left alone
+    cur.execute("""
+        with affected as (%s),
+        scores as (
+            select played.concert_id,
+                   sum(1::numeric / spc.concert_count)::double precision as score
+            from (
+                select distinct lss.concert_id, lss.song_id
+                from latest_setlist_songs as lss
+                where lss.concert_id in (select concert_id from affected)
+            ) as played
+              join song_performance_counts as spc
+                on played.song_id = spc.song_id
+            where spc.concert_count > 0
+            group by played.concert_id
+        )
+        update concerts as c
+        set rarity_score = coalesce(scores.score, 0)
+        from affected
+          left join scores on affected.concert_id = scores.concert_id
+        where c.concert_id = affected.concert_id
+          and c.rarity_score <> coalesce(scores.score, 0)""" % (affected,),
+        params)
+    return cur.rowcount
+
+
+def year_date_range(year):
+    """ Gets the half open range of dates covering a year.
+
+    Args:
+        year: int or string
+
+    Returns:
+        tuple of (first day of the year, first day of the next year)
+    """
+    year = int(year)
+    return datetime.date(year, 1, 1), datetime.date(year + 1, 1, 1)
+
+
+def get_year_counts(cur, artist_id=None):
+    """ Gets the number of concerts per year.
+
+    Args:
+        cur: database cursor
+        artist_id: optional artist id to limit the counts to
+
+    Returns:
+        dictionary of artist id to a list of (year, concert count) tuples,
+        sorted by year.
+    """
+    where = ""
+    params = []
+    if artist_id is not None:
+        where = "where c.artist_id = %s"
+        params.append(artist_id)
+    cur.execute("""
+        select c.artist_id,
+               date_part('year', c.date)::int as year,
+               count(*) as concert_count
+        from concerts as c
+        %s
+        group by c.artist_id, year
+        order by c.artist_id, year""" % (where,), params)
+    counts = {}
+    for row in cur.fetchall():
+        counts.setdefault(row.get('artist_id'), []).append(
+            (row.get('year'), row.get('concert_count')))
+    return counts
+
+
+class YearFacets:
+    """ Process-wide, in memory (year, concert count) facets for every
+    artist, used for the year filter on the concert listing. Facets are
+    computed for every artist at once and kept until the data version
+    changes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._facets = None
+        self._version = None
+        self.hits = 0
+        self.loads = 0
+
+    def refresh(self, cur, version):
+        """ (Re)computes the facets of every artist.
+
+        Args:
+            cur: database cursor
+            version: the data version the facets are computed for
+        """
+        facets = get_year_counts(cur)
+        with self._lock:
+            self._facets = facets
+            self._version = version
+            self.loads += 1
+
+    def get(self, cur, artist_inst, version):
+        """ Returns the facets of an artist, recomputing them first if the
+        data version changed.
+
+        Args:
+            cur: database cursor
+            artist_inst: an instance of an Artist object
+            version: the current data version
+
+        Returns:
+            list of (year, concert count) tuples, sorted by year
+        """
+        if self._facets is None or self._version != version:
+            self.refresh(cur, version)
+        with self._lock:
+            self.hits += 1
+            return list(self._facets.get(artist_inst.artist_id, []))
+
+    def clear(self):
+        with self._lock:
+            self._facets = None
+            self._version = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "artists": len(self._facets) if self._facets else 0,
+                "hits": self.hits,
+                "loads": self.loads,
+            }
+
+
+year_facets = YearFacets()
+
+
 def get_years_of_concerts_for_artist(cur, artist_inst):
     """ Gets the years that the artist had concerts in.
 
@@ -474,17 +985,10 @@ def get_years_of_concerts_for_artist(cur, artist_inst):
         artist_inst: an instance of an Artist object
 
     Returns:
-        sorted list of years.
+        set of years.
     """
     if not artist_inst:
-        return set() 
+        return set()
 
-    cur.execute("""
-        select distinct(date_part('year', date))::int as year
-        from concerts as c
-        where c.artist_id = %s 
-        order by year asc;""", (artist_inst.artist_id,))
-    years = cur.fetchall()
-    year_set = set()
-    for year in years: year_set.add(year.get("year"))
-    return year_set
+    counts = get_year_counts(cur, artist_inst.artist_id)
+    return {year for year, _ in counts.get(artist_inst.artist_id, [])}
@@ -0,0 +1,153 @@
+""" In memory copies of the small, nearly static tables concerts refer to:
+venues, locations, countries, cities and states.
+
+Concert queries only select `venue_id` and `location_id`; #resolve turns
+those into shared Venue and Location instances without any joins. The
+tables are loaded once per process and reloaded when the version in the
+`dimension_version` table changes, which triggers bump on any write to one
+of them (see sql/004_dimension_version.sql). The version is checked at
+most every `ttl` seconds, and whenever an id we don't know about turns up.
+"""
+import threading
+import time
+
+import psycopg2.extras
+
+from live.models.location import get_location
+from live.models.venue import get_venue
+
+DEFAULT_DIMENSION_VERSION_TTL_SECONDS = 30
+# Unknown ids force a version check, but not more often than this
+MIN_FORCED_CHECK_INTERVAL_SECONDS = 1
+
+
+class DimensionCache:
+    """ Process-wide venues and locations, keyed by id.
+    """
+
+    def __init__(self, ttl=DEFAULT_DIMENSION_VERSION_TTL_SECONDS):
+        """
+        Args:
+            ttl: how many seconds to go without checking the version
+        """
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._venue_names = None
+        self._locations = None
+        self._version = None
+        self._checked_at = 0
+        self.loads = 0
+
+    @staticmethod
+    def _cursor(cur):
+        # The cursor we're given might be a server side cursor in the middle
+        # of being iterated over, so we use our own on the same connection.
+        return cur.connection.cursor(
+                cursor_factory=psycopg2.extras.RealDictCursor)
+
+    def refresh(self, cur):
+        """ (Re)loads every dimension table.
+
+        Args:
+            cur: database cursor
+        """
+        cur = self._cursor(cur)
+        cur.execute("select version from dimension_version")
+        version = cur.fetchone().get('version')
+        cur.execute("select venue_id, venue_name from venues")
+        venue_names = {
+            row.get('venue_id'): row.get('venue_name')
+            for row in cur.fetchall()}
+        cur.execute("""
+            select l.id,
+                   countries.name as country_name,
+                   states.name as state_name,
+                   cities.name as city_name
+            from locations as l
+              left join countries on l.fk_country_id = countries.id
+              left join cities on l.fk_cities_id = cities.id
+              left join states on l.fk_state_id = states.id""")
+        locations = {
+            row.get('id'): get_location(
+                row.get('country_name'),
+                row.get('state_name'),
+                row.get('city_name'))
+            for row in cur.fetchall()}
+        with self._lock:
+            self._venue_names = venue_names
+            self._locations = locations
+            self._version = version
+            self._checked_at = time.monotonic()
+            self.loads += 1
+
+    def ensure_fresh(self, cur, force=False):
+        """ Loads the tables if they haven't been, or checks the version
+        (if the last check is older than the ttl, or `force` is set) and
+        reloads them if it changed.
+
+        Args:
+            cur: database cursor
+            force: check the version even if the ttl hasn't passed
+        """
+        if self._locations is None:
+            self.refresh(cur)
+            return
+        since_check = time.monotonic() - self._checked_at
+        if since_check <= (MIN_FORCED_CHECK_INTERVAL_SECONDS if force
+                           else self.ttl):
+            return
+        version_cur = self._cursor(cur)
+        version_cur.execute("select version from dimension_version")
+        version = version_cur.fetchone().get('version')
+        if version != self._version:
+            self.refresh(cur)
+        else:
+            self._checked_at = time.monotonic()
+
+    def resolve(self, cur, venue_id, location_id):
+        """ Gets the shared Venue and Location for a concert.
+
+        Args:
+            cur: database cursor, only used if the tables need (re)loading
+            venue_id: the concert's venue id, or None
+            location_id: the concert's location id, or None
+
+        Returns:
+            tuple of (Venue or None, Location). Like the joins this
+            replaces, a concert without a location gets an empty Location.
+        """
+        self.ensure_fresh(cur)
+        if ((location_id is not None and location_id not in self._locations)
+                or (venue_id is not None
+                    and venue_id not in self._venue_names)):
+            # Probably added since we last loaded
+            self.ensure_fresh(cur, force=True)
+        with self._lock:
+            locations = self._locations
+            venue_names = self._venue_names
+        location = locations.get(location_id)
+        if location is None:
+            location = get_location(None, None, None)
+        venue = None
+        venue_name = venue_names.get(venue_id)
+        if venue_name is not None:
+            venue = get_venue(venue_name, location)
+        return venue, location
+
+    def clear(self):
+        with self._lock:
+            self._venue_names = None
+            self._locations = None
+            self._version = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "venues": len(self._venue_names or {}),
+                "locations": len(self._locations or {}),
+                "version": self._version,
+                "loads": self.loads,
+            }
+
+
+dimensions = DimensionCache()
@@ -1,6 +1,28 @@
 class Location:
+    """ Where a concert took place. Locations are shared between every
+    concert at the same place (see #get_location), so treat them as
+    immutable.
+    """
+
+    __slots__ = ('country', 'state', 'city')
 
     def __init__(self, country, state, city):
         self.country = country
         self.state = state
         self.city = city
+
+
+# Flyweights, keyed by (country, state, city). There are only as many as
+# there are distinct locations in the database.
+_locations = {}
+
+
+def get_location(country, state, city):
+    """ Gets the shared Location for a country, state and city, creating
+    it on first use.
+    """
+    key = (country, state, city)
+    location = _locations.get(key)
+    if location is None:
+        location = _locations.setdefault(key, Location(country, state, city))
+    return location
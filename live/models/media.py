@@ -1,4 +1,6 @@
 class Media:
+    __slots__ = ('concert_id', 'media_id', 'media_url', 'media_type')
+
     def __init__(
             self,
             concert_id=None,
@@ -11,6 +13,15 @@ class Media:
             self.media_id = row.get("media_id")
             self.media_url = row.get("media_url")
             self.media_type = row.get("media_type", None)
+        else:
+            self.concert_id = concert_id
+            self.media_id = media_id
+            self.media_url = media_url
+            self.media_type = media_type
+
+
+def empty_media():
+    return {'setlist': [], 'ticket': [], 'poster_flyer': [], 'live_shot': [], 'tour_itinerary': [], 'other': []}
 
 
 def get_all_media_for_concert(cur, concert_id):
@@ -18,23 +29,44 @@ def get_all_media_for_concert(cur, concert_id):
 
         Args:
             cur: database cursor
-            artist_id: (required) artist id
             concert id: concert id
     """
+    media = get_all_media_for_concerts(cur, [concert_id])
+    return media.get(concert_id) or empty_media()
+
+
+def get_all_media_for_concerts(cur, concert_ids):
+    """ Gets all media for a set of concerts in a single query.
+
+        Args:
+            cur: database cursor
+            concert_ids: iterable of concert ids
+
+        Returns:
+            dictionary of concert id to media grouped by media type.
+            Concerts without media are not present.
+    """
+    concert_ids = list(set(concert_ids))
+    if not concert_ids:
+        return {}
     cur.execute("""
-        select mc.media_id,
+        select mc.concert_id,
+               mc.media_id,
                m.media_url,
                mt.media_type
         from media_concert as mc
         left join media as m on mc.media_id = m.media_id
         left join media_types mt on mc.media_type_id = mt.media_type_id
-        where mc.concert_id = %s""", (concert_id,))
-    media = {'setlist': [], 'ticket': [], 'poster_flyer': [], 'live_shot': [], 'tour_itinerary': [], 'other': []}
+        where mc.concert_id = any(%s)""", (concert_ids,))
+    res = {}
     stored_media = cur.fetchall()
     for media_row in stored_media:
         m = Media(row=media_row)
+        media = res.get(m.concert_id)
+        if media is None:
+            media = res[m.concert_id] = empty_media()
         if m.media_type in media:
             media[m.media_type].append(m)
         else:
             media['other'].append(m)
-    return media
+    return res
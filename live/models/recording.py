@@ -43,6 +43,18 @@ class Recording:
     """ Encapsulates all information about a given recording.
     """
 
+    __slots__ = (
+        'recording_id',
+        'lineage',
+        'notes',
+        'complete',
+        'length',
+        'taper',
+        'source_type',
+        'recording_type',
+        'recording_files',
+        'preview_urls')
+
     def __init__(
             self,
             recording_id=0,
@@ -50,6 +62,7 @@ class Recording:
             notes=None,
             length=0,
             complete=False,
+            taper=None,
             row=None):
         """ Initializes a recording object.
 
@@ -100,40 +113,80 @@ def get_all_recordings_for_concert(cur,
     Returns:
         list of Recordings
     """
+    recordings = get_all_recordings_for_concerts(
+            cur,
+            [concert_id],
+            include_files=include_files,
+            include_preview_urls=include_preview_urls)
+    return recordings.get(concert_id, [])
+
+
+def get_all_recordings_for_concerts(cur,
+                                    concert_ids,
+                                    include_files=True,
+                                    include_preview_urls=True):
+    """ Gets all recordings for a set of concerts. This uses at most three
+    queries regardless of how many concerts or recordings there are: one
+    for the recordings themselves and one per child table.
+
+    Args:
+        cur: database cursor
+        concert_ids: iterable of concert ids
+        include_files: whether or not to fetch files for the recordings
+        include_preview_urls: whether or not to fetch preview urls
+
+    Returns:
+        dictionary of concert id to a list of Recordings. Concerts without
+        recordings are not present.
+    """
+    concert_ids = list(set(concert_ids))
+    if not concert_ids:
+        return {}
+
     cur.execute("""
-        select r.recording_id,
+        select crm.concert_id,
+               r.recording_id,
                rt.recording_name,
-	       s.source_name,
-	       r.taper,
-	       r.length,
-	       r.lineage,
-	       r.notes,
-	       r.complete
-        from recording as r
+               s.source_name,
+               r.taper,
+               r.length,
+               r.lineage,
+               r.notes,
+               r.complete
+        from concert_recording_mapping as crm
+        join recording as r on crm.recording_id = r.recording_id
         join source_types as s on r.source_type = s.source_type_id
         join recording_types as rt on r.recording_type =  rt.recording_type_id
-        left join concert_recording_mapping as crm on crm.recording_id = r.recording_id
-        where crm.concert_id = %s""", (concert_id,))
+        where crm.concert_id = any(%s)
+        order by crm.concert_id, r.recording_id""", (concert_ids,))
 
-    recordings = []
+    res = {}
+    recordings_by_id = {}
     recording_rows = cur.fetchall()
     for recording_row in recording_rows:
-        recordings.append(Recording(row=recording_row))
+        recording = Recording(row=recording_row)
+        res.setdefault(recording_row.get('concert_id'), []).append(recording)
+        # A recording might be mapped to more than one concert
+        recordings_by_id.setdefault(recording.recording_id, []).append(recording)
+    if not recordings_by_id:
+        return res
+
+    recording_ids = list(recordings_by_id.keys())
     if include_files:
-        for recording in recordings:
-            cur.execute("""
-                select file_url from recording_file
-                where recording_id = %s
-                and is_public = True""", (recording.recording_id,))
-            recording_files = cur.fetchall()
-            for recording_file in recording_files:
+        cur.execute("""
+            select recording_id, file_url from recording_file
+            where recording_id = any(%s)
+            and is_public = True""", (recording_ids,))
+        recording_files = cur.fetchall()
+        for recording_file in recording_files:
+            for recording in recordings_by_id[recording_file.get('recording_id')]:
                 recording.recording_files.append(recording_file.get('file_url'))
     if include_preview_urls:
-        for recording in recordings:
-            cur.execute("""
-                select preview_url from  recording_preview_urls
-                where recording_id = %s""", (recording.recording_id,))
-            preview_urls = cur.fetchall()
-            for preview_url in preview_urls:
+        cur.execute("""
+            select recording_id, preview_url from  recording_preview_urls
+            where recording_id = any(%s)""", (recording_ids,))
+        preview_urls = cur.fetchall()
+        for preview_url in preview_urls:
+            for recording in recordings_by_id[preview_url.get('recording_id')]:
                 recording.preview_urls.append(preview_url.get('preview_url'))
-    return recordings
+    return res
@@ -0,0 +1,206 @@
+""" Full text search over songs, concerts and recordings.
+
+Searchable text is copied into the `search_documents` table, where each
+row has a weighted tsvector backed by a GIN index: song titles and venue
+names rank above lyrics, place names and tapers, which rank above notes
+and lineage. See #refresh_search_documents.
+"""
+from markupsafe import (
+        Markup,
+        escape)
+
+SEARCH_CONFIG = 'english'
+
+# Snippets are highlighted with these (unlikely to occur in the text)
+# markers rather than HTML, so the text itself can be escaped.
+_START_SEL = '\x02'
+_STOP_SEL = '\x03'
+HEADLINE_OPTIONS = (
+    'StartSel=%s, StopSel=%s, MaxWords=25, MinWords=8, MaxFragments=2, '
+    'FragmentDelimiter=" ... "' % (_START_SEL, _STOP_SEL))
+
+
+class SearchResult:
+    """ A single search hit.
+    """
+
+    __slots__ = (
+        'doc_type',
+        'title',
+        'snippet',
+        'rank',
+        'artist_short_name',
+        'concert_friendly_url',
+        'song_url')
+
+    def __init__(self, row):
+        self.doc_type = row.get('doc_type')
+        self.title = row.get('title')
+        self.snippet = highlight(row.get('snippet'))
+        self.rank = row.get('rank')
+        self.artist_short_name = row.get('short_name')
+        self.concert_friendly_url = row.get('concert_friendly_url')
+        self.song_url = row.get('song_url')
+
+
+def highlight(snippet):
+    """ Escapes a snippet from ts_headline and marks up its matches.
+
+    Returns:
+        Markup, safe to render as is
+    """
+    if not snippet:
+        return Markup('')
+    return Markup(str(escape(snippet))
+                  .replace(_START_SEL, '<mark>')
+                  .replace(_STOP_SEL, '</mark>'))
+
+
+def search(cur, query, limit=20, offset=0):
+    """ Searches everything for a query, best matches first.
+
+    Args:
+        cur: database cursor
+        query: search terms, in websearch syntax (ie quoted phrases,
+               `or`, and `-` to exclude a term)
+        limit: maximum number of results
+        offset: number of results to skip
+
+    Returns:
+        list of SearchResults
+    """
+    # Snippets are only generated for the page of results, since
+    # ts_headline has to re-parse every document it's given.
+    cur.execute("""
+        with query as (
+            select websearch_to_tsquery(%(config)s, %(query)s) as q
+        ),
+        hits as (
+            select sd.*,
+                   ts_rank_cd(sd.document, query.q) as rank
+            from search_documents as sd, query
+            where sd.document @@ query.q
+            order by rank desc, sd.id
+            limit %(limit)s offset %(offset)s
+        )
+        select hits.doc_type,
+               hits.title,
+               hits.rank,
+               ts_headline(%(config)s, coalesce(hits.body, ''), query.q,
+                           %(options)s) as snippet,
+               a.short_name,
+               c.concert_friendly_url,
+               s.song_url
+        from hits
+          cross join query
+          join artists as a on hits.artist_id = a.artist_id
+          left join concerts as c on hits.concert_id = c.concert_id
+          left join songs as s on hits.song_id = s.song_id
+        order by hits.rank desc, hits.id""", {
+            'config': SEARCH_CONFIG,
+            'query': query,
+            'options': HEADLINE_OPTIONS,
+            'limit': limit,
+            'offset': offset,
+        })
+    return [SearchResult(row) for row in cur.fetchall()]
+
+
+def refresh_search_documents(cur, concert_id=None):
+    """ Rebuilds rows in `search_documents`.
+
+    If a concert id is given only that concert's documents (the concert
+    and its recordings) are rebuilt, which is all that changes when a
+    concert is edited. Otherwise everything is rebuilt, including songs.
+
+    Note: the caller is responsible for committing.
+
+    Args:
+        cur: database cursor with write access
+        concert_id: optional id of the concert that changed
+
+    Returns:
+        the number of documents written
+    """
+    # The parameters are filled in client side, so the planner sees a
+    # constant and drops whichever side of the concert filter doesn't apply
+    params = {'config': SEARCH_CONFIG, 'concert_id': concert_id}
+    if concert_id is not None:
+        cur.execute("""
+            delete from search_documents
+            where concert_id = %(concert_id)s""", params)
+    else:
+        cur.execute("delete from search_documents")
+    written = 0
+
+    if concert_id is None:
+        cur.execute("""
+            insert into search_documents
+                (doc_type, artist_id, song_id, title, body, document)
+            select 'song',
+                   s.artist_id,
+                   s.song_id,
+                   s.title,
+                   concat_ws(' ', ltrim(s.lyrics), s.notes),
+                   setweight(to_tsvector(%(config)s, s.title), 'A') ||
+                   setweight(to_tsvector(%(config)s, coalesce(s.lyrics, '')), 'B') ||
+                   setweight(to_tsvector(%(config)s, coalesce(s.notes, '')), 'C')
+            from songs as s""", params)
+        written += cur.rowcount
+
+    cur.execute("""
+        insert into search_documents
+            (doc_type, artist_id, concert_id, title, body, document)
+        select 'concert',
+               c.artist_id,
+               c.concert_id,
+               concat_ws(' - ', c.date::text, v.venue_name),
+               concat_ws(' ', v.venue_name, cities.name, states.name,
+                         countries.name, c.notes, setlist_notes.notes),
+               setweight(to_tsvector(%(config)s, coalesce(v.venue_name, '')), 'A') ||
+               setweight(to_tsvector(%(config)s, concat_ws(
+                   ' ', cities.name, states.name, countries.name)), 'B') ||
+               setweight(to_tsvector(%(config)s, concat_ws(
+                   ' ', c.notes, setlist_notes.notes)), 'C')
+        from concerts as c
+          left join venues as v on c.venue_id = v.venue_id
+          left join locations as l on c.location_id = l.id
+          left join countries on l.fk_country_id = countries.id
+          left join cities on l.fk_cities_id = cities.id
+          left join states on l.fk_state_id = states.id
+          left join lateral (
+              select string_agg(cso.notes, ' ' order by cso.song_order) as notes
+              from latest_setlist_songs as lss
+                join concert_setlist_ordering as cso
+                  on cso.concert_id = lss.concert_id
+                  and cso.version = lss.version
+                  and cso.song_order = lss.song_order
+                  and cso.song_id = lss.song_id
+              where lss.concert_id = c.concert_id
+          ) as setlist_notes on true
+        where %(concert_id)s::integer is null
+           or c.concert_id = %(concert_id)s""", params)
+    written += cur.rowcount
+
+    cur.execute("""
+        insert into search_documents
+            (doc_type, artist_id, concert_id, recording_id, title, body,
+             document)
+        select 'recording',
+               c.artist_id,
+               c.concert_id,
+               r.recording_id,
+               concat_ws(' ', c.date::text, rt.recording_name, st.source_name),
+               concat_ws(' ', r.taper, r.lineage, r.notes),
+               setweight(to_tsvector(%(config)s, coalesce(r.taper, '')), 'B') ||
+               setweight(to_tsvector(%(config)s, concat_ws(
+                   ' ', r.lineage, r.notes)), 'C')
+        from concert_recording_mapping as crm
+          join concerts as c on crm.concert_id = c.concert_id
+          join recording as r on crm.recording_id = r.recording_id
+          left join recording_types as rt on r.recording_type = rt.recording_type_id
+          left join source_types as st on r.source_type = st.source_type_id
+        where %(concert_id)s::integer is null
+           or c.concert_id = %(concert_id)s""", params)
+    written += cur.rowcount
+    return written
@@ -0,0 +1,177 @@
+""" Finding concerts where songs were played back to back.
+
+Every bigram and trigram of songs in the latest setlists has a sorted
+posting list of concert ids in the `setlist_ngrams` table (see
+sql/007_setlist_ngrams.sql), maintained along with latest_setlist_songs.
+A sequence of two or three songs is a single posting list; longer ones are
+the intersection of the posting lists of their trigrams, checked against
+the setlists of the (few) concerts left. The work depends on the length of
+the posting lists involved, not on how many concerts there are.
+"""
+import bisect
+
+from live.models import concert
+
+MIN_SEQUENCE_LENGTH = 2
+MAX_NGRAM_LENGTH = 3
+
+
+def get_song_ids(cur, artist_inst, song_urls):
+    """ Gets the ids of an artist's songs by url.
+
+    Args:
+        cur: database cursor
+        artist_inst: an instance of an Artist object
+        song_urls: list of song urls
+
+    Returns:
+        list of song ids in the same order as the urls, or None if any of
+        the urls is unknown
+    """
+    cur.execute("""
+        select song_id, song_url
+        from songs
+        where artist_id = %s
+              and song_url = any(%s)""", (artist_inst.artist_id, song_urls))
+    song_ids = {row.get('song_url'): row.get('song_id') for row in cur.fetchall()}
+    if any(url not in song_ids for url in song_urls):
+        return None
+    return [song_ids[url] for url in song_urls]
+
+
+def ngrams_for_sequence(song_ids):
+    """ Gets the grams whose posting lists cover a sequence: the sequence
+    itself if it's short enough, otherwise each of its trigrams.
+
+    Returns:
+        list of tuples of song ids
+    """
+    if len(song_ids) <= MAX_NGRAM_LENGTH:
+        return [tuple(song_ids)]
+    return [
+        tuple(song_ids[i:i + MAX_NGRAM_LENGTH])
+        for i in range(len(song_ids) - MAX_NGRAM_LENGTH + 1)]
+
+
+def intersect_sorted(posting_lists):
+    """ Intersects sorted lists of ids.
+
+    Starts from the shortest list and looks each of its ids up in the others
+    by binary search, resuming where the last lookup left off, so long
+    lists only cost a logarithmic factor.
+
+    Returns:
+        sorted list of the ids in every list
+    """
+    if not posting_lists:
+        return []
+    posting_lists = sorted(posting_lists, key=len)
+    result = posting_lists[0]
+    for other in posting_lists[1:]:
+        matches = []
+        low = 0
+        for value in result:
+            low = bisect.bisect_left(other, value, low)
+            if low == len(other):
+                break
+            if other[low] == value:
+                matches.append(value)
+        result = matches
+        if not result:
+            break
+    return list(result)
+
+
+def get_posting_lists(cur, artist_inst, grams):
+    """ Gets the posting lists of grams.
+
+    Args:
+        cur: database cursor
+        artist_inst: an instance of an Artist object
+        grams: list of (opening, tuple of song ids) tuples
+
+    Returns:
+        dictionary of (opening, tuple of song ids) to the sorted list of
+        concert ids. Grams that were never played are left out.
+    """
+    cur.execute("""
+        select opening,
+               ngram,
+               concert_ids
+        from setlist_ngrams
+        where artist_id = %s
+              and (opening, ngram) in %s""", (
+                  artist_inst.artist_id,
+                  tuple((opening, list(gram)) for opening, gram in grams)))
+    return {
+        (row.get('opening'), tuple(row.get('ngram'))): row.get('concert_ids')
+        for row in cur.fetchall()}
+
+
+def _played_in_sequence(setlist_song_ids, song_ids, opening):
+    if opening:
+        return setlist_song_ids[:len(song_ids)] == song_ids
+    return any(
+        setlist_song_ids[i:i + len(song_ids)] == song_ids
+        for i in range(len(setlist_song_ids) - len(song_ids) + 1))
+
+
+def find_concert_ids(cur, artist_inst, song_ids, opening=False):
+    """ Finds the concerts where songs were played back to back, in order.
+
+    Args:
+        cur: database cursor
+        artist_inst: an instance of an Artist object
+        song_ids: list of at least two song ids
+        opening: only find concerts that opened with the songs
+
+    Returns:
+        sorted list of concert ids
+    """
+    if len(song_ids) < MIN_SEQUENCE_LENGTH:
+        return []
+    grams = ngrams_for_sequence(song_ids)
+    # Only the first gram has to start the setlist
+    keys = [(opening and i == 0, gram) for i, gram in enumerate(grams)]
+    posting_lists = get_posting_lists(cur, artist_inst, keys)
+    if any(key not in posting_lists for key in keys):
+        return []
+    concert_ids = intersect_sorted(
+            [posting_lists[key] for key in set(keys)])
+    if len(grams) == 1 or not concert_ids:
+        return concert_ids
+
+    # Having every trigram doesn't mean they're in a single run
+    cur.execute("""
+        select concert_id,
+               array_agg(song_id order by song_order) as song_ids
+        from latest_setlist_songs
+        where concert_id = any(%s)
+        group by concert_id""", (concert_ids,))
+    return sorted(
+        row.get('concert_id') for row in cur.fetchall()
+        if _played_in_sequence(row.get('song_ids'), song_ids, opening))
+
+
+def get_concerts_with_sequence(
+        cur, artist_inst, song_ids, opening=False, loaders=None):
+    """ Gets the concerts where songs were played back to back, in order.
+
+    Args:
+        cur: database cursor
+        artist_inst: an instance of an Artist object
+        song_ids: list of at least two song ids
+        opening: only find concerts that opened with the songs
+        loaders: optional #Loaders of the current request to get the
+                 concerts through
+
+    Returns:
+        list of Concerts, sorted by date
+    """
+    concert_ids = find_concert_ids(cur, artist_inst, song_ids, opening)
+    if loaders is not None:
+        concerts = loaders.concerts.load_dict(concert_ids)
+    else:
+        concerts = concert.get_concerts_by_ids(cur, concert_ids)
+    return sorted(
+        concerts.values(), key=lambda c: (c.date, c.concert_id))
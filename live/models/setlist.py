@@ -1,11 +1,44 @@
+""" Setlists, and caching and history of their versions.
+
+A version of a setlist never changes once it has been written: edits add a
+new version to `concert_setlist_ordering` and bump
+`concert_setlist.latest_version`. So setlists are cached keyed by
+(concert id, version) without ever needing to be invalidated, see
+#SetlistCache. Whether a setlist is complete isn't part of a version (it's
+kept per concert, and can change without a new version), so it is never
+cached and only known for the latest version. Older versions are stored
+in `setlist_history` as deltas against the latest one (see
+sql/009_setlist_history.sql and #build_setlist_history), so every version
+of a setlist can be shown from a single small read plus the (usually
+cached) latest version.
+"""
+import collections
+import difflib
+import os
+import pickle
+import tempfile
+import threading
+
+import psycopg2.extras
+
 from live.models.song import (
     Song
 )
 
+DEFAULT_SETLIST_CACHE_MAX_ENTRIES = 4096
+# Part of the name of cached files, bump it when Setlist or Song change so
+# files pickled by an older release aren't read
+SETLIST_CACHE_FORMAT = 2
+
+# Concerts whose versions are read at once when building history
+BUILD_BATCH_SIZE = 1000
+
 class SetlistSong:
     """ Helper class used within #Setlist.
     """
 
+    __slots__ = ('song_order', 'song')
+
     def __init__(self, song_order, song):
         """ Initializes a class used to hold songs in a setlist.
 
@@ -30,10 +63,11 @@ class Setlist:
             concert_id: the id of the concert this setlist belongs to
             version: the version of this setlist. Concerts can have multiple
                      versions of a setlist if there are multiple edits - you
-                     can time travel between them
+                     can time travel between them, see #get_setlist_history
             complete: whether this setlist is complete. This indicates that the
                       setlist is fully "known" - ie many setlists we only know
-                      a song or two, so this would be false.
+                      a song or two, so this would be false. None if it
+                      isn't known, as for older versions.
         """
         self.concert_id = concert_id
         self.version = version
@@ -50,12 +84,18 @@ class Setlist:
             return
         self.setlist_songs.append(setlist_song)
 
+    def with_complete(self, complete):
+        """ Gets a copy of this setlist (sharing its songs) with a different
+        `complete`, so cached setlists don't have to be modified.
+        """
+        setlist = Setlist(self.concert_id, self.version, complete)
+        setlist.setlist_songs = self.setlist_songs
+        return setlist
+
 
 def get_latest_setlist_for_concert(cur, artist_id, concert_id):
-    """ Gets the latest setlist for a concert.
-
-    Note: this uses two queries. I think we can use a nested query,
-    but I don't really feel like investigating that RN...
+    """ Gets the latest setlist for a concert. The version lookup is folded
+    into the ordering query, so this is a single query.
 
     Args:
         cur: cursor to the database
@@ -65,43 +105,593 @@ def get_latest_setlist_for_concert(cur, artist_id, concert_id):
     Returns:
         populated setlist, or None if no such setlist exists
     """
+    return get_latest_setlists_for_concerts(cur, [concert_id]).get(concert_id)
+
+
+def get_latest_setlists_for_concerts(cur, concert_ids):
+    """ Gets the latest setlists for many concerts at once, in a single
+    query no matter how many concerts are asked for.
+
+    Args:
+        cur: cursor to the database
+        concert_ids: iterable of concert ids
+
+    Returns:
+        dictionary of concert id to populated setlist. Concerts without a
+        setlist are left out.
+    """
+    concert_ids = list(concert_ids)
+    if not concert_ids:
+        return {}
+
     cur.execute("""
-        select latest_version,
-               complete
-        from concert_setlist
-        where concert_id = %s
-        order by latest_version desc
-        limit 1;""", (concert_id,))
-    version_info = cur.fetchone()
-    if not version_info:
+        with versions as (
+            select distinct on (concert_id)
+                   concert_id,
+                   latest_version,
+                   complete
+            from concert_setlist
+            where concert_id = any(%s)
+            order by concert_id, latest_version desc
+        )
+        select versions.concert_id,
+               versions.latest_version,
+               versions.complete,
+               s.song_id,
+               s.title,
+               s.song_url,
+               s.artist_id,
+               a.short_name as artist_name,
+               aa.artist_name as original_artist_name,
+               cso.notes,
+               cso.song_order
+        from versions
+            left join concert_setlist_ordering as cso
+                on cso.concert_id = versions.concert_id
+                and cso.version = versions.latest_version
+            left join songs as s on cso.song_id = s.song_id
+            left join songs as ss on ss.song_id = s.original_song_id
+            left join artists as a on s.artist_id = a.artist_id
+            left join artists as aa on ss.artist_id = aa.artist_id
+        order by versions.concert_id, cso.song_order
+        """, (concert_ids,))
+    setlists = {}
+    for row in cur.fetchall():
+        concert_id = row.get("concert_id")
+        setlist = setlists.get(concert_id)
+        if setlist is None:
+            setlist = setlists[concert_id] = Setlist(
+                    concert_id=concert_id,
+                    version=row.get("latest_version", 0),
+                    complete=row.get("complete", False))
+        # Setlists with no songs in their latest version only get one row
+        if row.get("song_order") is not None:
+            setlist.add_song_to_setlist(Song(row=row))
+    for setlist in setlists.values():
+        if setlist.setlist_songs:
+            setlist_cache.set(
+                    (setlist.concert_id, setlist.version),
+                    setlist.with_complete(None))
+    return setlists
+
+
+class SetlistCache:
+    """ Process-wide LRU cache of setlists keyed by (concert id, version),
+    optionally backed by a directory shared by every process on the host.
+
+    Versions are immutable, so entries never need invalidating: the size
+    bound only keeps memory in check, and the directory outlives restarts.
+    Cached setlists are shared and must not be modified, and their
+    `complete` is None since it isn't part of a version. Setlists with no
+    songs aren't cached, since the latest version is bumped before its
+    songs are written and may be read in between.
+
+    Cached setlists include their songs' titles and urls, but edits to
+    songs themselves (ie a renamed song) don't create a new version. After
+    making one, empty the directory and restart the workers, which
+    otherwise keep the old song in memory.
+    """
+
+    def __init__(
+            self,
+            max_entries=DEFAULT_SETLIST_CACHE_MAX_ENTRIES,
+            directory=None):
+        """
+        Args:
+            max_entries: how many setlists to keep in memory before evicting
+                         the least recently used one
+            directory: optional directory to share setlists through. Only
+                       the site should be able to write to it, since cached
+                       setlists are pickled.
+        """
+        self.max_entries = max_entries
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key):
+        return os.path.join(
+                self.directory,
+                "%s-%s.v%s.pickle" % (key[0], key[1], SETLIST_CACHE_FORMAT))
+
+    def _remember(self, key, setlist):
+        # Only called with the lock held
+        self._entries[key] = setlist
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _read_shared(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, pickle.UnpicklingError):
+            # A cache that can't be read is only a miss
+            return None
+
+    def _write_shared(self, key, setlist):
+        # Written under a temporary name and renamed into place, so other
+        # processes never see a partial file
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(
+                    dir=self.directory, suffix='.tmp')
+        except OSError:
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(setlist, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, self._path(key))
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+
+    def get(self, key):
+        """ Gets a setlist, from memory or else the shared directory.
+
+        Args:
+            key: (concert id, version) tuple
+
+        Returns:
+            Setlist, or None if it isn't cached
+        """
+        with self._lock:
+            setlist = self._entries.get(key)
+            if setlist is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return setlist
+        if self.directory:
+            setlist = self._read_shared(key)
+            if setlist is not None:
+                with self._lock:
+                    self._remember(key, setlist)
+                    self.shared_hits += 1
+                return setlist
+        with self._lock:
+            self.misses += 1
         return None
 
-    latest_version = version_info.get("latest_version", 0)
-    complete = version_info.get("complete", False)
+    def set(self, key, setlist):
+        """ Caches a setlist in memory and, if it isn't there yet, in the
+        shared directory.
+
+        Args:
+            key: (concert id, version) tuple
+            setlist: the Setlist
+        """
+        with self._lock:
+            known = key in self._entries
+            self._remember(key, setlist)
+        if (self.directory and not known
+                and not os.path.exists(self._path(key))):
+            self._write_shared(key, setlist)
+
+    def clear(self):
+        """ Empties the in memory cache. The shared directory is left alone.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "shared": self.directory is not None,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+setlist_cache = SetlistCache()
+
 
+def _load_setlist_versions(cur, keys):
+    """ Reads specific versions of setlists in a single query.
+
+    Args:
+        cur: cursor to the database
+        keys: list of (concert id, version) tuples
+
+    Returns:
+        dictionary of (concert id, version) to populated setlist, with
+        `complete` None. Versions that were never written are left out,
+        except for a concert's latest version, which may have no songs.
+    """
     cur.execute("""
-       select s.title,
-              s.song_url,
-              s.artist_id,
-              a.short_name as artist_name,
-              aa.artist_name as original_artist_name,
-              cso.notes,
-              cso.song_order
-        from concert_setlist_ordering as cso
-            full join songs as s on cso.song_id = s.song_id
+        with wanted as (
+            select *
+            from unnest(%s::integer[], %s::integer[]) as w (concert_id, version)
+        )
+        select wanted.concert_id,
+               wanted.version,
+               s.song_id,
+               s.title,
+               s.song_url,
+               s.artist_id,
+               aa.artist_name as original_artist_name,
+               cso.notes,
+               cso.song_order
+        from wanted
+            join lateral (
+                select max(latest_version) as latest_version
+                from concert_setlist
+                where concert_id = wanted.concert_id) as cs on true
+            left join concert_setlist_ordering as cso
+                on cso.concert_id = wanted.concert_id
+                and cso.version = wanted.version
+            left join songs as s on cso.song_id = s.song_id
             left join songs as ss on ss.song_id = s.original_song_id
-            left join artists as a on s.artist_id = a.artist_id
             left join artists as aa on ss.artist_id = aa.artist_id
-        where cso.concert_id = %s 
-        and cso.version = %s
-        order by cso.song_order
-        """, (concert_id, latest_version))
+        where cso.song_order is not null
+              or wanted.version = cs.latest_version
+        order by wanted.concert_id, wanted.version, cso.song_order
+        """, ([concert_id for concert_id, _ in keys],
+              [version for _, version in keys]))
+    setlists = {}
+    for row in cur.fetchall():
+        key = (row.get("concert_id"), row.get("version"))
+        setlist = setlists.get(key)
+        if setlist is None:
+            setlist = setlists[key] = Setlist(
+                    concert_id=key[0],
+                    version=key[1],
+                    complete=None)
+        if row.get("song_order") is not None:
+            setlist.add_song_to_setlist(Song(row=row))
+    return setlists
+
+
+def get_setlist_versions(cur, keys):
+    """ Gets specific versions of setlists, from the cache if possible. The
+    ones that aren't cached are read in a single query and cached.
+
+    Args:
+        cur: cursor to the database
+        keys: iterable of (concert id, version) tuples
+
+    Returns:
+        dictionary of (concert id, version) to populated setlist, with
+        `complete` None. Versions that don't exist are left out.
+    """
+    setlists = {}
+    missing = []
+    for key in set(keys):
+        setlist = setlist_cache.get(key)
+        if setlist is None:
+            missing.append(key)
+        else:
+            setlists[key] = setlist
+    if missing:
+        loaded = _load_setlist_versions(cur, missing)
+        for key, setlist in loaded.items():
+            # Might be a latest version whose songs aren't written yet
+            if setlist.setlist_songs:
+                setlist_cache.set(key, setlist)
+        setlists.update(loaded)
+    return setlists
+
+
+def get_setlist_version(cur, concert_id, version, complete=None):
+    """ Gets a version of a concert's setlist, from the cache if possible.
+    With the concert's latest version (ie `Concert.setlist_version`) this
+    gets its latest setlist without any queries once it's cached.
+
+    Args:
+        cur: cursor to the database
+        concert_id: id of the concert
+        version: the version of the setlist, None if the concert has no
+                 setlist
+        complete: whether the setlist is complete, if known (ie
+                  `Concert.setlist_complete` for the latest version)
+
+    Returns:
+        populated setlist, or None if no such setlist exists
+    """
+    if version is None:
+        return None
+    setlist = get_setlist_versions(cur, [(concert_id, version)]).get(
+            (concert_id, version))
+    if setlist is None:
+        return None
+    return setlist.with_complete(complete)
+
+
+def encode_delta(base, target):
+    """ Encodes a list as the edits that turn another list into it.
+
+    Args:
+        base: list of comparable items (ie (song id, notes) tuples)
+        target: the list to encode
+
+    Returns:
+        list of {"copy": [start, end]} (a slice of `base`) and
+        {"insert": [item, ...]} operations, in order. Tuples are stored as
+        lists so the delta can be stored as JSON.
+    """
+    matcher = difflib.SequenceMatcher(None, base, target, autojunk=False)
+    delta = []
+    for tag, base_start, base_end, start, end in matcher.get_opcodes():
+        if tag == 'equal':
+            delta.append({"copy": [base_start, base_end]})
+        elif end > start:
+            delta.append({"insert": [list(item) for item in target[start:end]]})
+    return delta
+
+
+def apply_delta(base, delta):
+    """ Decodes a list encoded by #encode_delta.
+
+    Returns:
+        list of items; copied ones are taken from `base`, inserted ones are
+        tuples
+    """
+    items = []
+    for operation in delta:
+        if "copy" in operation:
+            start, end = operation["copy"]
+            items.extend(base[start:end])
+        else:
+            items.extend(tuple(item) for item in operation["insert"])
+    return items
+
+
+def _setlist_entries(songs):
+    return [(song.song_id, song.notes) for song in songs]
+
+
+def build_setlist_history(cur, artist_id=None, concert_id=None):
+    """ (Re)builds rows in `setlist_history`. Each concert with more than
+    one version gets a row holding its older versions as deltas against
+    its latest version (see #encode_delta), plus the ids of songs that
+    only older versions have.
+
+    If a concert id is given only that concert's history is rebuilt, which
+    is all that changes when it gets a new setlist version. Otherwise every
+    concert of the artist (or every concert, if no artist is given) is
+    rebuilt.
+
+    Note: the caller is responsible for committing.
+
+    Args:
+        cur: database cursor with write access
+        artist_id: optional id of the artist to build history for
+        concert_id: optional id of the concert whose setlist changed
+
+    Returns:
+        the number of concerts with a history
+    """
+    if concert_id is not None:
+        where = "where concert_id = %s"
+        params = (concert_id,)
+    elif artist_id is not None:
+        where = "where artist_id = %s"
+        params = (artist_id,)
+    else:
+        where = ""
+        params = ()
+    cur.execute("""
+        select concert_id
+        from concerts
+        %s
+        order by concert_id""" % (where,), params)
+    concert_ids = [row.get('concert_id') for row in cur.fetchall()]
+
+    rows = []
+    for start in range(0, len(concert_ids), BUILD_BATCH_SIZE):
+        cur.execute("""
+            select concert_id,
+                   version,
+                   array_agg(song_id order by song_order) as song_ids,
+                   array_agg(notes order by song_order) as notes
+            from concert_setlist_ordering
+            where concert_id = any(%s)
+            group by concert_id, version
+            order by concert_id, version""", (
+                concert_ids[start:start + BUILD_BATCH_SIZE],))
+        versions = collections.defaultdict(dict)
+        for row in cur.fetchall():
+            versions[row.get('concert_id')][row.get('version')] = list(
+                    zip(row.get('song_ids'), row.get('notes')))
+        for history_concert_id, setlists in versions.items():
+            if len(setlists) < 2:
+                continue
+            base_version = max(setlists)
+            base = setlists.pop(base_version)
+            base_song_ids = {song_id for song_id, _ in base}
+            song_ids = {
+                song_id
+                for entries in setlists.values()
+                for song_id, _ in entries} - base_song_ids
+            rows.append((
+                history_concert_id,
+                base_version,
+                psycopg2.extras.Json({
+                    str(version): encode_delta(base, entries)
+                    for version, entries in setlists.items()}),
+                sorted(song_ids)))
+    # Concerts that are down to a single version shouldn't keep a history
+    cur.execute(
+        "delete from setlist_history where concert_id = any(%s)",
+        (concert_ids,))
+    for start in range(0, len(rows), BUILD_BATCH_SIZE):
+        args = ','.join(
+            cur.mogrify("(%s, %s, %s, %s)", row).decode('utf-8')
+            for row in rows[start:start + BUILD_BATCH_SIZE])
+        cur.execute("""
+            insert into setlist_history
+                (concert_id, base_version, deltas, song_ids)
+            values """ + args)
+    return len(rows)
+
+
+class SetlistHistory:
+    """ Every version of a concert's setlist.
+    """
+
+    def __init__(self, concert_id, latest_version, setlists):
+        """
+        Args:
+            concert_id: id of the concert
+            latest_version: the concert's latest version
+            setlists: dictionary of version to Setlist
+        """
+        self.concert_id = concert_id
+        self.latest_version = latest_version
+        self._setlists = setlists
+
+    @property
+    def versions(self):
+        """ The versions there are, latest first.
+        """
+        return sorted(self._setlists, reverse=True)
+
+    def get(self, version):
+        """ Gets a version of the setlist.
+
+        Returns:
+            Setlist, or None if there's no such version
+        """
+        return self._setlists.get(version)
+
+    def latest(self):
+        return self._setlists.get(self.latest_version)
+
+
+def _reconstruct(base, version, entries, songs):
+    # Songs are copied rather than shared with the base setlist, since
+    # their notes and order belong to a version
     setlist = Setlist(
-            concert_id=concert_id,
-            version=latest_version,
-            complete=complete)
-    setlist_songs = cur.fetchall()
-    for setlist_song in setlist_songs:
-        song = Song(row=setlist_song)
-        setlist.add_song_to_setlist(song)
+            concert_id=base.concert_id,
+            version=version,
+            complete=None)
+    for song_order, (song_id, notes) in enumerate(entries, start=1):
+        song = songs[song_id]
+        setlist.add_song_to_setlist(Song(
+                artist_id=song.artist_id,
+                song_id=song_id,
+                title=song.title,
+                notes=notes,
+                song_url=song.song_url,
+                song_order=song_order,
+                original_artist_name=song.original_artist_name))
     return setlist
+
+
+def get_setlist_history(cur, concert_id):
+    """ Gets every version of a concert's setlist.
+
+    Older versions are rebuilt from their deltas against the version
+    `setlist_history` was built from, so this takes one query plus (unless
+    they're cached) one for the versions that are read as they are: that
+    version and any written since the history was last built, or every
+    version if the concert has no history yet. Every version is cached.
+    Songs of rebuilt versions are numbered from 1. Only the latest version
+    knows whether it's complete.
+
+    Args:
+        cur: cursor to the database
+        concert_id: id of the concert
+
+    Returns:
+        SetlistHistory, or None if the concert has no setlist
+    """
+    cur.execute("""
+        select cs.latest_version,
+               cs.complete,
+               (select array_agg(distinct cso.version)
+                from concert_setlist_ordering as cso
+                where cso.concert_id = cs.concert_id) as versions,
+               h.base_version,
+               h.deltas,
+               (select json_agg(json_build_object(
+                           'song_id', s.song_id,
+                           'title', s.title,
+                           'song_url', s.song_url,
+                           'artist_id', s.artist_id,
+                           'original_artist_name', aa.artist_name))
+                from songs as s
+                  left join songs as ss on ss.song_id = s.original_song_id
+                  left join artists as aa on ss.artist_id = aa.artist_id
+                where s.song_id = any(h.song_ids)) as songs
+        from concert_setlist as cs
+          left join setlist_history as h on h.concert_id = cs.concert_id
+        where cs.concert_id = %s
+        order by cs.latest_version desc
+        limit 1""", (concert_id,))
+    row = cur.fetchone()
+    if not row:
+        return None
+    latest_version = row.get('latest_version')
+    base_version = row.get('base_version')
+    existing = {
+        version for version in row.get('versions') or ()
+        if version <= latest_version}
+    # Only versions that still exist are rebuilt, and none are if the
+    # history's base version is gone
+    deltas = {}
+    if base_version in existing:
+        deltas = {
+            int(version): delta
+            for version, delta in (row.get('deltas') or {}).items()
+            if int(version) in existing}
+    # The rest are read as they are. The latest version is always there,
+    # even if it has no songs.
+    versions = (existing | {latest_version}) - set(deltas)
+    stored = get_setlist_versions(
+            cur, [(concert_id, version) for version in versions])
+    setlists = {version: setlist for (_, version), setlist in stored.items()}
+    if latest_version not in setlists:
+        return None
+    setlists[latest_version] = setlists[latest_version].with_complete(
+            row.get('complete'))
+
+    base = setlists.get(base_version)
+    if base is not None and deltas:
+        songs = {song.song_id: song for song in base.setlist_songs}
+        songs.update(
+            (song_row.get('song_id'), Song(row=song_row))
+            for song_row in row.get('songs') or [])
+        base_entries = _setlist_entries(base.setlist_songs)
+        for version, delta in deltas.items():
+            key = (concert_id, version)
+            setlist = setlist_cache.get(key)
+            if setlist is None:
+                setlist = _reconstruct(
+                        base, key[1], apply_delta(base_entries, delta), songs)
+                if setlist.setlist_songs:
+                    setlist_cache.set(key, setlist)
+            setlists[key[1]] = setlist
+    return SetlistHistory(concert_id, latest_version, setlists)
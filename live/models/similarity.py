@@ -0,0 +1,384 @@
+""" "Similar shows": concerts whose latest setlists share the most songs.
+
+Comparing every pair of setlists is quadratic in the number of concerts, so
+candidates are found with MinHash and locality sensitive hashing instead.
+Each setlist (as a set of song ids) gets a signature of `NUM_PERMUTATIONS`
+minimum hash values; two signatures agree at any position with probability
+equal to the Jaccard similarity of their setlists. Signatures are split
+into `NUM_BANDS` bands, and concerts that agree on every value of a band
+share that band's LSH bucket. With 32 bands of 3 rows, pairs with a
+similarity of 0.3 share a bucket 58% of the time and pairs above 0.5
+nearly always do, while most dissimilar pairs never meet. Only concerts
+sharing a bucket are compared, using the exact similarity of their sets.
+
+Signatures and band keys only depend on a concert's own setlist, so they
+are built offline (see #build_signatures and `flask build-similar-shows`)
+and stored in `setlist_minhash`. Each process loads an artist's index from
+there on first use and keeps it until the artist's version in
+`setlist_minhash_versions` changes, which every build bumps (see
+sql/010_setlist_minhash_versions.sql and #SimilarShows). `bench.similarity`
+measures recall against exact Jaccard.
+"""
+import itertools
+import threading
+import time
+
+import numpy
+
+from live.models import (
+        concert,
+        setlist)
+
+NUM_PERMUTATIONS = 96
+NUM_BANDS = 32
+ROWS_PER_BAND = NUM_PERMUTATIONS // NUM_BANDS
+DEFAULT_SIMILAR_SHOWS_LIMIT = 5
+DEFAULT_INDEX_VERSION_TTL_SECONDS = 30
+
+# Hash functions are (a * x + b) mod p, for a fixed set of a and b so that
+# signatures built at different times can be compared
+_PRIME = (1 << 31) - 1
+_HASH_SEED = 1991
+_rng = numpy.random.RandomState(_HASH_SEED)
+_HASH_A = _rng.randint(1, _PRIME, size=NUM_PERMUTATIONS).astype(numpy.int64)
+_HASH_B = _rng.randint(0, _PRIME, size=NUM_PERMUTATIONS).astype(numpy.int64)
+# Odd multiplier used to fold a band's rows into a single key
+_BAND_MULTIPLIER = numpy.uint64(0x9E3779B97F4A7C15)
+
+# Concerts whose setlists are read at once when building signatures
+BUILD_BATCH_SIZE = 1000
+
+
+def minhash_signature(song_ids):
+    """ Computes the MinHash signature of a set of song ids.
+
+    Args:
+        song_ids: iterable of song ids
+
+    Returns:
+        numpy array of `NUM_PERMUTATIONS` ints, or None for an empty set
+    """
+    song_ids = numpy.fromiter(set(song_ids), dtype=numpy.int64)
+    if not len(song_ids):
+        return None
+    hashes = (_HASH_A[:, None] * song_ids[None, :] + _HASH_B[:, None]) % _PRIME
+    return hashes.min(axis=1)
+
+
+def band_keys(signature):
+    """ Folds each band of a signature into a single 64 bit key.
+
+    Returns:
+        list of `NUM_BANDS` ints
+    """
+    bands = numpy.asarray(signature, dtype=numpy.uint64).reshape(
+            NUM_BANDS, ROWS_PER_BAND)
+    keys = numpy.zeros(NUM_BANDS, dtype=numpy.uint64)
+    for row in range(ROWS_PER_BAND):
+        # Wraps around, which is what we want
+        keys = keys * _BAND_MULTIPLIER + bands[:, row]
+    return keys.view(numpy.int64).tolist()
+
+
+def get_setlist_song_sets(cur, concert_ids):
+    """ Gets the songs of the latest setlists of concerts.
+
+    Args:
+        cur: database cursor
+        concert_ids: list of concert ids
+
+    Returns:
+        dictionary of concert id to a frozenset of song ids. Concerts
+        without any songs in their latest setlist are left out.
+    """
+    song_sets = {}
+    for start in range(0, len(concert_ids), BUILD_BATCH_SIZE):
+        setlists = setlist.get_latest_setlists_for_concerts(
+                cur, concert_ids[start:start + BUILD_BATCH_SIZE])
+        for concert_id, setlist_inst in setlists.items():
+            songs = frozenset(
+                song.song_id for song in setlist_inst.setlist_songs)
+            if songs:
+                song_sets[concert_id] = songs
+    return song_sets
+
+
+def build_signatures(cur, artist_id=None, concert_id=None):
+    """ (Re)builds rows in `setlist_minhash`, and bumps the version of
+    every artist whose rows were rebuilt.
+
+    If a concert id is given only that concert's signature is rebuilt,
+    which is all that changes when it gets a new setlist version.
+    Otherwise every concert of the artist (or every concert, if no artist
+    is given) is rebuilt.
+
+    Note: the caller is responsible for committing.
+
+    Args:
+        cur: database cursor with write access
+        artist_id: optional id of the artist to build signatures for
+        concert_id: optional id of the concert whose setlist changed
+
+    Returns:
+        the number of signatures written
+    """
+    if concert_id is not None:
+        where = "where concert_id = %s"
+        params = (concert_id,)
+    elif artist_id is not None:
+        where = "where artist_id = %s"
+        params = (artist_id,)
+    else:
+        where = ""
+        params = ()
+    cur.execute("""
+        select concert_id, artist_id
+        from concerts
+        %s
+        order by concert_id""" % (where,), params)
+    artist_ids = {
+        row.get('concert_id'): row.get('artist_id')
+        for row in cur.fetchall()}
+    concert_ids = list(artist_ids)
+    song_sets = get_setlist_song_sets(cur, concert_ids)
+
+    rows = []
+    for concert_id, songs in song_sets.items():
+        signature = minhash_signature(songs)
+        rows.append((
+            concert_id,
+            artist_ids[concert_id],
+            sorted(songs),
+            signature.tolist(),
+            band_keys(signature)))
+    # Concerts that lost their setlist shouldn't keep a stale signature
+    cur.execute(
+        "delete from setlist_minhash where concert_id = any(%s)",
+        (concert_ids,))
+    for start in range(0, len(rows), BUILD_BATCH_SIZE):
+        args = ','.join(
+            cur.mogrify("(%s, %s, %s, %s, %s)", row).decode('utf-8')
+            for row in rows[start:start + BUILD_BATCH_SIZE])
+        cur.execute("""
+            insert into setlist_minhash
+                (concert_id, artist_id, song_ids, signature, band_keys)
+            values """ + args)
+    if artist_ids:
+        cur.execute("""
+            insert into setlist_minhash_versions (artist_id, version)
+            select artist_id, 1
+            from unnest(%s::integer[]) as artist_id
+            on conflict (artist_id) do update
+            set version = setlist_minhash_versions.version + 1""",
+            (sorted(set(artist_ids.values())),))
+    return len(rows)
+
+
+def get_index_versions(cur):
+    """ Gets the version of every artist's stored signatures.
+
+    Returns:
+        dictionary of artist id to version. Artists whose signatures
+        were never built are left out.
+    """
+    cur.execute("select artist_id, version from setlist_minhash_versions")
+    return {row.get('artist_id'): row.get('version') for row in cur.fetchall()}
+
+
+class SimilarShowsIndex:
+    """ An in memory LSH index of an artist's setlists.
+    """
+
+    def __init__(self, rows):
+        """
+        Args:
+            rows: rows of `setlist_minhash`, with concert_id, song_ids and
+                  band_keys keys
+        """
+        self.concert_ids = numpy.array(
+                [row.get('concert_id') for row in rows], dtype=numpy.int64)
+        self._rows = {
+            concert_id: i
+            for i, concert_id in enumerate(self.concert_ids.tolist())}
+        # Setlists as rows of a concert by song matrix, so candidates can
+        # be scored all at once
+        song_lists = [row.get('song_ids') for row in rows]
+        song_ids = numpy.unique(numpy.fromiter(
+                itertools.chain.from_iterable(song_lists), dtype=numpy.int64))
+        self._songs = numpy.zeros((len(rows), len(song_ids)), dtype=bool)
+        for i, songs in enumerate(song_lists):
+            self._songs[i, numpy.searchsorted(song_ids, songs)] = True
+        self._sizes = self._songs.sum(axis=1)
+        self._band_keys = [row.get('band_keys') for row in rows]
+        buckets = [{} for _ in range(NUM_BANDS)]
+        for i, keys in enumerate(self._band_keys):
+            for band, key in enumerate(keys):
+                buckets[band].setdefault(key, []).append(i)
+        # Only buckets with more than one concert can produce candidates
+        self._buckets = [
+            {key: numpy.array(members, dtype=numpy.int64)
+             for key, members in band.items() if len(members) > 1}
+            for band in buckets]
+
+    def __len__(self):
+        return len(self.concert_ids)
+
+    def candidates(self, concert_id):
+        """ Gets the concerts sharing at least one bucket with a concert.
+
+        Returns:
+            numpy array of row numbers, without the concert itself
+        """
+        row = self._rows.get(concert_id)
+        if row is None:
+            return numpy.array([], dtype=numpy.int64)
+        found = [
+            self._buckets[band][key]
+            for band, key in enumerate(self._band_keys[row])
+            if key in self._buckets[band]]
+        if not found:
+            return numpy.array([], dtype=numpy.int64)
+        candidates = numpy.unique(numpy.concatenate(found))
+        return candidates[candidates != row]
+
+    def similar(self, concert_id, limit=DEFAULT_SIMILAR_SHOWS_LIMIT):
+        """ Gets the concerts with the most similar setlists to a concert.
+
+        Args:
+            concert_id: id of the concert
+            limit: maximum number of concerts to return
+
+        Returns:
+            list of (concert id, Jaccard similarity) tuples, most similar
+            first (earliest concert first among equals)
+        """
+        candidates = self.candidates(concert_id)
+        if not len(candidates):
+            return []
+        row = self._rows[concert_id]
+        intersections = (self._songs[candidates] & self._songs[row]).sum(axis=1)
+        similarities = intersections / (
+                self._sizes[candidates] + self._sizes[row] - intersections)
+        order = numpy.lexsort(
+                (self.concert_ids[candidates], -similarities))[:limit]
+        return [
+            (int(self.concert_ids[candidates[i]]), float(similarities[i]))
+            for i in order]
+
+
+def load_index(cur, artist_id):
+    """ Loads an artist's stored setlists and band keys into a
+    #SimilarShowsIndex.
+    """
+    cur.execute("""
+        select concert_id,
+               song_ids,
+               band_keys
+        from setlist_minhash
+        where artist_id = %s
+        order by concert_id""", (artist_id,))
+    return SimilarShowsIndex(cur.fetchall())
+
+
+class SimilarShows:
+    """ Process-wide #SimilarShowsIndex of each artist, loaded on first use
+    and kept until the artist's signatures are rebuilt. Versions are
+    checked at most every `ttl` seconds.
+    """
+
+    def __init__(self, ttl=DEFAULT_INDEX_VERSION_TTL_SECONDS):
+        """
+        Args:
+            ttl: how many seconds to go without checking the versions
+        """
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._indexes = {}
+        self._versions = None
+        self._checked_at = 0
+        self.hits = 0
+        self.loads = 0
+
+    def _versions_for(self, cur):
+        with self._lock:
+            if (self._versions is not None
+                    and time.monotonic() - self._checked_at <= self.ttl):
+                return self._versions
+        versions = get_index_versions(cur)
+        with self._lock:
+            self._versions = versions
+            self._checked_at = time.monotonic()
+        return versions
+
+    def get(self, cur, artist_inst):
+        """ Returns the index of an artist, reloading it first if its
+        signatures were rebuilt.
+
+        Args:
+            cur: database cursor
+            artist_inst: an instance of an Artist object
+
+        Returns:
+            SimilarShowsIndex
+        """
+        version = self._versions_for(cur).get(artist_inst.artist_id)
+        with self._lock:
+            entry = self._indexes.get(artist_inst.artist_id)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                return entry[1]
+        index = load_index(cur, artist_inst.artist_id)
+        with self._lock:
+            self._indexes[artist_inst.artist_id] = (version, index)
+            self.loads += 1
+        return index
+
+    def clear(self):
+        with self._lock:
+            self._indexes = {}
+            self._versions = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "artists": len(self._indexes),
+                "concerts": sum(
+                    len(index) for _, index in self._indexes.values()),
+                "hits": self.hits,
+                "loads": self.loads,
+            }
+
+
+similar_shows = SimilarShows()
+
+
+def get_similar_concerts(
+        cur,
+        artist_inst,
+        concert_id,
+        limit=DEFAULT_SIMILAR_SHOWS_LIMIT,
+        loaders=None):
+    """ Gets the concerts with the most similar setlists to a concert.
+
+    Args:
+        cur: database cursor
+        artist_inst: an instance of an Artist object
+        concert_id: id of the concert
+        limit: maximum number of concerts to return
+        loaders: optional #Loaders of the current request to get the
+                 concerts through
+
+    Returns:
+        list of (Concert, Jaccard similarity) tuples, most similar first
+    """
+    similar = similar_shows.get(cur, artist_inst).similar(
+            concert_id, limit)
+    similar_ids = [similar_id for similar_id, _ in similar]
+    if loaders is not None:
+        concerts = loaders.concerts.load_dict(similar_ids)
+    else:
+        concerts = concert.get_concerts_by_ids(cur, similar_ids)
+    return [
+        (concerts[similar_id], similarity)
+        for similar_id, similarity in similar
+        if similar_id in concerts]
@@ -1,9 +1,25 @@
-from live.models import concert
+from live.models import (
+        analytics,
+        concert)
 
 class Song:
     """ Encapsulates all information given a song.
     """
 
+    __slots__ = (
+        'artist_id',
+        'song_id',
+        'title',
+        'notes',
+        '_lyrics',
+        'original_song_id',
+        'original_artist_name',
+        'song_url',
+        'song_order',
+        'concerts',
+        'concert_count',
+        'stats')
+
     def __init__(
             self,
             artist_id=None,
@@ -18,7 +34,7 @@ class Song:
             concert_count=0,
             row=None):
         """
-        Note: the lstrip at the bottom for the lyrics is due to the way I
+        Note: lyrics are lstripped when read (see #lyrics) due to the way I
         entered these into the database.
 
         Args:
@@ -44,7 +60,7 @@ class Song:
             self.song_id = row.get("song_id")
             self.title = row.get("title")
             self.notes = row.get("notes")
-            self.lyrics = row.get("lyrics")
+            self._lyrics = row.get("lyrics")
             self.original_song_id = row.get("original_song_id")
             self.original_artist_name = row.get("original_artist_name")
             self.song_url = row.get("song_url")
@@ -54,32 +70,81 @@ class Song:
             self.song_id = song_id
             self.title = title
             self.notes = notes
-            self.lyrics = lyrics
+            self._lyrics = lyrics
             self.original_song_id = original_song_id
             self.song_url = song_url
             self.song_order = song_order
             self.original_artist_name = original_artist_name
 
-        if self.lyrics is not None:
-            self.lyrics = self.lyrics.lstrip()
-
-        self.concerts = []
+        self.concerts = None
         self.concert_count = concert_count
+        self.stats = None
 
-    def add_concerts(self, concerts):
-        """ Adds concerts that this song was played at.
+    @property
+    def lyrics(self):
+        if self._lyrics is None:
+            return None
+        return self._lyrics.lstrip()
+
+    def add_stats(self, stats):
+        """ Adds the song's precomputed #analytics.SongStats.
 
         Note: this also updates concert count.
         """
-        if not concerts:
-            return
-        self.concerts = concerts
-        self.concert_count = len(concerts)
+        self.stats = stats
+        self.concert_count = stats.concert_count
 
 
-def get_complete_song_info(cur, artist_inst, song_url):
+def get_complete_song_info(cur, artist_inst, song_url, version):
     """ Gets complete information about a song given its human friendly
-    url.
+    url, along with its precomputed performance statistics.
+
+    Args:
+        cur: database cursor
+        artist_inst: an instance of an Artist object
+        song_url: the unique identifier for that song
+        version: the current data version, see #analytics.SetlistAnalytics
+
+    Returns:
+        instance of #Song if the song exists, None otherwise
+    """
+    song_inst = get_song_info(cur, artist_inst, song_url)
+    if not song_inst:
+        return None
+    song_inst.add_stats(analytics.setlist_analytics.get(
+        cur, artist_inst, version).song_stats(song_inst.song_id))
+    return song_inst
+
+
+def get_first_and_latest_performances(cur, song_inst, loaders=None):
+    """ Gets the first and latest concerts a song was played at, as found
+    by #get_complete_song_info.
+
+    Args:
+        cur: database cursor
+        song_inst: instance of #Song with stats
+        loaders: optional #Loaders of the current request to get the
+                 concerts through
+
+    Returns:
+        tuple of (first concert, latest concert), both None if the song
+        was never played
+    """
+    stats = song_inst.stats
+    if stats is None or stats.first_concert_id is None:
+        return None, None
+    concert_ids = [stats.first_concert_id, stats.last_concert_id]
+    if loaders is not None:
+        concerts = loaders.concerts.load_dict(concert_ids)
+    else:
+        concerts = concert.get_concerts_by_ids(cur, concert_ids)
+    return (concerts.get(stats.first_concert_id),
+            concerts.get(stats.last_concert_id))
+
+
+def get_song_info(cur, artist_inst, song_url):
+    """ Gets information about a song given its human friendly url, without
+    the concerts it was played at.
 
     Args:
         cur: database cursor
@@ -87,7 +152,7 @@ def get_complete_song_info(cur, artist_inst, song_url):
         song_url: the unique identifier for that song
 
     Returns:
-        instance of #Song if the song exists, song otherwise
+        instance of #Song if the song exists, None otherwise
     """
     cur.execute("""
          select s.title,
@@ -107,18 +172,12 @@ def get_complete_song_info(cur, artist_inst, song_url):
     song_info = cur.fetchone()
     if not song_info:
         return None
-
-    song_inst = Song(row=song_info)
-    concerts = concert.get_concerts_with_song(
-            cur, artist_inst, song_inst.song_id)
-    song_inst.add_concerts(concerts)
-    return song_inst
+    return Song(row=song_info)
 
 
 def get_all_for_artist(cur, artist_inst):
-    """ Gets all songs, as well as their performance counts, for an artist
-
-    Note: this is potentially expensive, we can probably cache this.
+    """ Gets all songs, as well as their performance counts, for an artist.
+    Counts are precomputed, see `flask refresh-song-counts`.
 
     Args:
         cur: database cursor
@@ -130,3 +189,26 @@ def get_all_for_artist(cur, artist_inst):
     if not artist_inst:
         return []
     return concert.get_count_of_concerts_for_all_songs(cur, artist_inst)
+
+
+def get_all_for_artist_with_stats(cur, artist_inst, version):
+    """ Gets all songs for an artist along with their precomputed
+    performance statistics.
+
+    Args:
+        cur: database cursor
+        artist_inst: an instance of an Artist object
+        version: the current data version, see #analytics.SetlistAnalytics
+
+    Returns:
+        list of songs sorted by performance count
+    """
+    songs = get_all_for_artist(cur, artist_inst)
+    if not songs:
+        return songs
+    artist_analytics = analytics.setlist_analytics.get(
+            cur, artist_inst, version)
+    for song_inst in songs:
+        song_inst.add_stats(artist_analytics.song_stats(song_inst.song_id))
+    songs.sort(key=lambda s: (-s.concert_count, s.title))
+    return songs
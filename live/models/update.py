@@ -36,6 +36,18 @@ class Update:
 
 def get_recent_updates(cur, limit=None):
     """ Gets recent updates
+    Args:
+        cur: a cursor to the database
+        limit: how many updates we want to fetch. If none fetches all updates
+    """
+    return list(iter_recent_updates(cur, limit=limit))
+
+
+def iter_recent_updates(cur, limit=None):
+    """ Lazily yields recent updates. Nothing is executed until the first
+    update is requested. With a server side cursor this never holds more
+    than a batch of rows in memory.
+
     Args:
         cur: a cursor to the database
         limit: how many updates we want to fetch. If none fetches all updates
@@ -59,9 +71,50 @@ def get_recent_updates(cur, limit=None):
 	join artists as a on c.artist_id = a.artist_id
 	order by u.update_date desc, c.concert_friendly_url
     %s""" % (limit_str))
-    res = []
-    updates = cur.fetchall()
-    for update_row in updates:
-        update = Update(row=update_row)
-        res.append(update)
-    return res
+    for update_row in cur:
+        yield Update(row=update_row)
+
+
+def get_data_version(cur):
+    """ Gets a value that changes whenever the site's data changes. Since
+    every editorial change gets an entry in the updates table, the latest
+    update plus the number of updates is good enough.
+
+    Args:
+        cur: a cursor to the database
+
+    Returns:
+        a tuple that can be compared to previous versions
+    """
+    cur.execute("""
+        select max(update_date) as latest_update,
+               count(*) as update_count
+        from updates""")
+    row = cur.fetchone()
+    return (row.get('latest_update'), row.get('update_count'))
+
+
+def get_concerts_updated_since(cur, since=None):
+    """ Gets the ids of concerts that have had updates since a given date.
+
+    Args:
+        cur: a cursor to the database
+        since: only include updates on or after this date. If None all
+               updates are included.
+
+    Returns:
+        tuple of (set of concert ids, date of the latest update or None if
+        there were no updates)
+    """
+    cur.execute("""
+        select u.concert_id,
+               u.update_date
+        from updates as u
+        where %s is null or u.update_date >= %s""", (since, since))
+    concert_ids = set()
+    latest_update = None
+    for row in cur.fetchall():
+        concert_ids.add(row.get('concert_id'))
+        if latest_update is None or row.get('update_date') > latest_update:
+            latest_update = row.get('update_date')
+    return concert_ids, latest_update
@@ -1,4 +1,9 @@
 class Venue:
+    """ A venue, along with its location. Like locations, venues are shared
+    (see #get_venue), so treat them as immutable.
+    """
+
+    __slots__ = ('venue_name', 'location')
 
     def __init__(self, venue_name, location):
         """ Initializes venue information.
@@ -9,3 +14,22 @@ class Venue:
         """
         self.venue_name = venue_name
         self.location = location
+
+
+# Flyweights, keyed by the venue name and its location
+_venues = {}
+
+
+def get_venue(venue_name, location):
+    """ Gets the shared Venue for a name at a location, creating it on first
+    use.
+
+    Args:
+        venue_name: the name of the venue
+        location: a Location, ideally from #get_location
+    """
+    key = (venue_name, location.country, location.state, location.city)
+    venue = _venues.get(key)
+    if venue is None:
+        venue = _venues.setdefault(key, Venue(venue_name, location))
+    return venue
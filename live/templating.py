@@ -0,0 +1,71 @@
+""" Template helpers.
+"""
+from flask import (
+        current_app,
+        stream_with_context)
+
+from live import instrumentation
+from live.database import (
+        detach_db,
+        release_db)
+
+# Jinja yields tiny fragments; group them so we don't write to the socket
+# for every one of them.
+STREAM_BUFFER_SIZE = 64
+
+
+def template_stream(template_name, context):
+    """ Renders a template lazily, as an iterable of chunks of the page.
+    This needs an app context for as long as it's iterated over.
+
+    Args:
+        template_name: the name of the template to render
+        context: variables to make available in the template
+    """
+    app = current_app._get_current_object()
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    stream = template.stream(context)
+    stream.enable_buffering(STREAM_BUFFER_SIZE)
+    return stream
+
+
+def stream_template(template_name, **context):
+    """ Renders a template as a streamed response. The page is sent to the
+    client as it renders, so iterables in the context (ie, generators
+    reading from a server side cursor) are consumed lazily and the client
+    gets the top of the page right away.
+
+    The request's database connection is handed over to the stream and
+    returned to the pool when the response is closed, whether or not the
+    page was sent (HEAD requests and clients that go away never read it),
+    so any cursors the template reads from must be created before calling
+    this.
+
+    Args:
+        template_name: the name of the template to render
+        context: variables to make available in the template
+
+    Returns:
+        a streamed Response
+    """
+    app = current_app._get_current_object()
+    stream = template_stream(template_name, context)
+    conn = detach_db()
+    query_log = instrumentation.detach_query_log()
+
+    response = app.response_class(
+            stream_with_context(stream), mimetype='text/html')
+
+    # Runs after the body has been closed, so no cursor is still reading
+    # from the connection by then. The request's context is gone at that
+    # point, hence the app context for reporting.
+    @response.call_on_close
+    def release():
+        if conn is not None:
+            release_db(conn)
+        if query_log is not None:
+            with app.app_context():
+                instrumentation.report(query_log)
+
+    return response
@@ -1,3 +1,62 @@
-from flask import Blueprint, request
+from flask import (
+        abort,
+        render_template,
+        request,
+        Blueprint)
+
+from live.cache import cached_page
+from live.database import get_dict_cursor
+from live.loaders import get_loaders
+from live.models import (
+        artist,
+        sequence,
+        song)
 
 blueprint = Blueprint('artist', __name__)
+
+# Longer sequences are cut short, there's no show to find anyway
+MAX_SEQUENCE_LENGTH = 10
+
+
+@blueprint.route('/artists/<artist_name>/sequences')
+@cached_page(args=('song', 'opening'))
+def sequences_get_by_artist(artist_name):
+    """ Finds the shows where songs were played back to back, in the order
+    given by the `song` query parameters (song urls). With `opening` set,
+    only shows that opened with the songs are found.
+
+    Args:
+        artist_name: short name of the artist
+    """
+    cur = get_dict_cursor()
+    artist_inst = artist.get_artist_from_short_name(cur, artist_name)
+    if not artist_inst:
+        abort(404)
+
+    song_urls = [
+        url for url in request.args.getlist('song') if url
+    ][:MAX_SEQUENCE_LENGTH]
+    opening = bool(request.args.get('opening'))
+
+    concerts = None
+    if len(song_urls) >= sequence.MIN_SEQUENCE_LENGTH:
+        song_ids = sequence.get_song_ids(cur, artist_inst, song_urls)
+        concerts = []
+        if song_ids is not None:
+            concerts = sequence.get_concerts_with_sequence(
+                    cur, artist_inst, song_ids, opening,
+                    loaders=get_loaders())
+
+    songs = sorted(
+            song.get_all_for_artist(cur, artist_inst), key=lambda s: s.title)
+    # One more picker than songs chosen so far, so sequences can be extended
+    pickers = max(sequence.MAX_NGRAM_LENGTH, len(song_urls) + 1)
+
+    return render_template(
+            "sequences.html",
+            artist=artist_inst,
+            songs=songs,
+            song_urls=song_urls,
+            pickers=min(pickers, MAX_SEQUENCE_LENGTH),
+            opening=opening,
+            concerts=concerts)
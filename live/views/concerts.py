@@ -2,30 +2,49 @@ import re
 
 from flask import (
         abort,
+        current_app,
         render_template,
         request,
         Blueprint)
 
-from live.database import get_dict_cursor
+from live.cache import (
+        cached_page,
+        data_version)
+from live.database import (
+        get_dict_cursor,
+        get_named_dict_cursor)
+from live.fanout import fan_out
+from live.loaders import get_loaders
 from live.models import (
         artist,
         concert,
         media,
-        recording)
+        recording,
+        setlist,
+        similarity)
+from live.templating import stream_template
 
 blueprint = Blueprint('concerts', __name__)
 
 
-@blueprint.route('/artists/<artist_name>/concerts')
-def concerts_get_by_artist(artist_name):
-    """ Gets all concerts for a given artist. Note that we optionally
-    accept the following query parameters:
+def parse_year(year_param):
+    """ Gets the year out of the `year` query parameter.
+
+    Returns:
+        the year as a string, or None if there isn't one
+    """
+    if year_param is None:
+        return None
+    year_match = re.match(r'.*([1-3][0-9]{3})', year_param)
+    if year_match is None:
+        return None
+    return year_match.group(1)
 
-    - year: if year is specified, we filter dates to that year
 
-    If the year is specified, we need to manually find all years active
-    for an artist such that we can display them. Otherwise, if we are showing
-    all concerts, we can re-use the result set and mine the year from that.
+def concerts_get_by_artist_page(artist_name):
+    """ Gets the template and context of a page of an artist's concerts,
+    see #concerts_get_by_artist. Concerts are read from a server side
+    cursor as the page renders. Shared with the ASGI app.
 
     Args:
         artist_name: the "short" artist name.
@@ -35,44 +54,126 @@ def concerts_get_by_artist(artist_name):
     if not artist_inst:
         abort(404)
 
-    generate_year_filters = True
-    year = None
-    year_param = request.args.get('year')
-    year_filters = set()
+    year = parse_year(request.args.get('year'))
 
-    if year_param is not None:
-        year_match = re.match(r'.*([1-3][0-9]{3})', year_param)
-        if year_match is not None:
-            year = year_match.group(1)
-            year_filters = concert.get_years_of_concerts_for_artist(
-                    cur, artist_inst)
+    # The filter bar comes from memory, so the listing itself is the only
+    # query (a range scan on the (artist_id, date) index when filtered).
+    year_filters = concert.year_facets.get(
+            cur, artist_inst, data_version.get())
 
-    concert_listings = concert.get_all_for_artist_listing_only(
-            cur,
+    sort = concert.parse_listing_sort(request.args.get('sort'))
+    after = concert.parse_listing_cursor(request.args.get('after'), sort)
+    page = concert.get_listing_page(
+            get_named_dict_cursor("concert_listing"),
             artist_inst,
+            current_app.config.get("CONCERT_LISTING_PAGE_SIZE"),
+            after=after,
+            sort=sort,
             year=year)
 
-    if generate_year_filters:
-        for concert_listing in concert_listings:
-            if concert_listing.date:
-                concert_listing_year = concert_listing.date.year
-                if concert_listing_year not in year_filters:
-                    year_filters.add(concert_listing_year)
+    return "concerts_get_by_artist.html", dict(
+            artist=artist_inst,
+            concerts=page,
+            page=page,
+            year=year,
+            sort=sort,
+            year_filters=year_filters)
 
 
-    return render_template(
-            "concerts_get_by_artist.html",
+@blueprint.route('/artists/<artist_name>/concerts')
+@cached_page(args=('year', 'sort', 'after'))
+def concerts_get_by_artist(artist_name):
+    """ Gets concerts for a given artist, a page at a time. The page is
+    streamed, with concerts read from a server side cursor as they're
+    rendered. Note that we optionally accept the following query
+    parameters:
+
+    - year: if year is specified, we filter dates to that year
+    - sort: "rarity" lists the rarest concerts first, otherwise concerts
+      are listed by date
+    - after: the cursor of the previous page, if any
+
+    Args:
+        artist_name: the "short" artist name.
+    """
+    template, context = concerts_get_by_artist_page(artist_name)
+    return stream_template(template, **context)
+
+
+def concert_page(artist_name, concert_friendly_url):
+    """ Gets the template and context of a concert's page, see
+    #concerts_get_by_artist_and_concert_friendly_url. Shared with the
+    ASGI app.
+
+    Args:
+        artist_name: the "short" artist name.
+        concert_friendly_url: a unique identifier for this concert
+    """
+    cur = get_dict_cursor()
+    artist_inst = artist.get_artist_from_short_name(cur, artist_name)
+    if not artist_inst:
+        abort(404)
+
+    concert_inst = concert.get_for_artist_and_url(
+            cur, artist_inst, concert_friendly_url, False, False)
+    if not concert_inst:
+        abort(404)
+
+    concert_id = concert_inst.concert_id
+    details = fan_out({
+        'setlist': (setlist.get_setlist_version,
+                    concert_id, concert_inst.setlist_version,
+                    concert_inst.setlist_complete),
+        'media': (media.get_all_media_for_concert, concert_id),
+        'recordings': (recording.get_all_recordings_for_concert, concert_id),
+    })
+    concert_inst.setlist = details['setlist']
+
+    loaders = get_loaders()
+    loaders.concerts.prime(concert_id, concert_inst)
+    # Queued so they're loaded in the same batch as the similar concerts
+    loaders.concerts.queue(
+            i for i in concert_inst.neighbour_ids if i is not None)
+    similar_concerts = similarity.get_similar_concerts(
+            cur, artist_inst, concert_id,
+            current_app.config["SIMILAR_SHOWS_LIMIT"], loaders=loaders)
+    concert_inst.concerts_before_after = concert.load_concerts_before_after(
+            cur, concert_inst, loaders=loaders)
+
+    return "concert.html", dict(
             artist=artist_inst,
-            concerts=concert_listings,
-            year_filters=sorted(year_filters))
+            concert=concert_inst,
+            media=details['media'],
+            recordings=details['recordings'],
+            similar_concerts=similar_concerts)
 
 
 @blueprint.route('/artists/<artist_name>/concerts/<concert_friendly_url>')
+@cached_page
 def concerts_get_by_artist_and_concert_friendly_url(
         artist_name,
         concert_friendly_url):
     """ Gets a single concert as determined from the artist and the
-    concert friendly url.
+    concert friendly url. Independent lookups are run concurrently (see
+    #fan_out), and the neighbouring and similar concerts are fetched in
+    one batch through the request's #Loaders.
+
+    Args:
+        artist_name: the "short" artist name.
+        concert_friendly_url: a unique identifier for this concert
+    """
+    template, context = concert_page(artist_name, concert_friendly_url)
+    return render_template(template, **context)
+
+
+@blueprint.route(
+        '/artists/<artist_name>/concerts/<concert_friendly_url>/history')
+@cached_page(args=('version',))
+def concert_setlist_history(artist_name, concert_friendly_url):
+    """ Shows one version of a concert's setlist at a time, with links to
+    every other version. The `version` query parameter picks the version,
+    defaulting to the latest. Older versions are rebuilt from deltas, see
+    #setlist.get_setlist_history.
 
     Args:
         artist_name: the "short" artist name.
@@ -84,22 +185,31 @@ def concerts_get_by_artist_and_concert_friendly_url(
         abort(404)
 
     concert_inst = concert.get_for_artist_and_url(
-            cur,
-            artist_inst,
-            concert_friendly_url)
+            cur, artist_inst, concert_friendly_url, False, False)
     if not concert_inst:
         abort(404)
 
-    # Maybe move this inside media
-    stored_media = media.get_all_media_for_concert(
-            cur, concert_inst.concert_id)
+    history = setlist.get_setlist_history(cur, concert_inst.concert_id)
+    if not history:
+        abort(404)
+    version = request.args.get('version', type=int)
+    selected = history.get(
+            history.latest_version if version is None else version)
+    if not selected:
+        abort(404)
 
-    recordings = recording.get_all_recordings_for_concert(
-            cur, concert_inst.concert_id)
+    latest = history.latest()
+    latest_song_ids = {song.song_id for song in latest.setlist_songs}
+    selected_song_ids = {song.song_id for song in selected.setlist_songs}
+    added_later = [
+        song for song in latest.setlist_songs
+        if song.song_id not in selected_song_ids]
 
     return render_template(
-            "concert.html",
+            "setlist_history.html",
             artist=artist_inst,
             concert=concert_inst,
-            media=stored_media,
-            recordings=recordings)
+            history=history,
+            setlist=selected,
+            latest_song_ids=latest_song_ids,
+            added_later=added_later)
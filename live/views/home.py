@@ -4,20 +4,24 @@ from flask import (
         render_template,
         request)
 
-from live.database import get_dict_cursor
+from live.cache import cached_page
+from live.database import (
+        get_dict_cursor,
+        get_named_dict_cursor)
 from live.models import (
         artist,
         concert,
         era,
         update)
+from live.templating import stream_template
 
 blueprint = Blueprint('home', __name__)
 
 
 
-@blueprint.route('/')
-def home():
-    """ Renders the home page.
+def home_page():
+    """ Gets the home page's template and context. Shared with the ASGI
+    app, see `live.asgi`.
     """
     cur = get_dict_cursor()
     primary_short_name = current_app.config.get(
@@ -31,23 +35,38 @@ def home():
         upcoming_concerts = concert.get_upcoming_concerts(
                 cur, artist_inst, limit=10)
     recent_updates = update.get_recent_updates(cur, limit=15)
-    return render_template(
-            "home.html",
+    return "home.html", dict(
             artist=artist_inst,
             concerts=upcoming_concerts,
             eras=eras,
             updates=recent_updates)
 
 
+@blueprint.route('/')
+@cached_page
+def home():
+    """ Renders the home page.
+    """
+    template, context = home_page()
+    return render_template(template, **context)
+
+
+def update_archive_page():
+    """ Gets the update archive's template and context. Updates are read
+    from a server side cursor as the page renders.
+    """
+    cur = get_named_dict_cursor("update_archive")
+    return "update_archive.html", dict(
+            updates=update.iter_recent_updates(cur))
+
+
 @blueprint.route('/update-archive')
 def update_achive():
-    """ Renders the update archive.
+    """ Renders the update archive. This is streamed since it grows with
+    every update.
     """
-    cur = get_dict_cursor()
-    recent_updates = update.get_recent_updates(cur)
-    return render_template(
-            "update_archive.html",
-            updates=recent_updates)
+    template, context = update_archive_page()
+    return stream_template(template, **context)
 
 
 @blueprint.route('/most-wanted')
@@ -0,0 +1,62 @@
+from flask import (
+        abort,
+        current_app,
+        render_template,
+        request,
+        Blueprint)
+
+from live.cache import cached_page
+from live.database import get_dict_cursor
+from live.models import search
+
+blueprint = Blueprint('search', __name__)
+
+# Longer queries are truncated, they only make the search slower
+MAX_QUERY_LENGTH = 200
+
+# Every match before a page is still ranked, so deep pages are slow (and
+# huge page numbers overflow the offset). Pages past this are not found.
+MAX_PAGE = 50
+
+
+def parse_page(page_param):
+    """ Parses the page number from the query string, defaulting to the
+    first page for anything that isn't a positive integer.
+    """
+    try:
+        page = int(page_param)
+    except (TypeError, ValueError):
+        return 1
+    return max(page, 1)
+
+
+@blueprint.route('/search')
+@cached_page(args=('q', 'page'))
+def search_get():
+    """ Searches songs, lyrics, concerts, venues and recordings, best
+    matches first.
+    """
+    query = request.args.get('q', '').strip()[:MAX_QUERY_LENGTH]
+    page = parse_page(request.args.get('page'))
+    if page > MAX_PAGE:
+        abort(404)
+    page_size = current_app.config["SEARCH_PAGE_SIZE"]
+
+    results = []
+    has_next = False
+    if query:
+        # One extra row tells us whether there is a next page
+        results = search.search(
+                get_dict_cursor(),
+                query,
+                limit=page_size + 1,
+                offset=(page - 1) * page_size)
+        has_next = len(results) > page_size and page < MAX_PAGE
+        results = results[:page_size]
+
+    return render_template(
+            "search.html",
+            query=query,
+            results=results,
+            page=page,
+            has_next=has_next)
@@ -4,18 +4,26 @@ from flask import (
         request,
         Blueprint)
 
-from live.database import get_dict_cursor
+from live.cache import (
+        cached_page,
+        data_version)
+from live.database import (
+        get_dict_cursor,
+        get_named_dict_cursor)
 from live.models import (
         artist,
         concert,
         song)
+from live.loaders import get_loaders
+from live.templating import stream_template
 
 blueprint = Blueprint('song', __name__)
 
 
-@blueprint.route('/artists/<artist_name>/songs/<song_url>')
-def song_get_by_artist_name(artist_name, song_url):
-    """ Gets song information by an artist and a song url.
+def song_page(artist_name, song_url):
+    """ Gets the template and context of a song's page, see
+    #song_get_by_artist_name. Performances are read from a server side
+    cursor as the page renders. Shared with the ASGI app.
 
     Args:
         artist_name: short name of the artist
@@ -26,29 +34,46 @@ def song_get_by_artist_name(artist_name, song_url):
     if not artist_inst:
         abort(404)
 
-    song_inst = song.get_complete_song_info(cur, artist_inst, song_url)
+    song_inst = song.get_complete_song_info(
+            cur, artist_inst, song_url, data_version.get())
     if not song_inst:
         abort(404)
 
-    first_performance = None
-    latest_performance = None
-    if song_inst.concerts and len(song_inst.concerts) > 0:
-        first_performance = song_inst.concerts[0]
-        latest_performance = song_inst.concerts[-1]
+    (first_performance,
+     latest_performance) = song.get_first_and_latest_performances(
+            cur, song_inst, loaders=get_loaders())
+
+    concerts = concert.iter_concerts_with_song(
+            get_named_dict_cursor("song_performances"),
+            artist_inst,
+            song_inst.song_id)
 
-    return render_template(
-            "song.html",
+    return "song.html", dict(
             artist=artist_inst,
-            concerts=song_inst.concerts,
+            concerts=concerts,
             song=song_inst,
             first_performance=first_performance,
             latest_performance=latest_performance)
 
 
+@blueprint.route('/artists/<artist_name>/songs/<song_url>')
+@cached_page
+def song_get_by_artist_name(artist_name, song_url):
+    """ Gets song information by an artist and a song url. Statistics are
+    precomputed (see `live.models.analytics`), the list of performances is
+    streamed from a server side cursor.
 
-@blueprint.route('/artists/<artist_name>/songs')
-def song_get_all_by_artist_name(artist_name):
-    """ Gets all songs as well as a count of their performances by artist.
+    Args:
+        artist_name: short name of the artist
+        song_url: the unique identifier for that song
+    """
+    template, context = song_page(artist_name, song_url)
+    return stream_template(template, **context)
+
+
+def songs_page(artist_name):
+    """ Gets the template and context of an artist's song list, see
+    #song_get_all_by_artist_name. Shared with the ASGI app.
 
     Args:
         artist_name: short name of the artist
@@ -58,14 +83,27 @@ def song_get_all_by_artist_name(artist_name):
     if not artist_inst:
         abort(404)
 
-    songs = song.get_all_for_artist(cur, artist_inst)
+    songs = song.get_all_for_artist_with_stats(
+            cur, artist_inst, data_version.get())
 
     max_performance_count = 0
     if len(songs) > 0:
         max_performance_count = songs[0].concert_count
 
-    return render_template(
-            "song_list_for_artist.html",
+    return "song_list_for_artist.html", dict(
             artist=artist_inst,
             songs=songs,
             max_performance_count=max_performance_count)
+
+
+@blueprint.route('/artists/<artist_name>/songs')
+@cached_page
+def song_get_all_by_artist_name(artist_name):
+    """ Gets all songs as well as a count of their performances by artist,
+    along with when each was last played.
+
+    Args:
+        artist_name: short name of the artist
+    """
+    template, context = songs_page(artist_name)
+    return render_template(template, **context)
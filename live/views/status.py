@@ -0,0 +1,31 @@
+from flask import (
+        Blueprint,
+        jsonify)
+
+from live.cache import page_cache
+from live.database import get_pool_stats
+from live.models import (
+        analytics,
+        artist,
+        concert,
+        dimension,
+        setlist,
+        similarity)
+
+blueprint = Blueprint('status', __name__)
+
+
+@blueprint.route('/status')
+def status():
+    """ Returns process level statistics as JSON. Note that these are per
+    worker process.
+    """
+    return jsonify(
+            analytics=analytics.setlist_analytics.stats(),
+            artist_registry=artist.registry.stats(),
+            db_pool=get_pool_stats(),
+            dimensions=dimension.dimensions.stats(),
+            page_cache=page_cache.stats(),
+            setlist_cache=setlist.setlist_cache.stats(),
+            similar_shows=similarity.similar_shows.stats(),
+            year_facets=concert.year_facets.stats())
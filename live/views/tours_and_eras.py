@@ -5,6 +5,7 @@ from flask import (
         render_template,
         request)
 
+from live.cache import cached_page
 from live.database import get_dict_cursor
 from live.models import (
         artist,
@@ -19,9 +20,14 @@ def tours():
     abort(404)
 
 
-@blueprint.route('/eras/<artist_name>/eras/<era_identifier>')
-def eras(artist_name, era_identifier):
-    """ Gets eras for a particular artist."""
+def era_page(artist_name, era_identifier):
+    """ Gets the template and context of an era's concert listing, see
+    #eras. Shared with the ASGI app.
+
+    Args:
+        artist_name: the "short" artist name.
+        era_identifier: identifies the era within the artist's eras
+    """
     cur = get_dict_cursor()
     artist_inst = artist.get_artist_from_short_name(cur, artist_name)
     if not artist_inst:
@@ -31,10 +37,21 @@ def eras(artist_name, era_identifier):
     if not era_inst:
         abort(404)
  
-    concert_listings = concert.get_all_for_era(cur, artist_inst, era_inst)
+    sort = concert.parse_listing_sort(request.args.get('sort'))
+    concert_listings = concert.get_all_for_era(
+            cur, artist_inst, era_inst, sort=sort)
     year_filters = set()
-    return render_template(
-            "concerts_get_by_artist.html",
+    return "concerts_get_by_artist.html", dict(
             artist=artist_inst,
             concerts=concert_listings,
+            sort=sort,
             year_filters=year_filters)
+
+
+@blueprint.route('/eras/<artist_name>/eras/<era_identifier>')
+@cached_page(args=('sort',))
+def eras(artist_name, era_identifier):
+    """ Gets eras for a particular artist. Concerts are listed by date, or
+    by rarity if the `sort` query parameter is "rarity"."""
+    template, context = era_page(artist_name, era_identifier)
+    return render_template(template, **context)
@@ -0,0 +1,20 @@
+-- Precomputed count of concerts each song was performed at, using the
+-- latest setlist version of every concert. Kept up to date with
+-- `flask refresh-song-counts`.
+create table if not exists song_performance_counts (
+    song_id integer primary key references songs (song_id) on delete cascade,
+    artist_id integer not null,
+    concert_count integer not null default 0
+);
+
+create index if not exists song_performance_counts_artist_id_idx
+    on song_performance_counts (artist_id, concert_count desc);
+
+-- Used to find the latest version of a concert's setlist
+create index if not exists concert_setlist_ordering_concert_id_version_idx
+    on concert_setlist_ordering (concert_id, version);
+
+create index if not exists concert_setlist_ordering_song_id_idx
+    on concert_setlist_ordering (song_id);
+
+grant select on song_performance_counts to rage_read_only_rl;
@@ -0,0 +1,4 @@
+-- Concert listings filter by artist and a range of dates (ie a year), and
+-- are ordered by (date, concert_id) for keyset pagination.
+create index if not exists concerts_artist_id_date_idx
+    on concerts (artist_id, date, concert_id);
@@ -0,0 +1,71 @@
+-- Denormalized copy of the latest setlist version of every concert, so
+-- song lookups don't have to work out each concert's latest version from
+-- the whole of concert_setlist_ordering. Kept up to date by triggers on
+-- concert_setlist_ordering whenever a setlist version is written.
+create table if not exists latest_setlist_songs (
+    concert_id integer not null references concerts (concert_id) on delete cascade,
+    song_id integer not null references songs (song_id) on delete cascade,
+    song_order integer not null,
+    version integer not null
+);
+
+create index if not exists latest_setlist_songs_song_id_idx
+    on latest_setlist_songs (song_id, concert_id);
+
+create index if not exists latest_setlist_songs_concert_id_idx
+    on latest_setlist_songs (concert_id, song_order);
+
+-- Rebuilds the rows of the given concerts from their latest version
+create or replace function refresh_latest_setlist_songs(concert_ids integer[])
+returns void language sql as $$
+    delete from latest_setlist_songs
+    where concert_id = any(concert_ids);
+
+    insert into latest_setlist_songs (concert_id, song_id, song_order, version)
+    select cso.concert_id, cso.song_id, cso.song_order, cso.version
+    from concert_setlist_ordering as cso
+    where cso.concert_id = any(concert_ids)
+      and cso.version = (
+          select max(latest.version)
+          from concert_setlist_ordering as latest
+          where latest.concert_id = cso.concert_id);
+$$;
+
+create or replace function latest_setlist_songs_trigger()
+returns trigger language plpgsql as $$
+begin
+    if TG_OP in ('INSERT', 'UPDATE') then
+        perform refresh_latest_setlist_songs(
+            array(select distinct concert_id from new_rows));
+    end if;
+    if TG_OP in ('DELETE', 'UPDATE') then
+        perform refresh_latest_setlist_songs(
+            array(select distinct concert_id from old_rows));
+    end if;
+    return null;
+end
+$$;
+
+drop trigger if exists latest_setlist_songs_insert on concert_setlist_ordering;
+create trigger latest_setlist_songs_insert
+    after insert on concert_setlist_ordering
+    referencing new table as new_rows
+    for each statement execute function latest_setlist_songs_trigger();
+
+drop trigger if exists latest_setlist_songs_update on concert_setlist_ordering;
+create trigger latest_setlist_songs_update
+    after update on concert_setlist_ordering
+    referencing new table as new_rows old table as old_rows
+    for each statement execute function latest_setlist_songs_trigger();
+
+drop trigger if exists latest_setlist_songs_delete on concert_setlist_ordering;
+create trigger latest_setlist_songs_delete
+    after delete on concert_setlist_ordering
+    referencing old table as old_rows
+    for each statement execute function latest_setlist_songs_trigger();
+
+-- Backfill
+select refresh_latest_setlist_songs(
+    array(select distinct concert_id from concert_setlist_ordering));
+
+grant select on latest_setlist_songs to rage_read_only_rl;
@@ -0,0 +1,34 @@
+-- Version number for the tables the site keeps in memory (venues,
+-- locations, countries, cities and states). Any write to one of them
+-- bumps it, which tells the site to reload them.
+create table if not exists dimension_version (
+    id boolean primary key default true check (id),
+    version bigint not null default 0
+);
+
+insert into dimension_version (id, version) values (true, 0)
+on conflict (id) do nothing;
+
+create or replace function bump_dimension_version()
+returns trigger language plpgsql as $$
+begin
+    update dimension_version set version = version + 1;
+    return null;
+end
+$$;
+
+do $$
+declare
+    t text;
+begin
+    foreach t in array array['venues', 'locations', 'countries', 'cities', 'states'] loop
+        execute format('drop trigger if exists %I on %I', t || '_dimension_version', t);
+        execute format(
+            'create trigger %I after insert or update or delete or truncate on %I '
+            'for each statement execute function bump_dimension_version()',
+            t || '_dimension_version', t);
+    end loop;
+end
+$$;
+
+grant select on dimension_version to rage_read_only_rl;
@@ -0,0 +1,23 @@
+-- Full text search documents: one per song (title, lyrics, notes), one per
+-- concert (venue and place names, concert notes and the notes of its
+-- latest setlist) and one per recording of a concert (taper, lineage).
+-- Kept up to date with `flask refresh-search`.
+create table if not exists search_documents (
+    id bigserial primary key,
+    doc_type text not null,
+    artist_id integer not null,
+    concert_id integer references concerts (concert_id) on delete cascade,
+    song_id integer references songs (song_id) on delete cascade,
+    recording_id integer references recording (recording_id) on delete cascade,
+    title text not null,
+    body text,
+    document tsvector not null
+);
+
+create index if not exists search_documents_document_idx
+    on search_documents using gin (document);
+
+create index if not exists search_documents_concert_id_idx
+    on search_documents (concert_id);
+
+grant select on search_documents to rage_read_only_rl;
@@ -0,0 +1,15 @@
+-- The songs of each concert's latest setlist with their MinHash signature
+-- and the LSH band keys derived from it, for the "similar shows" panel.
+-- Built offline with `flask build-similar-shows`.
+create table if not exists setlist_minhash (
+    concert_id integer primary key references concerts (concert_id) on delete cascade,
+    artist_id integer not null references artists (artist_id),
+    song_ids integer[] not null,
+    signature integer[] not null,
+    band_keys bigint[] not null
+);
+
+create index if not exists setlist_minhash_artist_id_idx
+    on setlist_minhash (artist_id);
+
+grant select on setlist_minhash to rage_read_only_rl;
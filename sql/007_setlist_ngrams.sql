@@ -0,0 +1,103 @@
+-- Bigrams and trigrams of the songs in each concert's latest setlist, each
+-- with a sorted posting list of the concerts they were played at, for
+-- finding shows where songs were played back to back. Grams that start a
+-- setlist are also indexed with `opening` set, for finding shows that
+-- opened with a run of songs. Kept up to date along with
+-- latest_setlist_songs, one concert at a time.
+create table if not exists setlist_ngrams (
+    artist_id integer not null references artists (artist_id),
+    opening boolean not null,
+    ngram integer[] not null,
+    concert_ids integer[] not null,
+    primary key (artist_id, opening, ngram)
+);
+
+create index if not exists setlist_ngrams_concert_ids_idx
+    on setlist_ngrams using gin (concert_ids);
+
+-- Re-indexes the given concerts from latest_setlist_songs
+create or replace function refresh_setlist_ngrams(changed integer[])
+returns void language sql as $$
+    -- Drop posting lists that only have these concerts in them (both
+    -- this and the update below are answered from the gin index)...
+    delete from setlist_ngrams
+    where setlist_ngrams.concert_ids <@ changed;
+
+    -- ...take the concerts out of the rest...
+    update setlist_ngrams
+    set concert_ids = array(
+        select id from unnest(setlist_ngrams.concert_ids) as id
+        except
+        select unnest(changed)
+        order by 1)
+    where setlist_ngrams.concert_ids && changed;
+
+    -- ...and merge their current grams back in
+    with songs as (
+        select lss.concert_id,
+               c.artist_id,
+               row_number() over w as position,
+               array[lss.song_id,
+                     lead(lss.song_id, 1) over w] as bigram,
+               array[lss.song_id,
+                     lead(lss.song_id, 1) over w,
+                     lead(lss.song_id, 2) over w] as trigram
+        from latest_setlist_songs as lss
+          join concerts as c on lss.concert_id = c.concert_id
+        where lss.concert_id = any(changed)
+        window w as (partition by lss.concert_id order by lss.song_order)
+    ),
+    grams as (
+        select concert_id, artist_id, position, bigram as ngram
+        from songs
+        where array_position(bigram, null) is null
+        union all
+        select concert_id, artist_id, position, trigram
+        from songs
+        where array_position(trigram, null) is null
+    ),
+    postings as (
+        select artist_id, false as opening, ngram, concert_id
+        from grams
+        union all
+        select artist_id, true, ngram, concert_id
+        from grams
+        where position = 1
+    )
+    insert into setlist_ngrams (artist_id, opening, ngram, concert_ids)
+    select artist_id,
+           opening,
+           ngram,
+           array_agg(distinct concert_id order by concert_id)
+    from postings
+    group by artist_id, opening, ngram
+    on conflict (artist_id, opening, ngram) do update
+        set concert_ids = array(
+            select distinct id
+            from unnest(setlist_ngrams.concert_ids || excluded.concert_ids) as id
+            order by id);
+$$;
+
+-- Same as in 003, but also re-indexes the concerts' n-grams
+create or replace function refresh_latest_setlist_songs(concert_ids integer[])
+returns void language sql as $$
+    delete from latest_setlist_songs
+    where concert_id = any(concert_ids);
+
+    insert into latest_setlist_songs (concert_id, song_id, song_order, version)
+    select cso.concert_id, cso.song_id, cso.song_order, cso.version
+    from concert_setlist_ordering as cso
+    where cso.concert_id = any(concert_ids)
+      and cso.version = (
+          select max(latest.version)
+          from concert_setlist_ordering as latest
+          where latest.concert_id = cso.concert_id);
+
+    select refresh_setlist_ngrams(concert_ids);
+$$;
+
+-- Backfill
+select refresh_setlist_ngrams(
+    array(select distinct concert_id from latest_setlist_songs));
+
+grant select on setlist_ngrams to rage_read_only_rl;
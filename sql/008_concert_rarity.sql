@@ -0,0 +1,12 @@
+-- Precomputed rarity of every concert: the sum, over the distinct songs of
+-- its latest setlist, of one over the number of concerts the song was
+-- played at (see song_performance_counts). Stored on the concert itself so
+-- listings can show and sort by it without any extra joins. Kept up to
+-- date with `flask refresh-rarity`.
+alter table concerts
+    add column if not exists rarity_score double precision not null default 0;
+
+-- Listings sorted by rarity are ordered by (rarity_score, concert_id)
+-- descending for keyset pagination.
+create index if not exists concerts_artist_id_rarity_score_idx
+    on concerts (artist_id, rarity_score, concert_id);
@@ -0,0 +1,15 @@
+-- Older versions of each concert's setlist, delta encoded against the
+-- version the row was built from (normally the latest), so every version
+-- of a setlist can be shown from one small read. Concerts with a single
+-- version have no row. Kept up to date with `flask build-setlist-history`.
+create table if not exists setlist_history (
+    concert_id integer primary key references concerts (concert_id) on delete cascade,
+    base_version integer not null,
+    -- Version (as a string) to a list of {"copy": [start, end]} and
+    -- {"insert": [[song_id, notes], ...]} operations on the base version
+    deltas jsonb not null,
+    -- Songs older versions have that the base version doesn't
+    song_ids integer[] not null
+);
+
+grant select on setlist_history to rage_read_only_rl;
@@ -0,0 +1,10 @@
+-- Version of each artist's rows in setlist_minhash, bumped by
+-- `flask build-similar-shows` whenever it rebuilds any of them. The site
+-- reloads an artist's similar shows index when it changes, and the static
+-- build re-renders the artist's concert pages.
+create table if not exists setlist_minhash_versions (
+    artist_id integer primary key references artists (artist_id),
+    version bigint not null default 0
+);
+
+grant select on setlist_minhash_versions to rage_read_only_rl;
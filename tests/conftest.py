@@ -0,0 +1,21 @@
+""" Tests that use the `app` fixture run against a loaded benchmark database
+(see `bench/dataset.py`), named by the usual `PGDBNAME`/`PGUSER` environment
+variables, and are skipped if it can't be reached; the rest don't need one.
+Run them with `python -m pytest tests`.
+"""
+import psycopg2
+import pytest
+
+from live.app import create_app
+from live.database import get_dict_cursor
+
+
+@pytest.fixture(scope='module')
+def app():
+    app = create_app()
+    with app.app_context():
+        try:
+            get_dict_cursor()
+        except psycopg2.Error as e:
+            pytest.skip('no database to test against: %s' % (e,))
+    return app
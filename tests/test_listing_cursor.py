@@ -0,0 +1,63 @@
+""" Listing pages link to the next one with a cursor holding the keyset of
+the last concert shown.
+"""
+import collections
+import datetime
+
+import pytest
+
+from live.models.concert import (
+        LISTING_SORT_DATE,
+        LISTING_SORT_RARITY,
+        format_listing_cursor,
+        parse_listing_cursor)
+
+ListedConcert = collections.namedtuple(
+        'ListedConcert', ['concert_id', 'date', 'rarity'])
+
+
+@pytest.mark.parametrize('date', [
+    datetime.date(1987, 1, 9),
+    datetime.date(2000, 2, 29),
+    datetime.date(2024, 12, 31),
+])
+def test_date_cursor_round_trips(date):
+    cursor = format_listing_cursor(ListedConcert(42, date, 1.5))
+    assert parse_listing_cursor(cursor) == (date, 42)
+    assert parse_listing_cursor(cursor, LISTING_SORT_DATE) == (date, 42)
+
+
+@pytest.mark.parametrize('rarity', [
+    0.0, 1.5, 0.1 + 0.2, 1 / 3, 1e-20, 123456789.123456789, 1e20])
+def test_rarity_cursor_round_trips_exactly(rarity):
+    concert = ListedConcert(7, datetime.date(1990, 5, 1), rarity)
+    cursor = format_listing_cursor(concert, LISTING_SORT_RARITY)
+    assert parse_listing_cursor(cursor, LISTING_SORT_RARITY) == (rarity, 7)
+
+
+@pytest.mark.parametrize('cursor', [
+    None,
+    '',
+    '42',
+    '.42',
+    '1990-05-01',
+    '1990-05-01.',
+    '1990-13-01.42',
+    '1990-05-01.x',
+    '1.5.42',
+])
+def test_malformed_date_cursors(cursor):
+    assert parse_listing_cursor(cursor) is None
+
+
+@pytest.mark.parametrize('cursor', [
+    '',
+    'x.42',
+    '1990-05-01.42',
+    'nan.42',
+    'inf.42',
+    '-inf.42',
+    '1.5.x',
+])
+def test_malformed_rarity_cursors(cursor):
+    assert parse_listing_cursor(cursor, LISTING_SORT_RARITY) is None
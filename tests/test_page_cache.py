@@ -0,0 +1,37 @@
+""" Cached pages are keyed by the query arguments their view reads.
+"""
+from live.cache import (
+        cache_chunks,
+        page_cache)
+
+
+def test_unknown_arguments_share_an_entry(app):
+    app.config['PAGE_CACHE_ENABLED'] = True
+    page_cache.clear()
+    client = app.test_client()
+    try:
+        for junk in ('', '?x=1', '?x=2&y=3'):
+            response = client.get('/eras/rage/eras/era-1' + junk)
+            assert response.status_code == 200
+        assert page_cache.stats()['entries'] == 1
+        client.get('/eras/rage/eras/era-1?sort=rarity')
+        assert page_cache.stats()['entries'] == 2
+    finally:
+        page_cache.clear()
+
+
+def test_streamed_pages_are_cached_up_to_the_cap():
+    page_cache.clear()
+    max_streamed_bytes = page_cache.max_streamed_bytes
+    page_cache.max_streamed_bytes = 6
+    try:
+        chunks = list(cache_chunks('small', 200, [], ['abc', b'def']))
+        assert chunks == [b'abc', b'def']
+        assert page_cache.get('small') == (200, [], b'abcdef')
+
+        chunks = list(cache_chunks('big', 200, [], ['abc', 'def', 'g']))
+        assert chunks == [b'abc', b'def', b'g']
+        assert page_cache.get('big') is None
+    finally:
+        page_cache.max_streamed_bytes = max_streamed_bytes
+        page_cache.clear()
@@ -0,0 +1,29 @@
+""" Search pages are bounded, since every match before a page is ranked.
+"""
+from bench import dataset
+from live.views.search import MAX_PAGE
+
+# A word the benchmark dataset uses everywhere
+QUERY = dataset.WORDS[0]
+
+
+def test_pages_past_the_last_are_not_found(app):
+    app.config['PAGE_CACHE_ENABLED'] = False
+    client = app.test_client()
+    for page in (MAX_PAGE + 1, 99999999999999999999):
+        response = client.get('/search?q=%s&page=%s' % (QUERY, page))
+        assert response.status_code == 404, page
+
+
+def test_last_page_has_no_next_link(app):
+    app.config['PAGE_CACHE_ENABLED'] = False
+    page_size = app.config['SEARCH_PAGE_SIZE']
+    # So the query has matches past the last page
+    app.config['SEARCH_PAGE_SIZE'] = 1
+    try:
+        client = app.test_client()
+        response = client.get('/search?q=%s&page=%s' % (QUERY, MAX_PAGE))
+        assert response.status_code == 200
+        assert b'page=%d' % (MAX_PAGE + 1,) not in response.get_data()
+    finally:
+        app.config['SEARCH_PAGE_SIZE'] = page_size
@@ -0,0 +1,126 @@
+""" Sequence search without a database: the grams a sequence is looked up
+by, the intersection of their posting lists and the check of the setlists
+left over.
+"""
+from live.models import sequence
+from live.models.sequence import (
+        _played_in_sequence,
+        intersect_sorted,
+        ngrams_for_sequence)
+
+
+class FakeCursor:
+    """ Answers the setlist_ngrams and latest_setlist_songs queries of
+    #find_concert_ids from dictionaries.
+    """
+    def __init__(self, posting_lists, setlists):
+        self.posting_lists = posting_lists
+        self.setlists = setlists
+        self.gram_lookups = []
+        self._rows = []
+
+    def execute(self, query, params):
+        if 'setlist_ngrams' in query:
+            keys = [(opening, tuple(gram)) for opening, gram in params[1]]
+            self.gram_lookups.append(keys)
+            self._rows = [
+                {'opening': opening, 'ngram': list(gram),
+                 'concert_ids': self.posting_lists[(opening, gram)]}
+                for opening, gram in keys
+                if (opening, gram) in self.posting_lists]
+        else:
+            self._rows = [
+                {'concert_id': concert_id,
+                 'song_ids': self.setlists[concert_id]}
+                for concert_id in params[0]]
+
+    def fetchall(self):
+        return self._rows
+
+
+class FakeArtist:
+    artist_id = 1
+
+
+def test_short_sequences_are_a_single_gram():
+    assert ngrams_for_sequence([1, 2]) == [(1, 2)]
+    assert ngrams_for_sequence([1, 2, 3]) == [(1, 2, 3)]
+
+
+def test_long_sequences_are_their_trigrams():
+    assert ngrams_for_sequence([1, 2, 3, 4, 5]) == [
+        (1, 2, 3), (2, 3, 4), (3, 4, 5)]
+
+
+def test_repeated_songs_give_duplicate_grams():
+    assert ngrams_for_sequence([1, 2, 3, 1, 2, 3]) == [
+        (1, 2, 3), (2, 3, 1), (3, 1, 2), (1, 2, 3)]
+
+
+def test_intersect_sorted():
+    assert intersect_sorted([]) == []
+    assert intersect_sorted([[1, 3, 5]]) == [1, 3, 5]
+    assert intersect_sorted([[1, 2, 3, 5, 8, 13], [2, 3, 5, 7], [3, 5, 9]]) == [
+        3, 5]
+    assert intersect_sorted([[1, 2], [3, 4], [1, 2, 3, 4]]) == []
+    assert intersect_sorted([[5], [1, 2, 3]]) == []
+
+
+def test_intersect_sorted_leaves_its_arguments_alone():
+    posting_lists = [[1, 2, 3], [2]]
+    result = intersect_sorted(posting_lists)
+    result.append(4)
+    assert posting_lists == [[1, 2, 3], [2]]
+
+
+def test_played_in_sequence():
+    setlist = [7, 1, 2, 3, 9]
+    assert _played_in_sequence(setlist, [1, 2, 3], False)
+    assert _played_in_sequence(setlist, [3, 9], False)
+    assert not _played_in_sequence(setlist, [1, 3], False)
+    assert not _played_in_sequence(setlist, [9, 7], False)
+    assert not _played_in_sequence([1], [1, 2], False)
+
+
+def test_played_in_sequence_opening():
+    setlist = [7, 1, 2, 3, 9]
+    assert _played_in_sequence(setlist, [7, 1], True)
+    assert not _played_in_sequence(setlist, [1, 2], True)
+
+
+def test_only_the_first_gram_has_to_open():
+    cur = FakeCursor(
+        posting_lists={
+            (True, (1, 2, 3)): [10, 11],
+            (False, (2, 3, 4)): [10, 11, 12],
+        },
+        setlists={
+            10: [1, 2, 3, 4, 5],
+            # Has both trigrams, but not in a single run
+            11: [1, 2, 3, 8, 2, 3, 4],
+        })
+    assert sequence.find_concert_ids(
+        cur, FakeArtist(), [1, 2, 3, 4], opening=True) == [10]
+    assert cur.gram_lookups == [[(True, (1, 2, 3)), (False, (2, 3, 4))]]
+
+
+def test_repeated_grams_are_intersected_once():
+    cur = FakeCursor(
+        posting_lists={
+            (False, (1, 2, 1)): [10, 11],
+            (False, (2, 1, 2)): [10, 11],
+        },
+        setlists={
+            10: [1, 2, 1, 2, 1],
+            11: [1, 2, 1, 5, 2, 1, 2],
+        })
+    assert sequence.find_concert_ids(
+        cur, FakeArtist(), [1, 2, 1, 2, 1]) == [10]
+
+
+def test_unplayed_grams_find_nothing():
+    cur = FakeCursor(
+        posting_lists={(False, (1, 2, 3)): [10]},
+        setlists={10: [1, 2, 3]})
+    assert sequence.find_concert_ids(cur, FakeArtist(), [1, 2, 3, 4]) == []
+    assert sequence.find_concert_ids(cur, FakeArtist(), [1]) == []
@@ -0,0 +1,43 @@
+""" Older setlist versions are stored as deltas against the latest one.
+"""
+import json
+
+import pytest
+
+from live.models.setlist import (
+        apply_delta,
+        encode_delta)
+
+LATEST = [(1, None), (2, None), (3, 'acoustic'), (4, None), (5, None)]
+
+
+@pytest.mark.parametrize('target', [
+    LATEST,
+    [],
+    [(9, None)],
+    LATEST[:3],
+    LATEST[2:],
+    [(1, None), (2, None), (3, None), (4, None), (5, None)],
+    [(5, None), (4, None), (3, 'acoustic'), (2, None), (1, None)],
+    [(1, None), (6, 'with guests'), (2, None), (3, 'acoustic'), (5, None)],
+    LATEST + LATEST,
+])
+def test_round_trip(target):
+    delta = encode_delta(LATEST, target)
+    assert apply_delta(LATEST, delta) == target
+    # The delta is stored as JSON
+    assert apply_delta(LATEST, json.loads(json.dumps(delta))) == target
+
+
+def test_round_trip_from_an_empty_base():
+    assert apply_delta([], encode_delta([], LATEST)) == LATEST
+    assert apply_delta([], encode_delta([], [])) == []
+
+
+def test_unchanged_runs_are_copied():
+    target = [(1, None), (2, None), (6, None), (4, None), (5, None)]
+    assert encode_delta(LATEST, target) == [
+        {"copy": [0, 2]},
+        {"insert": [[6, None]]},
+        {"copy": [3, 5]}]
+    assert encode_delta(LATEST, LATEST[1:]) == [{"copy": [1, 5]}]
@@ -0,0 +1,87 @@
+""" Streamed pages hand their database connection over to the response,
+which has to give it back even if the body is never read.
+"""
+import pytest
+
+from live import instrumentation
+from live.database import (
+        get_dict_cursor,
+        get_pool_stats)
+
+# More requests than the pool has connections, so a leak shows up as a
+# failed request rather than only in the pool statistics
+REQUESTS_PER_ROUTE = 12
+
+
+@pytest.fixture(scope='module')
+def streamed_urls(app):
+    with app.app_context():
+        cur = get_dict_cursor()
+        cur.execute("""
+            select a.short_name, s.song_url
+            from songs as s
+              join artists as a on s.artist_id = a.artist_id
+            order by s.song_id
+            limit 1""")
+        row = cur.fetchone()
+    if row is None:
+        pytest.skip('the database has no songs')
+    return [
+        '/update-archive',
+        '/artists/%s/concerts' % (row.get('short_name'),),
+        '/artists/%s/songs/%s' % (row.get('short_name'), row.get('song_url')),
+    ]
+
+
+def in_use(app):
+    with app.app_context():
+        return get_pool_stats()['in_use']
+
+
+@pytest.mark.parametrize('page_cache', [False, True])
+def test_head_releases_connection(app, streamed_urls, page_cache):
+    app.config['PAGE_CACHE_ENABLED'] = page_cache
+    client = app.test_client()
+    for url in streamed_urls:
+        for _ in range(REQUESTS_PER_ROUTE):
+            response = client.head(url)
+            # What a WSGI server does once it's done with the response
+            response.close()
+            assert response.status_code == 200, url
+        assert in_use(app) == 0, url
+    assert client.get('/').status_code == 200
+
+
+def test_get_streams_whole_page(app, streamed_urls):
+    app.config['PAGE_CACHE_ENABLED'] = True
+    client = app.test_client()
+    for url in streamed_urls:
+        bodies = []
+        # The second request is served from the page cache
+        for _ in range(2):
+            response = client.get(url)
+            bodies.append(response.get_data())
+            response.close()
+            assert response.status_code == 200, url
+        assert bodies[0] == bodies[1], url
+        assert bodies[0].rstrip().endswith(b'</html>'), url
+        assert in_use(app) == 0, url
+
+
+def test_query_log_reported_on_close(app, streamed_urls):
+    app.config['PAGE_CACHE_ENABLED'] = False
+    app.config['SQL_INSTRUMENTATION'] = True
+    reported = []
+    instrumentation.add_listener(reported.append)
+    try:
+        client = app.test_client()
+        for url in streamed_urls:
+            del reported[:]
+            response = client.get(url)
+            response.get_data()
+            response.close()
+            assert response.status_code == 200, url
+            assert len(reported) == 1, url
+    finally:
+        instrumentation.remove_listener(reported.append)
+        app.config['SQL_INSTRUMENTATION'] = False